@@ -0,0 +1,345 @@
+"""
+Alinhamento de versos token a token, usado na colação (juntarversoescompleto).
+
+Os tokens comparáveis são convertidos em inteiros (Vocabulario) e pareados
+pela mesma regra do difflib.SequenceMatcher (maior bloco contíguo, depois
+os trechos dos lados), sem a heurística de "junk": para duas testemunhas,
+alinhar() dá o mesmo resultado que a implementação anterior com o
+SequenceMatcher (ver benchmark_alinhamento.py). A regra própria existe
+porque, com várias testemunhas, uma coluna aceita mais de uma grafia.
+
+Opcionalmente (aproximado=True), os blocos de substituição são refinados
+por uma distância de edição ponderada entre as grafias, para que
+variantes ortográficas próximas (ex.: "praya"/"praia") fiquem na mesma
+coluna. É uma opção de qualidade, bem mais lenta que o pareamento exato.
+
+Para mais de duas testemunhas, alinhar_testemunhas() monta uma tabela de
+colunas: cada testemunha é alinhada uma única vez à base, com o mesmo
+resultado de alinhar() (e da colação par a par), e as inserções de
+testemunhas diferentes no mesmo ponto da base são mescladas entre si,
+numa coluna que aceita todas as grafias já vistas nela. O custo cresce
+linearmente com o número de testemunhas, e duas testemunhas que
+concordam contra a base caem na mesma coluna.
+
+Uso como biblioteca:
+
+    from alinhador import alinhar, alinhar_testemunhas
+    aligned, inserts = alinhar(base_comparable, target_comparable, target_tokens)
+    colunas = alinhar_testemunhas([base_comparable, outra, mais_outra])
+"""
+from functools import lru_cache
+
+# custo de deixar um token sem par no refinamento aproximado; acima de 0.5
+# para que dois tokens diferentes ainda prefiram ficar na mesma coluna
+CUSTO_LACUNA = 0.55
+
+
+class Vocabulario:
+    """Atribui um inteiro a cada token distinto; comparações viram int == int."""
+
+    def __init__(self):
+        self.ids = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def codificar(self, tokens):
+        ids = self.ids
+        try:
+            return [ids[token] for token in tokens]
+        except KeyError:
+            return [ids.setdefault(token, len(ids)) for token in tokens]
+
+
+# vocabulário compartilhado pelas chamadas do mesmo processo
+VOCABULARIO = Vocabulario()
+
+
+def _blocos_comuns(candidatos, alo, ahi, blo, bhi, pares):
+    """
+    Acrescenta a `pares` os (i, j) dos blocos comuns entre as posições
+    [alo, ahi) de um lado e [blo, bhi) do outro, pela mesma regra do
+    SequenceMatcher: o maior bloco contíguo (o primeiro, em caso de
+    empate) e, recursivamente, os trechos à esquerda e à direita dele.
+    candidatos[i] é a lista crescente das posições j que casam com i.
+    """
+    melhor_i, melhor_j, tamanho = alo, blo, 0
+    tamanhos = {}
+    for i in range(alo, ahi):
+        novos = {}
+        for j in candidatos[i]:
+            if j < blo:
+                continue
+            if j >= bhi:
+                break
+            k = novos[j] = tamanhos.get(j - 1, 0) + 1
+            if k > tamanho:
+                melhor_i, melhor_j, tamanho = i - k + 1, j - k + 1, k
+        tamanhos = novos
+    if not tamanho:
+        return
+    _blocos_comuns(candidatos, alo, melhor_i, blo, melhor_j, pares)
+    pares += [(melhor_i + k, melhor_j + k) for k in range(tamanho)]
+    _blocos_comuns(candidatos, melhor_i + tamanho, ahi, melhor_j + tamanho, bhi, pares)
+
+
+def emparelhar(a, b):
+    """
+    Pares (i, j), em ordem, dos tokens iguais entre as sequências a e b,
+    os mesmos de SequenceMatcher(None, a, b, autojunk=False).
+    """
+    n, m = len(a), len(b)
+    if a == b:
+        return [(i, i) for i in range(n)]
+
+    posicoes = {}
+    for j, x in enumerate(b):
+        posicoes.setdefault(x, []).append(j)
+    pares = []
+    _blocos_comuns([posicoes.get(x, ()) for x in a], 0, n, 0, m, pares)
+    return pares
+
+
+def opcodes(a, b):
+    """
+    Lista de (tag, i1, i2, j1, j2) no formato de SequenceMatcher.get_opcodes(),
+    com tag em 'equal', 'replace', 'delete' e 'insert'.
+    """
+    n, m = len(a), len(b)
+    resultado = []
+    i = j = 0
+    inicio_igual = None
+    for pi, pj in emparelhar(a, b) + [(n, m)]:
+        if pi > i or pj > j:
+            if inicio_igual is not None:
+                resultado.append(("equal", inicio_igual[0], i, inicio_igual[1], j))
+                inicio_igual = None
+            if pi > i and pj > j:
+                resultado.append(("replace", i, pi, j, pj))
+            elif pi > i:
+                resultado.append(("delete", i, pi, j, j))
+            else:
+                resultado.append(("insert", i, i, j, pj))
+        if inicio_igual is None:
+            inicio_igual = (pi, pj)
+        i, j = pi + 1, pj + 1
+    if inicio_igual is not None and inicio_igual[0] < n:
+        resultado.append(("equal", inicio_igual[0], n, inicio_igual[1], m))
+    return resultado
+
+
+@lru_cache(maxsize=65536)
+def distancia(a, b):
+    """Distância de Levenshtein entre duas grafias, normalizada em [0, 1]."""
+    if a == b:
+        return 0.0
+    if not a or not b:
+        return 1.0
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, start=1):
+        atual = [i]
+        for j, cb in enumerate(b, start=1):
+            atual.append(min(
+                anterior[j] + 1,
+                atual[j - 1] + 1,
+                anterior[j - 1] + (ca != cb),
+            ))
+        anterior = atual
+    return anterior[-1] / max(len(a), len(b))
+
+
+def _alinhar_bloco(base, alvo):
+    """
+    Alinha um bloco de substituição por distância de edição ponderada.
+    Retorna pares (i, j), com None do lado que fica sem par.
+    """
+    n, m = len(base), len(alvo)
+    custo = [[0.0] * (m + 1) for _ in range(n + 1)]
+    # passo escolhido em cada célula: 0 = par, 1 = sobra na base, 2 = sobra no alvo
+    passo = [[0] * (m + 1) for _ in range(n + 1)]
+    for i in range(1, n + 1):
+        custo[i][0] = i * CUSTO_LACUNA
+        passo[i][0] = 1
+    for j in range(1, m + 1):
+        custo[0][j] = j * CUSTO_LACUNA
+        passo[0][j] = 2
+    for i in range(1, n + 1):
+        for j in range(1, m + 1):
+            custo[i][j], passo[i][j] = min(
+                (custo[i - 1][j - 1] + distancia(base[i - 1], alvo[j - 1]), 0),
+                (custo[i - 1][j] + CUSTO_LACUNA, 1),
+                (custo[i][j - 1] + CUSTO_LACUNA, 2),
+            )
+
+    pares = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        if passo[i][j] == 0:
+            i, j = i - 1, j - 1
+            pares.append((i, j))
+        elif passo[i][j] == 1:
+            i -= 1
+            pares.append((i, None))
+        else:
+            j -= 1
+            pares.append((None, j))
+    pares.reverse()
+    return pares
+
+
+def _alinhar_aproximado(base_comparable, target_comparable, target_tokens,
+                        i1, i2, j1, j2, aligned, inserts):
+    """Preenche aligned/inserts para o bloco de substituição base[i1:i2] × alvo[j1:j2]."""
+    pendentes = []
+    proximo_base = i1
+    for pi, pj in _alinhar_bloco(base_comparable[i1:i2], target_comparable[j1:j2]):
+        if pj is None:
+            if pendentes:
+                inserts.append((i1 + pi, pendentes))
+                pendentes = []
+            proximo_base = i1 + pi + 1
+            continue
+        if pi is None:
+            pendentes.append(target_tokens[j1 + pj])
+            continue
+        if pendentes:
+            inserts.append((i1 + pi, pendentes))
+            pendentes = []
+        aligned[i1 + pi] = target_tokens[j1 + pj]
+        proximo_base = i1 + pi + 1
+    if pendentes:
+        inserts.append((proximo_base, pendentes))
+
+
+def alinhar(base_comparable, target_comparable, target_tokens, aproximado=False, vocabulario=VOCABULARIO):
+    """
+    Alinha a versão alvo à base. Retorna (aligned, inserts):
+    aligned[i] é o token do alvo na coluna do token i da base (ou None) e
+    inserts é uma lista de (i, [tokens]) a inserir antes do token i da base.
+
+    Com aproximado=True, blocos de substituição de tamanhos diferentes são
+    alinhados pela semelhança das grafias; sem ele, os tokens são pareados
+    em ordem e os que sobram no alvo viram inserção no fim do bloco.
+    """
+    a = vocabulario.codificar(base_comparable)
+    b = vocabulario.codificar(target_comparable)
+    n, m = len(a), len(b)
+
+    if a == b:
+        return list(target_tokens), []
+
+    aligned = [None] * n
+    inserts = []
+
+    i = j = 0
+    for pi, pj in emparelhar(a, b) + [(n, m)]:
+        if pj > j:
+            if pi == i:
+                inserts.append((i, target_tokens[j:pj]))
+            elif aproximado and (pi - i) != (pj - j):
+                _alinhar_aproximado(base_comparable, target_comparable, target_tokens,
+                                    i, pi, j, pj, aligned, inserts)
+            else:
+                # pareados em ordem; o que sobra no alvo entra no fim do bloco
+                comum = min(pi - i, pj - j)
+                aligned[i:i + comum] = target_tokens[j:j + comum]
+                if pj - j > comum:
+                    inserts.append((pi, target_tokens[j + comum:pj]))
+        if pi < n:
+            aligned[pi] = target_tokens[pj]
+        i, j = pi + 1, pj + 1
+
+    return aligned, inserts
+
+
+def _parear_lacuna(rotulos, tokens, aproximado):
+    """
+    Pares (coluna, token) para um trecho sem correspondência exata, com
+    None do lado que fica sem par. Sem aproximado, pareia em ordem e põe
+    os tokens que sobram depois das colunas, como em alinhar().
+    """
+    if aproximado and rotulos and len(rotulos) != len(tokens):
+        return _alinhar_bloco(rotulos, tokens)
+    comum = min(len(rotulos), len(tokens))
+    pares = [(k, k) for k in range(comum)]
+    pares += [(k, None) for k in range(comum, len(rotulos))]
+    pares += [(None, k) for k in range(comum, len(tokens))]
+    return pares
+
+
+def _mesclar_insercao(lacuna, indices, ids, tokens, k, total, aproximado):
+    """
+    Junta à `lacuna` (as colunas de inserção num mesmo ponto da base, em
+    ordem) os tokens `indices` da testemunha k. Cada item da lacuna é
+    (coluna, formas, rótulo): a coluna casa com qualquer das formas já
+    vistas nela e o rótulo é a grafia usada no pareamento aproximado. Os
+    tokens sem par viram colunas novas, na ordem da testemunha.
+    """
+    posicoes = {}
+    for p, t in enumerate(indices):
+        posicoes.setdefault(ids[t], []).append(p)
+    candidatos = [sorted(p for forma in formas for p in posicoes.get(forma, ())) for _, formas, _ in lacuna]
+    pares = []
+    _blocos_comuns(candidatos, 0, len(lacuna), 0, len(indices), pares)
+
+    nova = []
+    c = i = 0
+    for pc, pi in pares + [(len(lacuna), len(indices))]:
+        trecho = [(None if dc is None else c + dc, dt) for dc, dt in _parear_lacuna(
+            [rotulo for _, _, rotulo in lacuna[c:pc]], [tokens[t] for t in indices[i:pi]], aproximado)]
+        if pc < len(lacuna):
+            trecho.append((pc, pi - i))
+        for dc, dt in trecho:
+            t = None if dt is None else indices[i + dt]
+            if dc is None:
+                coluna = [None] * total
+                coluna[k] = t
+                nova.append((coluna, {ids[t]}, tokens[t]))
+                continue
+            coluna, formas, rotulo = lacuna[dc]
+            if t is not None:
+                coluna[k] = t
+                formas.add(ids[t])
+            nova.append((coluna, formas, rotulo))
+        c, i = pc + 1, pi + 1
+    lacuna[:] = nova
+
+
+def alinhar_testemunhas(comparaveis, aproximado=False, vocabulario=VOCABULARIO):
+    """
+    Alinha N testemunhas de um verso; a primeira é a base. `comparaveis`
+    tem, para cada testemunha, a lista de tokens comparáveis (ou None,
+    se ela não tem o trecho). Retorna a lista de colunas, em ordem: cada
+    coluna tem, para cada testemunha, o índice do token dela ou None.
+
+    Cada testemunha é alinhada à base por alinhar(), com o mesmo
+    resultado do alinhamento par a par; só as inserções de testemunhas
+    diferentes no mesmo ponto da base são mescladas entre si.
+    """
+    total = len(comparaveis)
+    base = comparaveis[0] or []
+    n = len(base)
+
+    colunas = [[i] + [None] * (total - 1) for i in range(n)]
+    # lacunas[i]: colunas de inserção antes do token i da base (i == n: fim do verso)
+    lacunas = [[] for _ in range(n + 1)]
+
+    for k in range(1, total):
+        tokens = comparaveis[k]
+        if not tokens:
+            continue
+        aligned, inserts = alinhar(base, tokens, range(len(tokens)), aproximado, vocabulario)
+        for i, t in enumerate(aligned):
+            if t is not None:
+                colunas[i][k] = t
+        if inserts:
+            ids = vocabulario.codificar(tokens)
+            for i, indices in inserts:
+                _mesclar_insercao(lacunas[i], indices, ids, tokens, k, total, aproximado)
+
+    resultado = []
+    for i in range(n + 1):
+        resultado += [coluna for coluna, _, _ in lacunas[i]]
+        if i < n:
+            resultado.append(colunas[i])
+    return resultado
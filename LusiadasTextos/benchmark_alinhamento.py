@@ -0,0 +1,110 @@
+"""
+Compara o alinhador com a implementação anterior baseada em
+difflib.SequenceMatcher, sobre os versos reais das testemunhas: tempo,
+tokens pareados e concordância (o modo exato deve concordar em 100%).
+O modo aproximado entra só como referência de custo; ele muda o
+pareamento de propósito e não é uma opção de desempenho.
+
+    python benchmark_alinhamento.py --repeticoes 5
+"""
+import argparse
+import time
+from difflib import SequenceMatcher
+
+import leitor_tei
+from alinhador import alinhar
+from juntarversoescompleto import TEI_NAMESPACE, preprocess_old_version_l
+
+
+def alinhar_difflib(base_comparable, target_comparable, target_tokens):
+    """Implementação anterior de _align_target_to_base, como referência."""
+    matcher = SequenceMatcher(None, base_comparable, target_comparable)
+
+    aligned_target = [None] * len(base_comparable)
+    insertions_before_base_idx = []
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            for k in range(i2 - i1):
+                aligned_target[i1 + k] = target_tokens[j1 + k]
+        elif tag == 'replace':
+            len_base_block = i2 - i1
+            len_target_block = j2 - j1
+            for k in range(len_base_block):
+                if k < len_target_block:
+                    aligned_target[i1 + k] = target_tokens[j1 + k]
+            if len_target_block > len_base_block:
+                insertions_before_base_idx.append((i2, target_tokens[j1 + len_base_block:j2]))
+        elif tag == 'insert':
+            insertions_before_base_idx.append((i1, target_tokens[j1:j2]))
+
+    return aligned_target, insertions_before_base_idx
+
+
+def _versos_por_canto(path):
+    """{canto: [[tokens comparáveis de cada verso] de cada estrofe]}."""
+    namespaces = {'tei': TEI_NAMESPACE}
+    cantos = {}
+    for registro in leitor_tei.iterar_estrofes(path):
+        versos = [
+            [t.comparavel for t in preprocess_old_version_l(l)]
+            for l in registro.elemento.xpath('./tei:l', namespaces=namespaces)
+        ]
+        cantos.setdefault(registro.canto, []).append(versos)
+    return cantos
+
+
+def pares_de_versos(base_path, alvo_path):
+    """(tokens comparáveis da base, do alvo) para cada verso presente nas duas."""
+    cantos_base = _versos_por_canto(base_path)
+    cantos_alvo = _versos_por_canto(alvo_path)
+
+    pares = []
+    for n, estrofes_base in cantos_base.items():
+        for versos_base, versos_alvo in zip(estrofes_base, cantos_alvo.get(n, [])):
+            pares += zip(versos_base, versos_alvo)
+    return pares
+
+
+def medir(funcao, pares, repeticoes):
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultados = [funcao(base, alvo, alvo) for base, alvo in pares]
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultados
+
+
+def pareados(resultados):
+    return sum(sum(t is not None for t in aligned) for aligned, _ in resultados)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark do alinhamento de versos.")
+    arg_parser.add_argument("--base", default='LusiadasModernizado.xml')
+    arg_parser.add_argument("--alvos", nargs="+", default=['LusiadasDireita.xml', 'LusiadasEsquerda.xml'])
+    arg_parser.add_argument("--repeticoes", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    pares = []
+    for alvo_path in args.alvos:
+        pares += pares_de_versos(args.base, alvo_path)
+    print(f"{len(pares)} pares de versos")
+
+    motores = {
+        'difflib (anterior)': alinhar_difflib,
+        'alinhador': alinhar,
+        'aproximado (qualid.)': lambda a, b, t: alinhar(a, b, t, aproximado=True),
+    }
+
+    referencia = None
+    for nome, funcao in motores.items():
+        tempo, resultados = medir(funcao, pares, args.repeticoes)
+        if referencia is None:
+            referencia = (tempo, resultados)
+        iguais = sum(r == ref for r, ref in zip(resultados, referencia[1]))
+        print(
+            f"{nome:20} {tempo * 1000:8.1f} ms  {referencia[0] / tempo:5.2f}x  "
+            f"tokens pareados {pareados(resultados):6}  "
+            f"iguais à referência {iguais / len(pares):6.1%}"
+        )
@@ -0,0 +1,348 @@
+"""
+Benchmark da colação (juntarversoescompleto) em escala, sobre versões
+sintéticas geradas a partir dos XML reais: os cantos repetidos `escala`
+vezes, versões extras derivadas das antigas e grafias mais ruidosas.
+
+Cada etapa é medida em separado (melhor tempo das repetições e pico de
+memória do tracemalloc numa execução à parte; ele só vê as alocações do
+Python, não as árvores da libxml2) e o resultado vai para um JSON, para
+comparar commits:
+
+    python benchmark_colacao.py --escalas 1 2 --testemunhas 2 4 --json antes.json
+    python benchmark_colacao.py --escalas 1 2 --testemunhas 2 4 --json depois.json
+    python benchmark_colacao.py --comparar antes.json depois.json
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from lxml import etree
+
+import escritor_tei
+from alinhador import alinhar_testemunhas
+from juntarversoescompleto import (
+    TEI_NAMESPACE, _tarefas, collate_line, collate_witnesses, preprocess_modern_l, preprocess_old_version_l,
+)
+
+NS = {'tei': TEI_NAMESPACE}
+
+# --- Versões sintéticas ---
+
+# trocas de grafia comuns nas edições antigas (e o inverso)
+_TROCAS = [('u', 'v'), ('v', 'u'), ('i', 'y'), ('y', 'i'), ('f', 'ph'), ('s', 'ss'),
+           ('ão', 'am'), ('ç', 'c'), ('e', 'ee'), ('l', 'll')]
+_PALAVRA = re.compile(r"[^\W\d_]+")
+
+
+def _variar(palavra, rng):
+    """Uma variação de grafia; às vezes a palavra some ou se repete (inserções)."""
+    sorteio = rng.random()
+    if sorteio < 0.1:
+        return ''
+    if sorteio < 0.2:
+        return f"{palavra} {palavra}"
+    trocas = [(de, para) for de, para in _TROCAS if de in palavra]
+    if not trocas:
+        return palavra.upper() if len(palavra) < 3 else palavra[:-1]
+    de, para = rng.choice(trocas)
+    return palavra.replace(de, para, 1)
+
+
+def _ruidoso(texto, rng, taxa):
+    if not texto or taxa <= 0:
+        return texto
+    return _PALAVRA.sub(lambda m: _variar(m.group(), rng) if rng.random() < taxa else m.group(), texto)
+
+
+def _tokenizar_base(l_elem):
+    """Troca o texto de um <l> sem etiquetas por <w>/<pc>, como os do etiquetador."""
+    tokens = preprocess_old_version_l(l_elem)
+    for filho in list(l_elem):
+        l_elem.remove(filho)
+    l_elem.text = None
+    anterior = None
+    for token in tokens:
+        if anterior is not None and token.tag == 'w':
+            anterior.tail = ' '
+        attrib = {'pos': 'PUNCT'} if token.tag == 'pc' else {'lemma': token.comparavel, 'pos': 'X'}
+        anterior = etree.SubElement(l_elem, '{'+TEI_NAMESPACE+'}' + token.tag, attrib)
+        anterior.text = token.texto
+
+
+def gerar_versao(origem, destino, escala, n_cantos, rng=None, taxa=0.0, tokenizar=False):
+    """
+    Grava em `destino` a versão `origem` com os cantos repetidos `escala`
+    vezes (renumerados pela posição, de n_cantos em n_cantos, para
+    casarem com os da base), o texto dos versos com ruído `taxa` e, com
+    `tokenizar`, os versos da base em <w>/<pc>.
+    """
+    arvore = etree.parse(origem, etree.XMLParser(remove_blank_text=True))
+    cantos = arvore.xpath('//tei:div[@type="canto"]', namespaces=NS)
+    if not cantos:
+        raise ValueError(f"Nenhum canto em '{origem}'.")
+
+    for posicao, canto in enumerate(cantos, start=1):
+        canto.set('n', str(posicao))
+    ultimo = cantos[-1]
+    for r in range(1, escala):
+        for posicao, canto in enumerate(cantos, start=1):
+            copia = copy.deepcopy(canto)
+            copia.set('n', str(posicao + r * n_cantos))
+            ultimo.addnext(copia)
+            ultimo = copia
+
+    for l_elem in arvore.iterfind('.//tei:lg[@type="estrofe"]/tei:l', NS):
+        if tokenizar and l_elem.find('tei:w', NS) is None:
+            _tokenizar_base(l_elem)
+        elif rng is not None:
+            l_elem.text = _ruidoso(l_elem.text, rng, taxa)
+            for filho in l_elem:
+                filho.tail = _ruidoso(filho.tail, rng, taxa)
+
+    arvore.write(destino, encoding='utf-8', xml_declaration=True)
+
+
+def gerar_cenario(base, antigas, pasta, escala, testemunhas, taxa, semente):
+    """
+    Gera a base e `testemunhas` versões antigas em `pasta` e retorna
+    (caminho da base, {id: caminho}). As primeiras são as versões reais
+    (sem ruído); as demais, derivadas delas em rodízio, com ruído `taxa`.
+    """
+    n_cantos = len(etree.parse(base).xpath('//tei:div[@type="canto"]', namespaces=NS))
+    caminho_base = os.path.join(pasta, 'base.xml')
+    gerar_versao(base, caminho_base, escala, n_cantos, tokenizar=True)
+
+    versoes = {}
+    ids_reais = list(antigas)
+    for k in range(testemunhas):
+        wit_id = ids_reais[k] if k < len(ids_reais) else f"VSint{k + 1}"
+        origem = antigas[ids_reais[k % len(ids_reais)]]
+        caminho = os.path.join(pasta, f"{wit_id}.xml")
+        rng = random.Random(f"{semente}-{k}") if k >= len(ids_reais) else None
+        gerar_versao(origem, caminho, escala, n_cantos, rng, taxa)
+        versoes[wit_id] = caminho
+    return caminho_base, versoes
+
+
+# --- Etapas ---
+# Cada etapa recebe a saída da anterior; as contas seguem collate_stanza.
+
+def etapa_leitura(paths):
+    """iterparse das versões e serialização das estrofes (juntarversoescompleto._tarefas)."""
+    wit_ids = {wit_key: '#' + wit_key for wit_key in paths}
+    return [tarefa for _, tarefa in _tarefas(paths, wit_ids, None)]
+
+
+def etapa_parse(tarefas):
+    """etree.fromstring de cada estrofe, como nos processos do pool."""
+    parser = etree.XMLParser(remove_blank_text=True)
+    return [
+        (estrofe_n, [etree.fromstring(xml, parser) if isinstance(xml, bytes) else xml for xml in xml_estrofes], wit_ids)
+        for estrofe_n, xml_estrofes, wit_ids in tarefas
+    ]
+
+
+def etapa_preprocess(estrofes):
+    """preprocess_modern_l / preprocess_old_version_l de todos os versos."""
+    resultado = []
+    for estrofe_n, lgs, wit_ids in estrofes:
+        versos = [lg.findall('tei:l', NS) if lg is not None and lg is not False else [] for lg in lgs]
+        linhas = []
+        for j in range(max(len(v) for v in versos)):
+            tokens_por_versao = []
+            for k, (lg, versos_k) in enumerate(zip(lgs, versos)):
+                if lg is False:
+                    tokens_por_versao.append(None)
+                elif j >= len(versos_k):
+                    tokens_por_versao.append([])
+                elif k == 0:
+                    tokens_por_versao.append(preprocess_modern_l(versos_k[j]))
+                else:
+                    tokens_por_versao.append(preprocess_old_version_l(versos_k[j]))
+            linhas.append(tokens_por_versao)
+        resultado.append((estrofe_n, linhas, wit_ids))
+    return resultado
+
+
+def etapa_alinhamento(estrofes):
+    """alinhador.alinhar_testemunhas de cada verso (sucessor de _align_target_to_base)."""
+    for _, linhas, _ in estrofes:
+        for tokens_por_versao in linhas:
+            alinhar_testemunhas([
+                None if tokens is None else [t.comparavel for t in tokens] for tokens in tokens_por_versao
+            ])
+    return estrofes
+
+
+def etapa_collate_line(estrofes):
+    """collate_line de cada verso (inclui o alinhamento), montando os <lg>."""
+    lgs = []
+    for estrofe_n, linhas, wit_ids in estrofes:
+        lg = etree.Element('{'+TEI_NAMESPACE+'}lg', type='estrofe', n=estrofe_n, nsmap={'tei': TEI_NAMESPACE})
+        for tokens_por_versao in linhas:
+            lg.append(collate_line(tokens_por_versao, wit_ids))
+        lgs.append(lg)
+    return lgs
+
+
+def etapa_serializacao(lgs):
+    """Gravação dos <lg> com escritor_tei, num arquivo temporário."""
+    with tempfile.TemporaryFile() as saida:
+        with escritor_tei.documento(saida, '{'+TEI_NAMESPACE+'}TEI', nsmap=NS) as escrita:
+            for lg in lgs:
+                escritor_tei.escrever(escrita, lg, 1)
+        return saida.tell()
+
+
+ETAPAS = [
+    ('leitura', etapa_leitura),
+    ('parse', etapa_parse),
+    ('preprocess', etapa_preprocess),
+    ('alinhamento', etapa_alinhamento),
+    ('collate_line', etapa_collate_line),
+    ('serializacao', etapa_serializacao),
+]
+
+
+def medir(funcao, entrada, repeticoes, memoria=True):
+    """(saída, {'segundos': melhor tempo, 'pico_mb': pico do tracemalloc numa execução à parte})."""
+    melhor = float('inf')
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        saida = funcao(entrada)
+        melhor = min(melhor, time.perf_counter() - inicio)
+
+    medida = {'segundos': round(melhor, 4)}
+    if memoria:
+        tracemalloc.start()
+        try:
+            funcao(entrada)
+            medida['pico_mb'] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+        finally:
+            tracemalloc.stop()
+    return saida, medida
+
+
+def rodar_cenario(base, versoes, repeticoes, memoria, processos):
+    paths = {'VMod': base, **versoes}
+    etapas = {}
+    entrada = paths
+    for nome, funcao in ETAPAS:
+        entrada, etapas[nome] = medir(funcao, entrada, repeticoes, memoria)
+        if nome == 'parse':
+            parseadas = entrada
+        elif nome == 'preprocess':
+            linhas = entrada
+
+    def total(_):
+        with tempfile.TemporaryFile() as saida:
+            collate_witnesses(base, versoes, saida, processos=processos)
+    _, etapas['total'] = medir(total, None, repeticoes, memoria)
+
+    contagens = {
+        'estrofes': len(parseadas),
+        'versos': sum(len(l) for _, l, _ in linhas),
+        'tokens': sum(len(t) for _, l, _ in linhas for tpv in l for t in tpv if t is not None),
+        'bytes_entrada': sum(os.path.getsize(p) for p in paths.values()),
+    }
+    return contagens, etapas
+
+
+def _versao_codigo():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'lxml': etree.__version__}
+
+
+def comparar(antes_path, depois_path):
+    """Razão depois/antes do tempo e do pico de cada etapa, por cenário."""
+    with open(antes_path, encoding='utf-8') as f:
+        antes = json.load(f)
+    with open(depois_path, encoding='utf-8') as f:
+        depois = json.load(f)
+    print(f"{antes['versao']['commit']} -> {depois['versao']['commit']}")
+
+    chave = lambda c: (c['escala'], c['testemunhas'], c['ruido'])
+    cenarios_antes = {chave(c): c for c in antes['cenarios']}
+    for cenario in depois['cenarios']:
+        anterior = cenarios_antes.get(chave(cenario))
+        if anterior is None:
+            continue
+        print(f"escala {cenario['escala']}, {cenario['testemunhas']} versões, ruído {cenario['ruido']}:")
+        for nome, medida in cenario['etapas'].items():
+            medida_antes = anterior['etapas'].get(nome)
+            if medida_antes is None:
+                continue
+            linha = (f"  {nome:13} {medida_antes['segundos']:8.3f}s -> {medida['segundos']:8.3f}s "
+                     f"({medida['segundos'] / medida_antes['segundos']:5.2f}x)")
+            if 'pico_mb' in medida and 'pico_mb' in medida_antes:
+                linha += f"  pico {medida_antes['pico_mb']:7.1f} -> {medida['pico_mb']:7.1f} MB"
+            print(linha)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark da colação sobre versões sintéticas em escala.")
+    arg_parser.add_argument("--base", default='LusiadasModernizado.xml',
+                            help="Versão base; sem <w>/<pc>, os versos são tokenizados na geração.")
+    arg_parser.add_argument("--antigas", nargs="+", default=['VEsq=LusiadasEsquerda.xml', 'VDir=LusiadasDireita.xml'],
+                            metavar="ID=ARQUIVO")
+    arg_parser.add_argument("--escalas", nargs="+", type=int, default=[1], help="Repetições dos cantos.")
+    arg_parser.add_argument("--testemunhas", nargs="+", type=int, default=[2],
+                            help="Versões antigas por cenário; as que passam das reais são sintéticas.")
+    arg_parser.add_argument("--ruido", type=float, default=0.15,
+                            help="Fração das palavras com grafia alterada nas versões sintéticas.")
+    arg_parser.add_argument("--semente", default='lusiadas')
+    arg_parser.add_argument("--repeticoes", type=int, default=1)
+    arg_parser.add_argument("--processos", type=int, default=0, help="Processos da etapa 'total' (0 = sem pool).")
+    arg_parser.add_argument("--sem-memoria", action="store_true", help="Não mede os picos com tracemalloc.")
+    arg_parser.add_argument("--json", help="Arquivo onde gravar os resultados.")
+    arg_parser.add_argument("--comparar", nargs=2, metavar=("ANTES", "DEPOIS"),
+                            help="Compara dois JSON gravados com --json e sai.")
+    args = arg_parser.parse_args()
+
+    if args.comparar:
+        comparar(*args.comparar)
+        sys.exit(0)
+
+    antigas = dict(item.split('=', 1) for item in args.antigas)
+    resultado = {
+        'versao': _versao_codigo(),
+        'data': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'parametros': {'base': args.base, 'antigas': antigas, 'repeticoes': args.repeticoes,
+                       'processos': args.processos, 'semente': args.semente},
+        'cenarios': [],
+    }
+
+    for escala in args.escalas:
+        for testemunhas in args.testemunhas:
+            with tempfile.TemporaryDirectory() as pasta:
+                base, versoes = gerar_cenario(args.base, antigas, pasta, escala, testemunhas, args.ruido,
+                                              args.semente)
+                contagens, etapas = rodar_cenario(base, versoes, args.repeticoes, not args.sem_memoria,
+                                                  args.processos)
+            resultado['cenarios'].append(
+                {'escala': escala, 'testemunhas': testemunhas, 'ruido': args.ruido, **contagens, 'etapas': etapas}
+            )
+            print(f"escala {escala}, {testemunhas} versões: {contagens['estrofes']} estrofes, "
+                  f"{contagens['tokens']} tokens")
+            for nome, medida in etapas.items():
+                pico = f"  pico {medida['pico_mb']:7.1f} MB" if 'pico_mb' in medida else ''
+                print(f"  {nome:13} {medida['segundos']:8.3f}s{pico}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"Resultados gravados em '{args.json}'.")
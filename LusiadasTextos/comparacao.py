@@ -1,60 +1,301 @@
 # Código gerado pelo ChatGPT para comparar duas versões do texto dos Lusíadas.
+# Reescrito para comparar qualquer conjunto de versões: similaridade e
+# script de edição por caractere para cada verso, em lotes distribuídos
+# num pool de processos e gravados em CSV/JSON à medida que ficam prontos.
 
-import xml.etree.ElementTree as ET
-import re
+import argparse
 import csv
+import json
+import re
+import sys
+import unicodedata
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+from itertools import combinations
+from pathlib import Path
+
+import leitor_tei
+
+LOTE = 256    # versos por viagem ao pool
+JANELA = 64   # lotes no máximo entre o envio e a gravação
+
+CAMPOS = ["canto", "estrofe", "verso", "testemunha1", "testemunha2", "situacao",
+          "similaridade", "edicoes", "script", "texto1", "texto2"]
+
 
 def limpar_texto(texto):
     """Remove espaços extras e normaliza quebras de linha no texto."""
     texto = re.sub(r"\s+", " ", texto)  # Substitui múltiplos espaços por um único
-    return texto.strip()
+    return unicodedata.normalize("NFC", texto.strip())
+
+
+def _ordem(valor):
+    """Ordena números como números e o resto ('?', '1a') depois, como texto."""
+    return (0, int(valor), "") if str(valor).isdigit() else (1, 0, str(valor))
+
+
+def texto_do_verso(l_elem):
+    """Texto corrido de um <l>, juntando as palavras partidas por <lb break="no"/>."""
+    for lb in l_elem.iter('{*}lb'):
+        if lb.get('break') != 'no':
+            continue
+        anterior = lb.getprevious()
+        if anterior is not None:
+            anterior.tail = (anterior.tail or "").rstrip().rstrip("-")
+        else:
+            pai = lb.getparent()
+            pai.text = (pai.text or "").rstrip().rstrip("-")
+        lb.tail = (lb.tail or "").lstrip()
+    return limpar_texto("".join(l_elem.itertext()))
+
 
 def extrair_versos(arquivo):
-    """Extrai os versos dos arquivos TEI-XML e retorna um dicionário no formato {(estrofe, verso): texto} """
-    tree = ET.parse(arquivo)
-    root = tree.getroot()
-    
-    # Capturar namespace automaticamente
-    ns = "" if root.tag[0] != "{" else root.tag.split("}")[0] + "}"
-    
+    """Extrai os versos dos arquivos TEI-XML e retorna um dicionário no formato {(canto, estrofe, verso): texto}.
+    O arquivo é lido verso a verso (leitor_tei), sem carregar a árvore inteira."""
     versos = {}
-    
-    for lg in root.findall(f".//{ns}lg"):
-        num_estrofe = lg.get("n", "?")
-        try:
-            num_estrofe = int(num_estrofe)  # Converter para número se possível
-        except ValueError:
-            pass  # Se não for possível, mantém como string
-        
-        for idx, l in enumerate(lg.findall(f"{ns}l"), start=1):
-            texto = "".join(l.itertext()).strip()
-            texto = limpar_texto(texto)  # Normaliza o texto
-            versos[(num_estrofe, idx)] = texto
-    
+    for registro in leitor_tei.iterar_versos(arquivo):
+        chave = (registro.canto or "?", registro.estrofe or "?", registro.verso)
+        versos[chave] = texto_do_verso(registro.elemento)
     return versos
 
-def comparar_arquivos(arquivo1, arquivo2, saida):
-    versos1 = extrair_versos(arquivo1)
-    versos2 = extrair_versos(arquivo2)
-    
-    diferencas = []
-    
-    for chave in sorted(versos1.keys(), key=lambda x: (int(x[0]) if isinstance(x[0], str) and x[0].isdigit() else x[0], x[1])):  # Ordenação numérica
-        v1 = versos1[chave]
-        v2 = versos2[chave]
-        
-        if v1 != v2:
-            diferencas.append([f"Estrofe {chave[0]}, verso {chave[1]}", v1, v2])
-    
+
+# -----------------------
+# COMPARAÇÃO DE UM VERSO
+# -----------------------
+
+def script_edicao(texto1, texto2):
+    """
+    (similaridade entre 0 e 1, [(i, j, de, para), ...]): as operações que
+    transformam texto1 em texto2, com as posições [i:j] em texto1.
+    """
+    if texto1 == texto2:
+        return 1.0, []
+    comparador = SequenceMatcher(None, texto1, texto2, autojunk=False)
+    operacoes = [
+        (i1, i2, texto1[i1:i2], texto2[j1:j2])
+        for op, i1, i2, j1, j2 in comparador.get_opcodes()
+        if op != 'equal'
+    ]
+    return comparador.ratio(), operacoes
+
+
+def formatar_script(operacoes):
+    """'[3:5]"os"→"us"; [9:9]""→"x"' — uma operação por trecho alterado."""
+    return "; ".join(
+        f"[{i}:{j}]{json.dumps(de, ensure_ascii=False)}→{json.dumps(para, ensure_ascii=False)}"
+        for i, j, de, para in operacoes
+    )
+
+
+def _comparar_lote(tarefa):
+    """Compara os pares de testemunhas em cada verso do lote (roda no pool)."""
+    pares, versos = tarefa
+    resultados = []
+    for chave, textos in versos:
+        for a, b in pares:
+            if textos[a] is None or textos[b] is None:
+                # verso ausente numa das versões: não há o que comparar
+                resultados.append((chave, a, b, None, [], textos[a], textos[b]))
+                continue
+            similaridade, operacoes = script_edicao(textos[a], textos[b])
+            resultados.append((chave, a, b, similaridade, operacoes, textos[a], textos[b]))
+    return resultados
+
+
+# -----------------------
+# COMPARAÇÃO DAS TESTEMUNHAS
+# -----------------------
+
+def _lotes(versos, ids, pares):
+    chaves = set()
+    for por_chave in versos.values():
+        chaves.update(por_chave)
+    lote = []
+    for chave in sorted(chaves, key=lambda c: (_ordem(c[0]), _ordem(c[1]), c[2])):
+        lote.append((chave, tuple(versos[t].get(chave) for t in ids)))
+        if len(lote) == LOTE:
+            yield pares, lote
+            lote = []
+    if lote:
+        yield pares, lote
+
+
+def comparar_testemunhas(arquivos, referencia=None, processos=None):
+    """
+    Gera (chave, testemunha1, testemunha2, similaridade, operações, texto1,
+    texto2) para cada verso de todos os cantos e cada par de testemunhas,
+    na ordem do poema; se o verso falta numa das duas, a similaridade é
+    None e o texto dela também. `arquivos` é {id: caminho}; os pares são todas as
+    combinações ou, com `referencia`, cada testemunha contra a referência.
+    Os versos vão ao pool (padrão: um processo por núcleo; 0 = no
+    processo atual) em lotes de LOTE, com no máximo JANELA lotes em
+    andamento.
+    """
+    ids = list(arquivos)
+    if referencia is not None and referencia not in arquivos:
+        raise ValueError(f"Referência '{referencia}' não está entre as testemunhas ({', '.join(ids)}).")
+    if referencia is None:
+        pares = list(combinations(range(len(ids)), 2))
+    else:
+        r = ids.index(referencia)
+        pares = [(r, i) for i in range(len(ids)) if i != r]
+
+    versos = {i: extrair_versos(arquivos[t]) for i, t in enumerate(ids)}
+    lotes = _lotes(versos, range(len(ids)), pares)
+
+    def nomear(resultados):
+        for chave, a, b, *resto in resultados:
+            yield (chave, ids[a], ids[b], *resto)
+
+    if processos == 0:
+        for tarefa in lotes:
+            yield from nomear(_comparar_lote(tarefa))
+        return
+
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        fila = deque()
+        for tarefa in lotes:
+            fila.append(executor.submit(_comparar_lote, tarefa))
+            if len(fila) >= JANELA:
+                yield from nomear(fila.popleft().result())
+        while fila:
+            yield from nomear(fila.popleft().result())
+
+
+# -----------------------
+# GRAVAÇÃO
+# -----------------------
+
+def _situacao(similaridade):
+    if similaridade is None:
+        return "ausente"
+    return "igual" if similaridade == 1.0 else "diferente"
+
+
+def _linha(resultado):
+    (canto, estrofe, verso), t1, t2, similaridade, operacoes, texto1, texto2 = resultado
+    return {
+        "canto": canto, "estrofe": estrofe, "verso": verso,
+        "testemunha1": t1, "testemunha2": t2, "situacao": _situacao(similaridade),
+        "similaridade": None if similaridade is None else round(similaridade, 4),
+        "edicoes": len(operacoes),
+        "script": operacoes, "texto1": texto1, "texto2": texto2,
+    }
+
+
+def gravar(resultados, saida, limiar=1.0, ausentes=False):
+    """
+    Grava em `saida` os resultados com similaridade menor que `limiar`
+    (1.0: só os versos diferentes; acima de 1: todos), à medida que são
+    gerados. Os versos que faltam numa das versões (situacao "ausente",
+    sem similaridade nem script) só são gravados com `ausentes`: um
+    testemunho com só dois cantos geraria milhares de linhas. O formato
+    vem da extensão: .csv (separado por ';'), .json (uma lista) ou .jsonl
+    (um objeto por linha). Retorna {(testemunha1, testemunha2): [versos,
+    diferentes, ausentes, soma das similaridades]}, onde diferentes e a
+    soma só contam os versos presentes nas duas.
+    """
+    formato = Path(saida).suffix.lower()
+    if formato not in ('.csv', '.json', '.jsonl'):
+        raise ValueError(f"Formato de saída desconhecido: '{saida}' (use .csv, .json ou .jsonl).")
+
+    resumo = {}
     with open(saida, "w", encoding="utf-8", newline="") as f:
-        writer = csv.writer(f, delimiter=";")
-        writer.writerow(["Estrofe e Verso", "Versão 1", "Versão 2"])
-        writer.writerows(diferencas)
-    
+        if formato == '.csv':
+            writer = csv.writer(f, delimiter=";")
+            writer.writerow(CAMPOS)
+        elif formato == '.json':
+            f.write("[")
+        primeiro = True
+
+        for resultado in resultados:
+            par = resultado[1], resultado[2]
+            contagem = resumo.setdefault(par, [0, 0, 0, 0.0])
+            contagem[0] += 1
+            if resultado[3] is None:
+                contagem[2] += 1
+                if not ausentes:
+                    continue
+            else:
+                contagem[1] += resultado[3] < 1.0
+                contagem[3] += resultado[3]
+                if resultado[3] >= limiar:
+                    continue
+
+            linha = _linha(resultado)
+            if formato == '.csv':
+                linha["script"] = formatar_script(linha["script"])
+                writer.writerow([linha[campo] for campo in CAMPOS])
+            else:
+                linha["script"] = [list(operacao) for operacao in linha["script"]]
+                texto = json.dumps(linha, ensure_ascii=False)
+                if formato == '.json':
+                    texto = ("\n" if primeiro else ",\n") + texto
+                else:
+                    texto += "\n"
+                f.write(texto)
+            primeiro = False
+
+        if formato == '.json':
+            f.write("\n]\n" if not primeiro else "]\n")
+    return resumo
+
+
+def comparar_arquivos(arquivo1, arquivo2, saida, processos=None):
+    """Compara duas versões e grava os versos diferentes em `saida`."""
+    arquivos = {Path(arquivo1).stem: arquivo1, Path(arquivo2).stem: arquivo2}
+    if len(arquivos) < 2:
+        arquivos = {'versao1': arquivo1, 'versao2': arquivo2}
+    resumo = gravar(comparar_testemunhas(arquivos, processos=processos), saida)
     print(f"Comparação concluída. Diferenças salvas em {saida}")
+    return resumo
+
+
+def _testemunhas(valores):
+    """{id: caminho} de 'ID=ARQUIVO' ou 'ARQUIVO' (o id é o nome do arquivo)."""
+    arquivos = {}
+    for valor in valores:
+        wit_id, _, caminho = valor.rpartition('=')
+        wit_id = wit_id or Path(caminho).stem
+        if wit_id in arquivos:
+            raise ValueError(f"Testemunha '{wit_id}' repetida.")
+        arquivos[wit_id] = caminho
+    return arquivos
+
+
+# (o guard é necessário: os processos do pool importam este módulo)
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(
+        description="Compara versos de duas ou mais versões: similaridade e script de edição por caractere.")
+    arg_parser.add_argument("testemunhas", nargs="*", metavar="[ID=]ARQUIVO",
+                            default=["LusiadasDireita.xml", "LusiadasEsquerda.xml"],
+                            help="Versões TEI a comparar (padrão: LusiadasDireita.xml LusiadasEsquerda.xml).")
+    arg_parser.add_argument("--referencia", default=None, metavar="ID",
+                            help="Compara cada versão só com esta (padrão: todos os pares).")
+    arg_parser.add_argument("--saida", default="diferencas.csv",
+                            help="Arquivo .csv, .json ou .jsonl (padrão: diferencas.csv).")
+    arg_parser.add_argument("--limiar", type=float, default=1.0,
+                            help="Grava os versos com similaridade menor que este valor (padrão: 1.0, os diferentes).")
+    arg_parser.add_argument("--todos", action="store_true", help="Grava também os versos iguais.")
+    arg_parser.add_argument("--ausentes", action="store_true",
+                            help="Grava também os versos que faltam numa das versões (situacao \"ausente\").")
+    arg_parser.add_argument("--processos", type=int, default=None,
+                            help="Processos no pool (padrão: um por núcleo; 0 = sem pool).")
+    args = arg_parser.parse_args()
+
+    try:
+        arquivos = _testemunhas(args.testemunhas)
+        if len(arquivos) < 2:
+            raise ValueError("Informe ao menos duas versões.")
+        resultados = comparar_testemunhas(arquivos, args.referencia, args.processos)
+        resumo = gravar(resultados, args.saida, 2.0 if args.todos else args.limiar, args.ausentes)
+    except ValueError as erro:
+        print(f"Erro: {erro}", file=sys.stderr)
+        sys.exit(1)
 
-# Exemplo de uso
-arquivo1 = "LusiadasDireita.xml"
-arquivo2 = "LusiadasEsquerda.xml"
-saida = "diferencas.csv"
-comparar_arquivos(arquivo1, arquivo2, saida)
+    print(f"{'testemunha1':20} {'testemunha2':20} {'versos':>7} {'diferentes':>10} {'ausentes':>8} {'similaridade':>12}")
+    for (t1, t2), (versos, diferentes, ausentes, soma) in resumo.items():
+        media = soma / (versos - ausentes) if versos > ausentes else 0.0
+        print(f"{t1:20} {t2:20} {versos:7} {diferentes:10} {ausentes:8} {media:12.4f}")
+    print(f"Comparação concluída. Diferenças salvas em {args.saida}")
@@ -1,5 +1,10 @@
-import xml.etree.ElementTree as ET
+import argparse
 import os
+import sys
+
+from lxml import etree
+
+import leitor_tei
 
 # Define os nomes dos arquivos de entrada e saída
 INPUT_XML_FILENAME = "LusiadasEsquerda.xml"
@@ -19,13 +24,54 @@ def get_local_tag_name(element_tag):
         return element_tag.split('}', 1)[1]
     return element_tag
 
-def convert_tei_to_html(xml_string):
+def _texto_cabecalho(header_elem):
+    """Texto de um <head>, com <lb/> convertido em <br/>."""
+    header_content_parts = []
+    
+    # Itera sobre os nós dentro do <head>. AQUI ESTÁ A CORREÇÃO.
+    for node in header_elem.iter():
+        # Usa a função auxiliar para obter o nome local da tag
+        local_node_tag = get_local_tag_name(node.tag)
+        
+        if local_node_tag == 'lb':
+            header_content_parts.append('<br/>')
+        elif node.text and node.text.strip():
+            header_content_parts.append(node.text.strip())
+        if node.tail and node.tail.strip():
+            header_content_parts.append(node.tail.strip())
+    
+    full_header_text = "".join(filter(None, header_content_parts))
+    return full_header_text.replace(" <br/>", "<br/>").replace("<br/> ", "<br/>")
+
+def convert_tei_to_html(xml_source):
     """
-    Converte uma string XML TEI dos Lusíadas em uma string HTML formatada.
+    Converte o primeiro canto de um arquivo TEI dos Lusíadas (caminho ou
+    arquivo aberto) em uma string HTML formatada. O arquivo é lido estrofe
+    a estrofe (leitor_tei) e a leitura para no fim do primeiro canto.
     """
+    title_text = None
+    headers = []
+    stanzas = []
+    canto = None
     try:
-        root = ET.fromstring(xml_string)
-    except ET.ParseError as e:
+        for registro in leitor_tei.iterar_estrofes(xml_source, titulos=True):
+            if registro.canto is None:
+                continue
+            if canto is None:
+                canto = registro.canto
+            elif registro.canto != canto:
+                break
+
+            if registro.estrofe is None:  # <head> do canto
+                if title_text is None:
+                    title_text = "".join(registro.elemento.itertext()).strip()
+                headers.append(_texto_cabecalho(registro.elemento))
+            else:
+                stanzas.append([
+                    "".join(verse_elem.itertext()).strip()
+                    for verse_elem in registro.elemento.findall(f'tei:l', NAMESPACES) # 'l' também no namespace
+                ])
+    except etree.XMLSyntaxError as e:
         return f"<html><body><h1>Erro ao parsear o XML: {e}</h1></body></html>"
 
     html_lines = []
@@ -37,10 +83,7 @@ def convert_tei_to_html(xml_string):
     html_lines.append("    <meta charset='UTF-8'>")
     html_lines.append("    <meta name='viewport' content='width=device-width, initial-scale=1.0'>")
     
-    # Para o título, precisamos procurar o primeiro <head> no namespace
-    title_element = root.find(f".//tei:head", NAMESPACES)
-    title_text = "".join(title_element.itertext()).strip() if title_element is not None else "Os Lusíadas"
-    html_lines.append(f"    <title>{title_text}</title>")
+    html_lines.append(f"    <title>{title_text or 'Os Lusíadas'}</title>")
     
     html_lines.append("    <style>")
     html_lines.append("        body { font-family: Georgia, serif; line-height: 1.6; max-width: 800px; margin: 20px auto; padding: 0 15px; background-color: #fcfcfc; color: #333; }")
@@ -54,59 +97,26 @@ def convert_tei_to_html(xml_string):
     html_lines.append("</head>")
     html_lines.append("<body>")
 
-    # Encontra o div do canto, AGORA USANDO O NAMESPACE
-    canto_div = root.find(f".//tei:div[@type='canto']", NAMESPACES)
-
-    if canto_div is not None:
-        # Primeiro, processa os elementos <head> para criar os títulos
-        first_head_processed = False
-        # Precisa usar o namespace para encontrar 'head' também
-        for header_elem in canto_div.findall(f'tei:head', NAMESPACES):
-            header_content_parts = []
-            
-            # Itera sobre os nós dentro do <head>. AQUI ESTÁ A CORREÇÃO.
-            for node in header_elem.iter():
-                # Usa a função auxiliar para obter o nome local da tag
-                local_node_tag = get_local_tag_name(node.tag)
-                
-                if local_node_tag == 'lb':
-                    header_content_parts.append('<br/>')
-                elif node.text and node.text.strip():
-                    header_content_parts.append(node.text.strip())
-                if node.tail and node.tail.strip():
-                    header_content_parts.append(node.tail.strip())
-            
-            full_header_text = "".join(filter(None, header_content_parts))
-            full_header_text = full_header_text.replace(" <br/>", "<br/>").replace("<br/> ", "<br/>")
-
-            if not first_head_processed:
+    if canto is not None:
+        # Primeiro, os elementos <head> viram os títulos
+        for i, full_header_text in enumerate(headers):
+            if i == 0:
                 html_lines.append(f"    <h1>{full_header_text}</h1>")
-                first_head_processed = True
             else:
                 html_lines.append(f"    <h2>{full_header_text}</h2>")
         
         html_lines.append("    <hr/>")
 
-        # Processa os elementos filhos do div do canto
-        for element in canto_div:
-            # Obtém o nome local da tag do elemento para comparação
-            local_element_tag = get_local_tag_name(element.tag)
-
-            if local_element_tag == 'lg':  # Se for uma estrofe
-                html_lines.append("    <div class='stanza'>")
-                for verse_elem in element.findall(f'tei:l', NAMESPACES): # 'l' também no namespace
-                    verse_text = "".join(verse_elem.itertext()).strip()
-                    html_lines.append(f"        <p class='verse'>{verse_text}</p>")
-                html_lines.append("    </div>")
-            # Para 'fw' e 'pb', que são elementos TEI, também seria bom usar o local_element_tag
-            elif local_element_tag in ['fw', 'pb', 'head', 'lb']:
-                continue
-            # Quaisquer outras tags não especificadas serão ignoradas por padrão
+        # Depois, as estrofes do canto ('fw', 'pb' e 'lb' entre elas são ignorados)
+        for verses in stanzas:
+            html_lines.append("    <div class='stanza'>")
+            for verse_text in verses:
+                html_lines.append(f"        <p class='verse'>{verse_text}</p>")
+            html_lines.append("    </div>")
     else:
         # Mensagem de erro mais detalhada
         html_lines.append(f"    <p>Erro: Não foi encontrado o div do canto com 'type=\"canto\"' no namespace '{TEI_NAMESPACE}'.</p>")
-        html_lines.append(f"    <p>Verifique se o seu arquivo XML ('{INPUT_XML_FILENAME}') utiliza o namespace TEI correto e se o elemento &lt;div type=\"canto\"&gt; está presente e bem formado.</p>")
-        html_lines.append(f"    <p>Raiz do XML: {root.tag}, Atributos: {root.attrib}</p>")
+        html_lines.append(f"    <p>Verifique se o seu arquivo XML ('{xml_source}') utiliza o namespace TEI correto e se o elemento &lt;div type=\"canto\"&gt; está presente e bem formado.</p>")
 
     html_lines.append("</body>")
     html_lines.append("</html>")
@@ -115,28 +125,26 @@ def convert_tei_to_html(xml_string):
 
 # --- Parte principal do script para ler e escrever arquivos ---
 if __name__ == "__main__":
-    xml_content = ""
-    
-    # 1. Tenta ler o arquivo XML
-    try:
-        with open(INPUT_XML_FILENAME, "r", encoding="utf-8") as f:
-            xml_content = f.read()
-        print(f"Arquivo '{INPUT_XML_FILENAME}' lido com sucesso.")
-    except FileNotFoundError:
-        print(f"Erro: O arquivo '{INPUT_XML_FILENAME}' não foi encontrado na pasta atual.")
-        print("Certifique-se de que 'LusiadasEsquerda.xml' está na mesma pasta que o script.")
-        exit()
-    except Exception as e:
-        print(f"Ocorreu um erro inesperado ao ler o arquivo XML: {e}")
-        exit()
+    arg_parser = argparse.ArgumentParser(description="Converte o primeiro canto de um arquivo TEI em HTML.")
+    arg_parser.add_argument("--entrada", default=INPUT_XML_FILENAME)
+    arg_parser.add_argument("--saida", default=OUTPUT_HTML_FILENAME)
+    args = arg_parser.parse_args()
+
+    # 1. Confere se o arquivo XML existe (ele é lido aos poucos na conversão)
+    if not os.path.exists(args.entrada):
+        print(f"Erro: O arquivo '{args.entrada}' não foi encontrado na pasta atual.")
+        print(f"Certifique-se de que '{args.entrada}' está na mesma pasta que o script.")
+        sys.exit(1)
 
     # 2. Converte o conteúdo XML para HTML
-    html_output = convert_tei_to_html(xml_content)
+    html_output = convert_tei_to_html(args.entrada)
+    print(f"Arquivo '{args.entrada}' lido com sucesso.")
 
     # 3. Salva o resultado HTML em um arquivo
     try:
-        with open(OUTPUT_HTML_FILENAME, "w", encoding="utf-8") as f:
+        with open(args.saida, "w", encoding="utf-8") as f:
             f.write(html_output)
-        print(f"Conversão concluída. HTML salvo em '{OUTPUT_HTML_FILENAME}'.")
+        print(f"Conversão concluída. HTML salvo em '{args.saida}'.")
     except Exception as e:
-        print(f"Ocorreu um erro ao salvar o arquivo HTML '{OUTPUT_HTML_FILENAME}': {e}")
\ No newline at end of file
+        print(f"Ocorreu um erro ao salvar o arquivo HTML '{args.saida}': {e}")
+        sys.exit(1)
@@ -0,0 +1,137 @@
+"""
+Escrita incremental de XML com lxml.etree.xmlfile.
+
+Em vez de montar a árvore inteira e serializá-la no fim, os scripts abrem
+os elementos externos (TEI, text, body, div...) com `elemento` e gravam
+cada unidade pronta (uma estrofe, o teiHeader) com `escrever`, que a
+libera da memória em seguida. A indentação reproduz a de
+etree.tostring(..., pretty_print=True) com dois espaços por nível, e os
+namespaces são declarados uma vez, na raiz, como lá.
+"""
+import re
+from contextlib import ExitStack, contextmanager
+from typing import NamedTuple
+
+from lxml import etree
+
+ESPACO = '  '
+
+# declarações xmlns / xmlns:prefixo na marca de abertura de um elemento
+_DECLARACAO = re.compile(rb'\s+xmlns(?::([\w.-]+))?="([^"]*)"')
+
+
+class Escrita(NamedTuple):
+    """O que `documento` entrega: o xmlfile, o arquivo e os namespaces da raiz."""
+    xf: object
+    saida: object
+    nsmap: dict
+
+
+def _quebra(nivel):
+    return '\n' + ESPACO * nivel
+
+
+@contextmanager
+def documento(saida, tag, nsmap=None, attrib=None, prologo=()):
+    """
+    Abre `saida` (caminho ou arquivo binário) com a declaração XML, as
+    instruções de processamento/comentários de `prologo` e o elemento
+    raiz; dentro do bloco, os filhos da raiz vão no nível 1.
+    """
+    with ExitStack() as pilha:
+        if not hasattr(saida, 'write'):
+            saida = pilha.enter_context(open(saida, 'wb'))
+        with etree.xmlfile(saida, encoding='utf-8') as xf:
+            xf.write_declaration()
+            for no in prologo:
+                xf.write(no, with_tail=False)
+                # o xmlfile não aceita texto fora da raiz: a quebra vai direto no arquivo
+                xf.flush()
+                saida.write(b'\n')
+            with xf.element(tag, attrib or {}, nsmap=nsmap):
+                yield Escrita(xf, saida, dict(nsmap or {}))
+                xf.write(_quebra(0))
+        saida.write(b'\n')
+
+
+@contextmanager
+def elemento(escrita, nivel, tag, attrib=None):
+    """Abre `tag` no nível de indentação dado; os filhos vão em nivel + 1."""
+    escrita.xf.write(_quebra(nivel))
+    with escrita.xf.element(tag, attrib or {}):
+        yield
+        escrita.xf.write(_quebra(nivel))
+
+
+def _indentar(elem, nivel):
+    """
+    Como o pretty_print da libxml2: só indenta elementos cujos filhos são
+    todos elementos, sem texto entre eles. Conteúdo misto (um <l> com os
+    espaços entre os <w>) fica como está; etree.indent trocaria esses
+    espaços por quebras de linha.
+    """
+    if len(elem) == 0 or elem.text is not None or any(filho.tail is not None for filho in elem):
+        return
+    elem.text = _quebra(nivel + 1)
+    for filho in elem:
+        _indentar(filho, nivel + 1)
+        filho.tail = _quebra(nivel + 1)
+    filho.tail = _quebra(nivel)
+
+
+# algum elemento com texto e filhos ao mesmo tempo
+_CONTEUDO_MISTO = etree.XPath('boolean(descendant-or-self::*[text()][*])')
+
+
+def _sem_declaracoes_da_raiz(xml, nsmap):
+    """
+    Tira da marca de abertura as declarações de namespace que a raiz já
+    faz (mesmo prefixo e mesma URI). O xmlfile serializa cada elemento
+    como um documento à parte e as repetiria em todos os blocos.
+    """
+    fim = xml.find(b'>') + 1
+
+    def manter(declaracao):
+        prefixo = declaracao.group(1)
+        prefixo = prefixo.decode() if prefixo is not None else None
+        if nsmap.get(prefixo) == declaracao.group(2).decode():
+            return b''
+        return declaracao.group(0)
+
+    return _DECLARACAO.sub(manter, xml[:fim]) + xml[fim:]
+
+
+def escrever(escrita, elem, nivel):
+    """Grava um elemento completo, indentado no nível dado, sem o tail."""
+    elem.tail = None
+    if not isinstance(elem.tag, str):  # comentário ou instrução de processamento
+        pass
+    elif _CONTEUDO_MISTO(elem):
+        _indentar(elem, nivel)
+    else:
+        etree.indent(elem, space=ESPACO, level=nivel)
+    xml = etree.tostring(elem, encoding='utf-8', with_tail=False)
+    if isinstance(elem.tag, str):
+        xml = _sem_declaracoes_da_raiz(xml, escrita.nsmap)
+    escrita.xf.write(_quebra(nivel))
+    # o bloco vai direto no arquivo, já sem as declarações repetidas
+    escrita.xf.flush()
+    escrita.saida.write(xml)
+
+
+def copiar(escrita, blocos, processar=None, nivel=1):
+    """
+    Grava os pares de leitor_tei.iterar_blocos a partir do primeiro filho
+    da raiz (a raiz e o prólogo vão em `documento`), chamando
+    `processar(elem)` em cada bloco antes de gravá-lo.
+    """
+    for tipo, elem in blocos:
+        if tipo == 'fechar':
+            return
+        if tipo == 'abrir':
+            with elemento(escrita, nivel, elem.tag, elem.attrib):
+                copiar(escrita, blocos, processar, nivel + 1)
+        else:
+            if processar is not None and isinstance(elem.tag, str):
+                processar(elem)
+            escrever(escrita, elem, nivel)
@@ -1,107 +1,351 @@
-import spacy
 from lxml import etree
+import argparse
+import importlib.metadata
+import json
 import os
+import sqlite3
 import sys
+import time
+import unicodedata
+from collections import namedtuple
 
-# --- 1. Configuração e Carregamento do spaCy ---
-try:
-    nlp = spacy.load("pt_core_news_lg")
-    print("Modelo spaCy 'pt_core_news_lg' carregado com sucesso.")
-except OSError:
-    print("Erro: Modelo spaCy 'pt_core_news_lg' não encontrado.")
-    print("Por favor, execute: python -m spacy download pt_core_news_lg")
-    sys.exit(1)
+import escritor_tei
+import leitor_tei
+from lexico import Lexico
+
+# --- 1. Analisadores: spaCy ou léxico ---
+MODELO = "pt_core_news_lg"
+# componentes cujo resultado não é lido (só lema, POS e MSD); desligados,
+# deixam de rodar em cada verso
+COMPONENTES_NAO_USADOS = ("parser", "ner", "senter")
+
+# o que _etiquetar_l lê de cada token do spaCy, com os mesmos nomes
+Analise = namedtuple('Analise', 'text lemma_ pos_ morph whitespace_ is_punct is_space')
+
+def _analises(doc):
+    return [Analise(t.text, t.lemma_, t.pos_, str(t.morph), t.whitespace_, t.is_punct, t.is_space) for t in doc]
+
+def _versao(pacote):
+    try:
+        return importlib.metadata.version(pacote)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+# Um analisador tem `identificador` (o que muda as análises: entra na chave
+# do cache) e `analisar(textos, lote, processos)`, que gera a lista de
+# Analise de cada texto, na ordem.
+
+class AnalisadorSpacy:
+    """
+    O modelo spaCy, sem os componentes não usados. spaCy e modelo só são
+    carregados quando o primeiro verso precisa deles: uma execução servida
+    pelo cache não paga o tempo nem a memória do modelo. `tokenizar` usa
+    só o tokenizador do idioma (spacy.blank), sem carregar o modelo.
+    """
+
+    def __init__(self, modelo=MODELO):
+        self.modelo = modelo
+        self._nlp = None
+        self._tokenizador = None
+        # nome e versão do modelo e do spaCy, sem importá-los
+        self.identificador = (f"{modelo}-{_versao(modelo)}|spacy-{_versao('spacy')}"
+                              f"|sem {','.join(COMPONENTES_NAO_USADOS)}")
+
+    def nlp(self):
+        if self._nlp is None:
+            import spacy
+            try:
+                nlp = spacy.load(self.modelo)
+            except OSError:
+                print(f"Erro: Modelo spaCy '{self.modelo}' não encontrado.")
+                print(f"Por favor, execute: python -m spacy download {self.modelo}")
+                sys.exit(1)
+            nlp.select_pipes(disable=[pipe for pipe in COMPONENTES_NAO_USADOS if pipe in nlp.pipe_names])
+            print(f"Modelo spaCy '{self.modelo}' carregado com sucesso (componentes: {', '.join(nlp.pipe_names)}).")
+            self._nlp = nlp
+        return self._nlp
+
+    def analisar(self, textos, lote=256, processos=1):
+        for doc in self.nlp().pipe(textos, batch_size=lote, n_process=processos):
+            yield _analises(doc)
+
+    def tokenizador(self):
+        """
+        O tokenizador do modelo se ele já foi carregado; senão o de
+        spacy.blank no idioma do modelo ('pt' de pt_core_news_lg), que
+        tem as mesmas regras e carrega em milissegundos.
+        """
+        if self._nlp is not None:
+            return self._nlp.tokenizer
+        if self._tokenizador is None:
+            import spacy
+            self._tokenizador = spacy.blank(self.modelo.split('_', 1)[0]).tokenizer
+        return self._tokenizador
+
+    def tokenizar(self, textos, lote=256):
+        """[(forma, espaço que a segue)] de cada texto, só com o tokenizador."""
+        for doc in self.tokenizador().pipe(textos, batch_size=lote):
+            yield [(t.text, t.whitespace_) for t in doc]
+
+class AnalisadorLexico:
+    """
+    Análise por consulta ao léxico (lexico.Lexico, aberto com mmap): cada
+    forma recebe a análise mais frequente nos arquivos já etiquetados. Os
+    versos são divididos pelo tokenizador da `reserva` (por padrão o
+    spaCy), para que "disse-lhe" ou "d'ouro" virem os mesmos tokens que
+    o modelo produziria; um verso com alguma forma desconhecida vai
+    inteiro para a reserva, que o analisa em contexto. O modelo da reserva
+    só é carregado se algum verso for para ela.
+    """
+
+    def __init__(self, caminho, reserva=None):
+        self.lexico = Lexico(caminho)
+        self.reserva = reserva if reserva is not None else AnalisadorSpacy()
+        self.identificador = f"lexico-{self.lexico.hash[:12]}|{self.reserva.identificador}"
+        self.contagem = {'lexico': 0, 'reserva': 0}
+        self._entradas = {}  # forma -> Entrada ou None, das buscas já feitas
+
+    def _buscar(self, forma):
+        if forma not in self._entradas:
+            self._entradas[forma] = self.lexico.buscar(forma) or self.lexico.buscar(forma.lower())
+        return self._entradas[forma]
+
+    def _consultar(self, tokens):
+        analises = []
+        for forma, espaco in tokens:
+            entrada = self._buscar(forma)
+            if entrada is None:
+                return None
+            analises.append(Analise(forma, entrada.lema, entrada.pos, entrada.msd, espaco, entrada.pontuacao, False))
+        return analises
+
+    def analisar(self, textos, lote=256, processos=1):
+        tokens = list(self.reserva.tokenizar(textos, lote))
+        desconhecidos = [texto for texto, formas in zip(textos, tokens) if self._consultar(formas) is None]
+        da_reserva = self.reserva.analisar(desconhecidos, lote, processos) if desconhecidos else iter(())
+        for formas in tokens:
+            analises = self._consultar(formas)
+            if analises is None:
+                self.contagem['reserva'] += 1
+                yield next(da_reserva)
+            else:
+                self.contagem['lexico'] += 1
+                yield analises
 
 # Namespace TEI para lxml
 TEI_NAMESPACE = "http://www.tei-c.org/ns/1.0"
 ET_NAMESPACE = "{%s}" % TEI_NAMESPACE
 
-def lemmatize_and_tag_tei(input_filepath, output_filepath):
+def _texto_l(l_elem):
+    return "".join(l_elem.itertext()).strip()
+
+def _normalizar(texto):
+    """Texto enviado ao modelo e chave do cache: NFC, com os espaços simplificados."""
+    return unicodedata.normalize('NFC', ' '.join(texto.split()))
+
+def _textos(input_filepath):
+    """
+    O texto normalizado de cada <l> não vazio, na mesma ordem em que
+    lemmatize_and_tag_tei os etiqueta (os blocos de leitor_tei.iterar_blocos).
+    """
+    for tipo, elem in leitor_tei.iterar_blocos(input_filepath):
+        if tipo == 'bloco' and isinstance(elem.tag, str):
+            for l_elem in elem.iter(f"{ET_NAMESPACE}l"):
+                texto = _texto_l(l_elem)
+                if texto:
+                    yield _normalizar(texto)
+
+# --- 2. Cache persistente das análises ---
+class _CacheAnotacoes:
+    """
+    Análises dos versos num SQLite, com chave (modelo, texto normalizado):
+    corrigir alguns versos só manda esses versos ao modelo. `modelo` é o
+    identificador do analisador; as análises de outros modelos ficam no
+    arquivo (voltar a um modelo anterior não refaz nada) até `podar`.
+    Sem `caminho`, o cache fica na memória.
+    """
+    CONSULTA = 500  # textos por SELECT ... IN
+
+    def __init__(self, caminho, modelo):
+        self.conexao = sqlite3.connect(caminho or ':memory:')
+        self.modelo = modelo
+        with self.conexao:
+            self.conexao.execute(
+                "CREATE TABLE IF NOT EXISTS anotacoes ("
+                "modelo TEXT NOT NULL, texto TEXT NOT NULL, tokens TEXT NOT NULL, "
+                "PRIMARY KEY (modelo, texto)) WITHOUT ROWID"
+            )
+
+    def podar(self):
+        """Apaga as análises dos outros modelos; retorna quantas foram apagadas."""
+        with self.conexao:
+            return self.conexao.execute("DELETE FROM anotacoes WHERE modelo != ?", (self.modelo,)).rowcount
+
+    def faltando(self, textos):
+        """Os textos (sem repetições, na ordem) que ainda não têm análise."""
+        faltando = {}
+        lote = []
+        for texto in textos:
+            lote.append(texto)
+            if len(lote) == self.CONSULTA:
+                self._filtrar(lote, faltando)
+        self._filtrar(lote, faltando)
+        return list(faltando)
+
+    def _filtrar(self, lote, faltando):
+        marcas = ','.join('?' * len(lote))
+        presentes = {texto for (texto,) in self.conexao.execute(
+            f"SELECT texto FROM anotacoes WHERE modelo = ? AND texto IN ({marcas})", [self.modelo, *lote])}
+        for texto in lote:
+            if texto not in presentes:
+                faltando[texto] = None
+        lote.clear()
+
+    def ler(self, texto):
+        linha = self.conexao.execute(
+            "SELECT tokens FROM anotacoes WHERE modelo = ? AND texto = ?", (self.modelo, texto)).fetchone()
+        return None if linha is None else [Analise(*token) for token in json.loads(linha[0])]
+
+    def gravar(self, pares):
+        """Grava (texto, [Analise]) numa transação."""
+        with self.conexao:
+            self.conexao.executemany(
+                "INSERT OR REPLACE INTO anotacoes (modelo, texto, tokens) VALUES (?, ?, ?)",
+                [(self.modelo, texto, json.dumps(analises, ensure_ascii=False)) for texto, analises in pares],
+            )
+
+    def fechar(self):
+        self.conexao.close()
+
+def _etiquetar_l(l_elem, analises):
+    """Substitui o texto de um <l> pelos tokens analisados: <w>/<pc> com lema, POS e MSD."""
+    l_elem.clear()
+    l_elem.text = None
+
+    last_appended_node = None
+
+    for token in analises:
+        if token.is_punct:
+            pc_elem = etree.SubElement(l_elem, ET_NAMESPACE + "pc")
+            pc_elem.set("pos", token.pos_)
+
+            # CORREÇÃO AQUI: Use str(token.morph)
+            morph_str = str(token.morph)
+            if morph_str: # morph_str será uma string vazia se não houver dados morfológicos
+                pc_elem.set("msd", morph_str)
+
+            pc_elem.text = token.text
+            last_appended_node = pc_elem
+        elif token.is_space:
+            space_text = token.text
+            if last_appended_node is not None:
+                last_appended_node.tail = (last_appended_node.tail or "") + space_text
+            else:
+                l_elem.text = (l_elem.text or "") + space_text
+        else: # É uma palavra
+            w_elem = etree.SubElement(l_elem, ET_NAMESPACE + "w")
+            w_elem.set("lemma", token.lemma_)
+            w_elem.set("pos", token.pos_)
+
+            # CORREÇÃO AQUI: Use str(token.morph)
+            morph_str = str(token.morph)
+            if morph_str: # morph_str será uma string vazia se não houver dados morfológicos
+                w_elem.set("msd", morph_str)
+
+            w_elem.text = token.text
+            last_appended_node = w_elem
+
+        if token.whitespace_:
+            if last_appended_node is not None:
+                last_appended_node.tail = (last_appended_node.tail or "") + token.whitespace_
+            elif l_elem.text is None and len(l_elem) == 0:
+                 l_elem.text = (l_elem.text or "") + token.whitespace_
+    return True
+
+def lemmatize_and_tag_tei(input_filepath, output_filepath, analisador=None, lote=256, processos=1, cache_path=None,
+                          podar_cache=False):
     """
     Lematiza e adiciona categorias gramaticais (POS e MSD) a um arquivo TEI XML,
-    usando <w> para palavras e <pc> para pontuação.
+    usando <w> para palavras e <pc> para pontuação. A entrada é lida e a saída
+    gravada estrofe a estrofe (leitor_tei/escritor_tei), sem carregar nem
+    montar o documento inteiro.
+
+    Uma primeira leitura (_textos) separa os versos que o cache em
+    `cache_path` (SQLite) ainda não tem; só esses passam pelo `analisador`
+    (padrão: AnalisadorSpacy; o spaCy analisa com nlp.pipe, em lotes de
+    `lote` versos e em `processos` processos, -1 = um por núcleo), e suas
+    análises vão para o cache. A cópia do documento
+    etiqueta então cada verso com a análise do cache.
 
     Args:
         input_filepath (str): Caminho para o arquivo XML de entrada (Lusíadas).
         output_filepath (str): Caminho para salvar o arquivo XML processado.
+        analisador: AnalisadorSpacy ou AnalisadorLexico.
+        lote (int): Versos por lote do nlp.pipe.
+        processos (int): n_process do nlp.pipe.
+        cache_path (str): Arquivo SQLite do cache de análises (None = só na memória).
+        podar_cache (bool): Apaga do cache as análises de outros analisadores.
     """
+    cache = None
     try:
-        # 1. Carregar o arquivo XML
-        parser = etree.XMLParser(remove_blank_text=True)
-        tree = etree.parse(input_filepath, parser)
-        root = tree.getroot()
-        print(f"Arquivo XML '{input_filepath}' carregado.")
-
-        # 2. Encontrar todos os elementos <l> (linha) dentro do corpo do texto
-        l_elements = root.findall(f".//{ET_NAMESPACE}l")
-        print(f"Encontradas {len(l_elements)} linhas (<l> elementos) para processar.")
-
-        # 3. Iterar sobre cada elemento <l>
-        for i, l_elem in enumerate(l_elements):
-            original_text = "".join(l_elem.itertext()).strip()
-
-            if not original_text:
-                continue
-
-            doc = nlp(original_text)
-
-            l_elem.clear()
-            l_elem.text = None
-
-            last_appended_node = None
-
-            for token in doc:
-                if token.is_punct:
-                    pc_elem = etree.SubElement(l_elem, ET_NAMESPACE + "pc")
-                    pc_elem.set("pos", token.pos_)
-                    
-                    # CORREÇÃO AQUI: Use str(token.morph)
-                    morph_str = str(token.morph)
-                    if morph_str: # morph_str será uma string vazia se não houver dados morfológicos
-                        pc_elem.set("msd", morph_str)
-                    
-                    pc_elem.text = token.text
-                    last_appended_node = pc_elem
-                elif token.is_space:
-                    space_text = token.text
-                    if last_appended_node is not None:
-                        last_appended_node.tail = (last_appended_node.tail or "") + space_text
-                    else:
-                        l_elem.text = (l_elem.text or "") + space_text
-                else: # É uma palavra
-                    w_elem = etree.SubElement(l_elem, ET_NAMESPACE + "w")
-                    w_elem.set("lemma", token.lemma_)
-                    w_elem.set("pos", token.pos_)
-
-                    # CORREÇÃO AQUI: Use str(token.morph)
-                    morph_str = str(token.morph)
-                    if morph_str: # morph_str será uma string vazia se não houver dados morfológicos
-                        w_elem.set("msd", morph_str)
-
-                    w_elem.text = token.text
-                    last_appended_node = w_elem
-
-                if token.whitespace_:
-                    if last_appended_node is not None:
-                        last_appended_node.tail = (last_appended_node.tail or "") + token.whitespace_
-                    elif l_elem.text is None and len(l_elem) == 0:
-                         l_elem.text = (l_elem.text or "") + token.whitespace_
-
-            if (i + 1) % 100 == 0:
-                print(f"Processadas {i + 1} linhas...")
-
-        # 4. Salvar o arquivo XML modificado
-        tree_string = etree.tostring(
-            tree,
-            pretty_print=True,
-            xml_declaration=True,
-            encoding="UTF-8"
-        ).decode("utf-8")
-
-        with open(output_filepath, "w", encoding="utf-8") as f:
-            f.write(tree_string)
+        # 1. Contar os elementos <l> (linha) a processar, sem carregar o arquivo
+        total = sum(1 for _ in leitor_tei.iterar_versos(input_filepath))
+        print(f"Arquivo XML '{input_filepath}': {total} linhas (<l> elementos) para processar.")
+
+        analisador = analisador if analisador is not None else AnalisadorSpacy()
+        cache = _CacheAnotacoes(cache_path, analisador.identificador)
+        if podar_cache:
+            print(f"Cache: {cache.podar()} análises de outros analisadores apagadas.")
+        faltando = cache.faltando(_textos(input_filepath))
+
+        # 2. Analisar só os versos fora do cache, gravando as análises a cada lote
+        tokens = 0
+        inicio = time.perf_counter()
+        prontos = []
+        for analisados, (texto, analises) in enumerate(zip(faltando, analisador.analisar(faltando, lote, processos)),
+                                                       start=1):
+            prontos.append((texto, analises))
+            tokens += len(analises)
+            if len(prontos) == lote:
+                cache.gravar(prontos)
+                prontos.clear()
+                decorrido = time.perf_counter() - inicio
+                print(f"Analisadas {analisados}/{len(faltando)} linhas ({analisados / decorrido:.0f} linhas/s)...")
+        cache.gravar(prontos)
+        decorrido = time.perf_counter() - inicio
+
+        # 3. Copiar o documento bloco a bloco (leitor_tei), etiquetando cada
+        #    estrofe com as análises do cache antes de gravá-la
+        processadas = 0
+
+        def etiquetar(elem):
+            nonlocal processadas
+            for l_elem in list(elem.iter(f"{ET_NAMESPACE}l")):
+                texto = _texto_l(l_elem)
+                if not texto:
+                    continue
+                _etiquetar_l(l_elem, cache.ler(_normalizar(texto)))
+                processadas += 1
+
+        blocos = leitor_tei.iterar_blocos(input_filepath)
+        prologo = []
+        for tipo, raiz in blocos:
+            if tipo != 'prologo':
+                break
+            prologo.append(raiz)
+        with escritor_tei.documento(output_filepath, raiz.tag, nsmap=raiz.nsmap,
+                                    attrib=raiz.attrib, prologo=prologo) as escrita:
+            escritor_tei.copiar(escrita, blocos, etiquetar)
 
         print(f"Processamento concluído. Arquivo salvo em '{output_filepath}'")
+        print(f"{processadas} linhas etiquetadas; {len(faltando)} analisadas "
+              f"({analisador.identificador}) e as demais do cache.")
+        if getattr(analisador, 'contagem', None):
+            print(f"Léxico: {analisador.contagem['lexico']} versos; spaCy: {analisador.contagem['reserva']}.")
+        if faltando:
+            print(f"Análise: {tokens} tokens em {decorrido:.1f}s "
+                  f"({len(faltando) / decorrido:.0f} linhas/s, {tokens / decorrido:.0f} tokens/s; "
+                  f"lotes de {lote}, {processos} processo(s)).")
 
     except etree.XMLSyntaxError as e:
         print(f"Erro de sintaxe XML: {e}")
@@ -109,23 +353,44 @@ def lemmatize_and_tag_tei(input_filepath, output_filepath):
         print(f"Erro: Arquivo '{input_filepath}' não encontrado.")
     except Exception as e:
         print(f"Ocorreu um erro inesperado: {e}")
+    finally:
+        if cache is not None:
+            cache.fechar()
 
 # --- Uso do script ---
+# (o guard é necessário: com --processos, o spaCy importa este módulo nos processos filhos)
 if __name__ == "__main__":
-    # O conteúdo e arquivos de teste permanecem os mesmos
-    input_file = "LusiadasModernizado.xml"
-    output_file = "LusiadasModernizadoLematizado.xml"
+    arg_parser = argparse.ArgumentParser(description="Lematiza e etiqueta (POS e MSD) os versos de um arquivo TEI.")
+    arg_parser.add_argument("--entrada", default="LusiadasModernizado.xml")
+    arg_parser.add_argument("--saida", default="LusiadasModernizadoLematizado.xml")
+    arg_parser.add_argument("--modelo", default=MODELO)
+    arg_parser.add_argument("--lexico", help="Léxico (lexico.py) a consultar antes do spaCy, que fica para "
+                                             "os versos com formas desconhecidas.")
+    arg_parser.add_argument("--lote", type=int, default=256, help="Versos por lote do nlp.pipe (padrão: 256).")
+    arg_parser.add_argument("--processos", type=int, default=1,
+                            help="Processos do nlp.pipe (padrão: 1; -1 = um por núcleo).")
+    arg_parser.add_argument("--cache", default=".etiquetador_cache.sqlite3",
+                            help="Arquivo SQLite do cache de análises (padrão: .etiquetador_cache.sqlite3).")
+    arg_parser.add_argument("--sem-cache", action="store_true",
+                            help="Analisa todos os versos de novo, sem ler nem gravar o cache.")
+    arg_parser.add_argument("--podar-cache", action="store_true",
+                            help="Apaga do cache as análises de outros modelos (por padrão elas ficam).")
+    args = arg_parser.parse_args()
+    output_file = args.saida
+
+    analisador = AnalisadorSpacy(args.modelo)
+    if args.lexico:
+        analisador = AnalisadorLexico(args.lexico, reserva=analisador)
 
-    lemmatize_and_tag_tei(input_file, output_file)
+    lemmatize_and_tag_tei(args.entrada, output_file, analisador, args.lote, args.processos,
+                          cache_path=None if args.sem_cache else args.cache, podar_cache=args.podar_cache)
 
     print("\n--- Verificando o resultado da primeira linha com <pc> ---")
     try:
-        tree = etree.parse(output_file)
-        root = tree.getroot()
-        first_l = root.find(f".//{ET_NAMESPACE}l")
-        if first_l is not None:
-            print(etree.tostring(first_l, pretty_print=True, encoding="utf-8").decode("utf-8"))
+        primeiro = next(leitor_tei.iterar_versos(output_file), None)
+        if primeiro is not None:
+            print(etree.tostring(primeiro.elemento, pretty_print=True, encoding="utf-8").decode("utf-8"))
         else:
             print("Nenhum elemento <l> encontrado no arquivo de saída.")
     except Exception as e:
-        print(f"Erro ao verificar o arquivo de saída: {e}")
\ No newline at end of file
+        print(f"Erro ao verificar o arquivo de saída: {e}")
@@ -1,37 +1,49 @@
 import xml.etree.ElementTree as ET
+import argparse
 import re
 
+import leitor_tei
+
 def limpar_texto(texto):
     """Remove espaços extras e normaliza quebras de linha no texto."""
     texto = re.sub(r"\s+", " ", texto)  # Substitui múltiplos espaços por um único
     return texto.strip()
 
+def _numero(valor):
+    """Converte para número se possível; senão mantém como string ('?')."""
+    try:
+        return int(valor)
+    except ValueError:
+        return valor
+
+def _ordem(chave):
+    """Números antes do resto ('?'), cada parte da chave comparada à parte."""
+    return tuple((0, parte, "") if isinstance(parte, int) else (1, 0, str(parte)) for parte in chave)
+
 def extrair_versos(arquivo):
-    """Extrai os versos dos arquivos TEI-XML e retorna um dicionário no formato {(estrofe, verso): texto}."""
-    tree = ET.parse(arquivo)
-    root = tree.getroot()
-    
-    # Capturar namespace automaticamente
-    ns = "" if root.tag[0] != "{" else root.tag.split("}")[0] + "}"
-    
+    """Extrai os versos dos arquivos TEI-XML e retorna um dicionário no formato {(canto, estrofe, verso): texto}.
+    O arquivo é lido verso a verso (leitor_tei), sem carregar a árvore inteira."""
     versos = {}
+    ns = ""
     
-    for lg in root.findall(f".//{ns}lg"):
-        num_estrofe = lg.get("n", "?")
-        try:
-            num_estrofe = int(num_estrofe)  # Converter para número se possível
-        except ValueError:
-            pass  # Se não for possível, mantém como string
-        
-        for idx, l in enumerate(lg.findall(f"{ns}l"), start=1):
-            texto = "".join(l.itertext()).strip()
-            texto = limpar_texto(texto)  # Normaliza o texto
-            versos[(num_estrofe, idx)] = texto
+    for registro in leitor_tei.iterar_versos(arquivo):
+        # Capturar namespace automaticamente
+        tag = registro.elemento.tag
+        ns = "" if tag[0] != "{" else tag.split("}")[0] + "}"
+
+        num_canto = _numero(registro.canto or "?")
+        num_estrofe = _numero(registro.estrofe or "?")
+
+        texto = "".join(registro.elemento.itertext()).strip()
+        texto = limpar_texto(texto)  # Normaliza o texto
+        versos[(num_canto, num_estrofe, registro.verso)] = texto
     
     return versos, ns
 
 def gerar_tei_combinado(versos1, versos2, ns, saida):
-    """Gera um arquivo TEI combinado com as duas versões, usando <app> e <rdg> para marcar diferenças."""
+    """Gera um arquivo TEI combinado com as duas versões, usando <app> e <rdg> para marcar diferenças.
+    Um verso que só existe numa das versões (ex.: os cantos que faltam em uma delas) vira um <app>
+    com um <rdg> vazio para a outra, como as omissões no aparato crítico."""
     # Cria a estrutura básica do TEI
     tei = ET.Element(f"{ns}TEI")
     header = ET.SubElement(tei, f"{ns}teiHeader")
@@ -46,24 +58,27 @@ def gerar_tei_combinado(versos1, versos2, ns, saida):
     author = ET.SubElement(title_stmt, f"{ns}author")
     author.text = "Luís de Camões"
     
-    # Variável para controlar a estrofe atual
-    estrofe_atual = None
-    lg = None
+    # Variáveis para controlar o canto e a estrofe atuais
+    canto_atual = estrofe_atual = None
+    div = lg = None
     
-    # Itera sobre os versos e adiciona ao corpo do TEI
-    for chave in sorted(versos1.keys(), key=lambda x: (int(x[0]) if isinstance(x[0], str) and x[0].isdigit() else x[0], x[1])):
-        num_estrofe = chave[0]
-        v1 = versos1[chave]
-        v2 = versos2[chave]
+    # Itera sobre os versos das duas versões e adiciona ao corpo do TEI
+    for chave in sorted(versos1.keys() | versos2.keys(), key=_ordem):
+        num_canto, num_estrofe, _ = chave
+        v1 = versos1.get(chave)
+        v2 = versos2.get(chave)
         
-        # Cria um novo <lg> para cada estrofe
+        # Cria um novo <div> para cada canto e um novo <lg> para cada estrofe
+        if num_canto != canto_atual:
+            div = ET.SubElement(body, f"{ns}div", type="canto", n=str(num_canto))
+            canto_atual, estrofe_atual = num_canto, None
         if num_estrofe != estrofe_atual:
-            lg = ET.SubElement(body, f"{ns}lg", n=str(num_estrofe))
+            lg = ET.SubElement(div, f"{ns}lg", n=str(num_estrofe))
             estrofe_atual = num_estrofe
         
         # Adiciona o verso
         if v1 != v2:
-            # Se houver diferença, usa <app> dentro de <l>
+            # Se houver diferença (ou o verso faltar numa versão), usa <app> dentro de <l>
             l = ET.SubElement(lg, f"{ns}l")
             app = ET.SubElement(l, f"{ns}app")
             rdg1 = ET.SubElement(app, f"{ns}rdg", wit="#V1")
@@ -81,13 +96,16 @@ def gerar_tei_combinado(versos1, versos2, ns, saida):
     print(f"Arquivo TEI combinado salvo em {saida}")
 
 # Exemplo de uso
-arquivo1 = "LusiadasDireita.xml"
-arquivo2 = "LusiadasEsquerda.xml"
-saida = "LusiadasCombinado.xml"
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Combina duas versões num TEI com <app>/<rdg> nos versos diferentes.")
+    arg_parser.add_argument("--versao1", default="LusiadasDireita.xml")
+    arg_parser.add_argument("--versao2", default="LusiadasEsquerda.xml")
+    arg_parser.add_argument("--saida", default="LusiadasCombinado.xml")
+    args = arg_parser.parse_args()
 
-# Extrai os versos
-versos1, ns1 = extrair_versos(arquivo1)
-versos2, ns2 = extrair_versos(arquivo2)
+    # Extrai os versos
+    versos1, ns1 = extrair_versos(args.versao1)
+    versos2, ns2 = extrair_versos(args.versao2)
 
-# Gera o arquivo TEI combinado
-gerar_tei_combinado(versos1, versos2, ns1, saida)
\ No newline at end of file
+    # Gera o arquivo TEI combinado
+    gerar_tei_combinado(versos1, versos2, ns1, args.saida)
\ No newline at end of file
@@ -1,17 +1,82 @@
 from lxml import etree
+import argparse
+import hashlib
+import io
+import json
+import os
 import re
-from difflib import SequenceMatcher
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from itertools import groupby
+from pathlib import Path
+
+import alinhador
+import escritor_tei
+import leitor_tei
+from alinhador import alinhar_testemunhas
 
 # --- Adicione a definição do namespace XML aqui ---
 XML_NAMESPACE = "http://www.w3.org/XML/1998/namespace"
 TEI_NAMESPACE = "http://www.tei-c.org/ns/1.0" # Definindo o namespace TEI
+_TAGS = {'w': '{'+TEI_NAMESPACE+'}w', 'pc': '{'+TEI_NAMESPACE+'}pc'}  # nomes completos de <w> e <pc>
 
-# --- 1. Funções de Pré-processamento (mantidas inalteradas) ---
+# --- 1. Tokens compactos ---
+class Token:
+    """
+    Um token de verso. Ocorrências iguais (mesmo texto, tag e atributos)
+    são o mesmo objeto, criado uma vez pela TabelaTokens do processo.
+    `grafia` e `leitura` numeram (texto, tag) e (texto, tag, atributos):
+    comparar e agrupar tokens em collate_line é comparar inteiros.
+    """
+    __slots__ = ('texto', 'comparavel', 'tag', 'atributos', 'attrib', 'grafia', 'leitura')
+
+    def __repr__(self):
+        return f"Token({self.texto!r}, {self.tag!r}, {self.atributos!r})"
+
+class TabelaTokens:
+    """Interna os tokens (e, com eles, os textos e os atributos) de um processo."""
+
+    def __init__(self):
+        self.tokens = []      # Token por leitura
+        self._tokens = {}     # (texto, tag, atributos) -> Token
+        self._grafias = {}    # (texto, tag) -> grafia
+
+    def token(self, texto, tag, atributos=(), comparavel=None):
+        """O Token de (texto, tag, atributos); `atributos` é uma tupla de pares."""
+        chave = (texto, tag, atributos)
+        token = self._tokens.get(chave)
+        if token is None:
+            token = Token()
+            token.texto = sys.intern(texto)
+            token.comparavel = sys.intern(comparavel if comparavel is not None else texto.lower())
+            token.tag = tag
+            token.atributos = atributos
+            token.attrib = dict(atributos)  # pronto para etree.SubElement, que o copia
+            token.grafia = self._grafias.setdefault((texto, tag), len(self._grafias))
+            token.leitura = len(self.tokens)
+            self.tokens.append(token)
+            self._tokens[chave] = token
+        return token
+
+    def com_atributos(self, token, atributos):
+        """O mesmo texto e tag com outros atributos (ex.: herdados da base)."""
+        if token.atributos == atributos:
+            return token
+        return self.token(token.texto, token.tag, atributos, token.comparavel)
+
+TABELA = TabelaTokens()
+
+# '&' das versões antigas: a conjunção "e"
+_E_COMERCIAL = TABELA.token('&', 'w', (('lemma', 'e'), ('pos', 'CCONJ')), comparavel='e')
+
+# --- 1b. Funções de Pré-processamento (mantidas inalteradas) ---
 def preprocess_old_version_l(l_element):
     """
     Extrai o texto de um elemento <l> de uma versão antiga,
     tratando <lb break="no"/> e tokenizando em palavras e pontuação.
-    Retorna uma lista de tuplas (original_text, comparable_text, is_punct, tag, attrs).
+    Retorna uma lista de Tokens (ver TabelaTokens).
     """
     full_text_parts = []
     
@@ -36,149 +101,141 @@ def preprocess_old_version_l(l_element):
     tokens = []
     for match_str in re.findall(r"([^\s.,:;?!&]+|[.,:;?!&])", full_line_text):
         if match_str:
-            original_text = match_str
-            comparable_text = original_text.lower()
-            attrs = {}
-            
-            if original_text == '&':
-                is_punct = False
-                tag = 'w'
-                comparable_text = 'e'
-                attrs = {'lemma': 'e', 'pos': 'CCONJ'}
+            if match_str == '&':
+                tokens.append(_E_COMERCIAL)
             else:
-                is_punct = bool(re.match(r"[.,:;?!&]", original_text))
-                tag = 'pc' if is_punct else 'w'
-            
-            tokens.append((original_text, comparable_text, is_punct, tag, attrs))
+                is_punct = bool(re.match(r"[.,:;?!&]", match_str))
+                tokens.append(TABELA.token(match_str, 'pc' if is_punct else 'w'))
         
     return tokens
 
 def preprocess_modern_l(l_element):
     """
     Extrai tokens de um elemento <l> da versão modernizada.
-    Retorna uma lista de tuplas (tag, original_text, comparable_text, is_punct, attrs).
+    Retorna uma lista de Tokens (ver TabelaTokens), com os atributos de cada <w>/<pc>.
     """
     tokens = []
-    for child in l_element.xpath('./tei:w | ./tei:pc', namespaces={'tei': TEI_NAMESPACE}):
-        tag = child.tag.split('}')[-1]
-        original_text = child.text
-        comparable_text = original_text.lower()
-        is_punct = (tag == 'pc')
-        attrs = child.attrib
-        tokens.append((tag, original_text, comparable_text, is_punct, attrs))
+    for child in l_element.iterchildren(_TAGS['w'], _TAGS['pc']):
+        tag = 'w' if child.tag == _TAGS['w'] else 'pc'
+        tokens.append(TABELA.token(child.text, tag, tuple(child.attrib.items())))
     return tokens
 
-def _align_target_to_base(base_tokens_full, target_tokens_full, base_comparable, target_comparable):
-    matcher = SequenceMatcher(None, base_comparable, target_comparable)
-    
-    aligned_target = [None] * len(base_comparable)
-    insertions_before_base_idx = []
-
-    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-        if tag == 'equal':
-            for k in range(i2 - i1):
-                aligned_target[i1 + k] = target_tokens_full[j1 + k]
-        elif tag == 'replace':
-            len_base_block = i2 - i1
-            len_target_block = j2 - j1
-            
-            for k in range(len_base_block):
-                if k < len_target_block:
-                    aligned_target[i1 + k] = target_tokens_full[j1 + k]
-            
-            if len_target_block > len_base_block:
-                insertions_before_base_idx.append((i2, target_tokens_full[j1 + len_base_block:j2]))
-        elif tag == 'insert':
-            insertions_before_base_idx.append((i1, target_tokens_full[j1:j2]))
-
-    return aligned_target, insertions_before_base_idx
-
-# --- 2. Função Principal de Colação (mantida inalterada, exceto correção de typo) ---
-def collate_lus(modern_xml_path, vesq_xml_path, vdir_xml_path):
-    parser = etree.XMLParser(remove_blank_text=True) 
-    
-    tree_mod = etree.parse(modern_xml_path, parser)
-    tree_vesq = etree.parse(vesq_xml_path, parser)
-    tree_vdir = etree.parse(vdir_xml_path, parser)
-
-    root_mod = tree_mod.getroot()
-    root_vesq = tree_vesq.getroot()
-    root_vdir = tree_vdir.getroot()
-
-    wit_ids = {
-        'VMod': '#VMod',
-        'VEsq': '#VEsq',
-        'VDir': '#VDir'
-    }
-    
-    tei_root = etree.Element('{'+TEI_NAMESPACE+'}TEI', nsmap={'tei': TEI_NAMESPACE, 'xml': XML_NAMESPACE})
-    text_elem = etree.SubElement(tei_root, '{'+TEI_NAMESPACE+'}text')
-    collated_body = etree.SubElement(text_elem, '{'+TEI_NAMESPACE+'}body')
-
+# --- 2. Função Principal de Colação (todos os cantos, em paralelo) ---
+def collate_stanza(estrofe_n, estrofes, wit_ids):
+    """
+    Colaciona uma estrofe verso a verso e retorna o <lg> colacionado.
+    `estrofes` traz o <lg> de cada versão, na ordem de wit_ids (a base
+    primeiro). Uma versão passada como False não tem o canto e fica fora
+    da colação; None é uma estrofe ausente num canto existente.
+    """
     namespaces = {'tei': TEI_NAMESPACE}
+    collated_lg = etree.Element('{'+TEI_NAMESPACE+'}lg', type='estrofe', n=estrofe_n, nsmap={'tei': TEI_NAMESPACE})
+
+    versos = [
+        estrofe.xpath('./tei:l', namespaces=namespaces) if estrofe is not None and estrofe is not False else []
+        for estrofe in estrofes
+    ]
+    max_lines = max(len(v) for v in versos)
+
+    for j in range(max_lines):
+        tokens_por_versao = []
+        for k, (estrofe, versos_k) in enumerate(zip(estrofes, versos)):
+            l_elem = versos_k[j] if j < len(versos_k) else None
+            if estrofe is False:
+                tokens_por_versao.append(None)
+            elif l_elem is None:
+                tokens_por_versao.append([])
+            elif k == 0:
+                tokens_por_versao.append(preprocess_modern_l(l_elem))
+            else:
+                tokens_por_versao.append(preprocess_old_version_l(l_elem))
 
-    canto1_mod = root_mod.xpath('//tei:div[@type="canto" and @n="1"]', namespaces=namespaces)
-    canto1_vesq = root_vesq.xpath('//tei:div[@type="canto" and @n="1"]', namespaces=namespaces)
-    canto1_vdir = root_vdir.xpath('//tei:div[@type="canto" and @n="1"]', namespaces=namespaces)
-
-    if not canto1_mod or not canto1_vesq or not canto1_vdir:
-        raise ValueError("Não foi possível encontrar o Canto 1 em uma ou mais versões. Verifique os caminhos e o XML.")
-
-    canto1_mod = canto1_mod[0]
-    canto1_vesq = canto1_vesq[0]
-    canto1_vdir = canto1_vdir[0]
-    
-    collated_div = etree.SubElement(collated_body, '{'+TEI_NAMESPACE+'}div', type='canto', n='1')
-    
-    head_elements_mod = canto1_mod.xpath('./tei:head', namespaces=namespaces)
-    if head_elements_mod:
-        canto_head_text = head_elements_mod[-1].text
-        new_head = etree.SubElement(collated_div, '{'+TEI_NAMESPACE+'}head')
-        new_head.text = canto_head_text
-    
-    estrofes_mod = canto1_mod.xpath('./tei:lg[@type="estrofe"]', namespaces=namespaces)
-    estrofes_vesq = canto1_vesq.xpath('./tei:lg[@type="estrofe"]', namespaces=namespaces)
-    estrofes_vdir = canto1_vdir.xpath('./tei:lg[@type="estrofe"]', namespaces=namespaces)
-
-    if not estrofes_mod or not estrofes_vesq or not estrofes_vdir:
-        raise ValueError("Não foi possível encontrar estrofes em uma ou mais versões do Canto 1.")
-
-    max_estrofes = max(len(estrofes_mod), len(estrofes_vesq), len(estrofes_vdir))
-
-    for i in range(max_estrofes):
-        estrofe_mod = estrofes_mod[i] if i < len(estrofes_mod) else None
-        estrofe_vesq = estrofes_vesq[i] if i < len(estrofes_vesq) else None
-        estrofe_vdir = estrofes_vdir[i] if i < len(estrofes_vdir) else None
-
-        estrofe_n = estrofe_mod.get('n') if estrofe_mod is not None else \
-                    (estrofe_vesq.get('n') if estrofe_vesq is not None else (estrofe_vdir.get('n') if estrofe_vdir is not None else None))
-        
-        if estrofe_n is None: continue
-
-        collated_lg = etree.SubElement(collated_div, '{'+TEI_NAMESPACE+'}lg', type='estrofe', n=estrofe_n)
+        collated_lg.append(collate_line(tokens_por_versao, wit_ids))
 
-        versos_mod = estrofe_mod.xpath('./tei:l', namespaces=namespaces) if estrofe_mod is not None else []
-        versos_vesq = estrofe_vesq.xpath('./tei:l', namespaces=namespaces) if estrofe_vesq is not None else []
-        versos_vdir = estrofe_vdir.xpath('./tei:l', namespaces=namespaces) if estrofe_vdir is not None else []
-        
-        max_lines = max(len(versos_mod), len(versos_vesq), len(versos_vdir))
+    return collated_lg
 
-        for j in range(max_lines):
-            l_mod = versos_mod[j] if j < len(versos_mod) else None
-            l_vesq = versos_vesq[j] if j < len(versos_vesq) else None
-            l_vdir = versos_vdir[j] if j < len(versos_vdir) else None
+def _collate_stanza_worker(task):
+    """Executa collate_stanza sobre estrofes serializadas (num processo do pool ou no atual)."""
+    estrofe_n, xml_estrofes, wit_ids = task
+    parser = etree.XMLParser(remove_blank_text=True)
+    estrofes = [
+        etree.fromstring(xml, parser) if isinstance(xml, bytes) else xml
+        for xml in xml_estrofes
+    ]
+    return etree.tostring(collate_stanza(estrofe_n, estrofes, wit_ids))
 
-            tokens_mod_full = preprocess_modern_l(l_mod) if l_mod is not None else []
-            tokens_vesq_full = preprocess_old_version_l(l_vesq) if l_vesq is not None else []
-            tokens_vdir_full = preprocess_old_version_l(l_vdir) if l_vdir is not None else []
+def _collate_stanzas_worker(tasks):
+    """Um lote de estrofes por viagem ao pool."""
+    return [_collate_stanza_worker(task) for task in tasks]
 
-            collated_l = collate_line(tokens_mod_full, tokens_vesq_full, tokens_vdir_full, wit_ids)
-            collated_lg.append(collated_l)
+# --- Cache incremental: um <lg> colacionado por hash das entradas ---
+class _CacheEstrofes:
+    """
+    Fragmentos <lg> já colacionados, em cache_dir/fragmentos/<hash>.xml.
+    O hash cobre a estrofe de cada versão, os ids das versões e o código
+    da colação (este arquivo e alinhador.py), de
+    modo que corrigir um erro numa versão só invalida as estrofes tocadas.
+    manifesto.json guarda o hash de cada posição (canto.estrofe) da última
+    execução; fragmentos que nenhuma posição usa são apagados.
+    """
 
-    tei_header = etree.SubElement(tei_root, '{'+TEI_NAMESPACE+'}teiHeader')
+    def __init__(self, cache_dir, wit_ids):
+        self.pasta = Path(cache_dir)
+        self.fragmentos = self.pasta / 'fragmentos'
+        self.fragmentos.mkdir(parents=True, exist_ok=True)
+        codigo = hashlib.sha1()
+        for modulo in (__file__, alinhador.__file__):
+            codigo.update(Path(modulo).read_bytes())
+        self.prefixo = f"{codigo.hexdigest()}|{sorted(wit_ids.items())}|".encode()
+        self.atuais = {}
+
+    def chave(self, task):
+        estrofe_n, xml_estrofes = task[0], task[1]
+        h = hashlib.sha1(self.prefixo)
+        h.update(str(estrofe_n).encode())
+        for xml in xml_estrofes:
+            # False (sem o canto) e None (sem a estrofe) também entram no hash
+            h.update(b'\0' + (xml if isinstance(xml, bytes) else repr(xml).encode()))
+        return h.hexdigest()
+
+    def _arquivo(self, chave):
+        return self.fragmentos / f"{chave}.xml"
+
+    def contem(self, chave):
+        return self._arquivo(chave).exists()
+
+    def ler(self, chave):
+        return self._arquivo(chave).read_bytes()
+
+    def gravar(self, chave, lg_xml):
+        # grava e renomeia: uma execução interrompida não deixa fragmento pela metade
+        temporario = self._arquivo(chave).with_suffix('.tmp')
+        temporario.write_bytes(lg_xml)
+        os.replace(temporario, self._arquivo(chave))
+
+    def usar(self, posicao, chave):
+        self.atuais[posicao] = chave
+
+    def gravar_manifesto(self):
+        arquivo = self.pasta / 'manifesto.json'
+        try:
+            manifesto = json.loads(arquivo.read_text('utf-8'))
+        except (OSError, ValueError):
+            manifesto = {}
+        # uma execução com --cantos mantém as posições dos outros cantos
+        manifesto.update(self.atuais)
+        arquivo.write_text(json.dumps(manifesto, indent=0, sort_keys=True), encoding='utf-8')
+
+        usados = set(manifesto.values())
+        for fragmento in self.fragmentos.glob('*.xml'):
+            if fragmento.stem not in usados:
+                fragmento.unlink()
+
+def _tei_header(wit_ids):
+    tei_header = etree.Element('{'+TEI_NAMESPACE+'}teiHeader', nsmap={'tei': TEI_NAMESPACE})
     file_desc = etree.SubElement(tei_header, '{'+TEI_NAMESPACE+'}fileDesc')
     title_stmt = etree.SubElement(file_desc, '{'+TEI_NAMESPACE+'}titleStmt') # Correção do typo: file_header para file_desc
-    etree.SubElement(title_stmt, '{'+TEI_NAMESPACE+'}title').text = 'Os Lusíadas Colacionado (VMod, VEsq, VDir)'
+    etree.SubElement(title_stmt, '{'+TEI_NAMESPACE+'}title').text = f'Os Lusíadas Colacionado ({", ".join(wit_ids)})'
     publication_stmt = etree.SubElement(file_desc, '{'+TEI_NAMESPACE+'}publicationStmt')
     etree.SubElement(publication_stmt, '{'+TEI_NAMESPACE+'}p').text = 'Colação automatizada.'
     
@@ -188,169 +245,340 @@ def collate_lus(modern_xml_path, vesq_xml_path, vdir_xml_path):
     for wit_key, wit_uri in wit_ids.items():
         person = etree.SubElement(partic_desc, '{'+TEI_NAMESPACE+'}person', {etree.QName(XML_NAMESPACE, "id"): wit_key.lstrip('#')})
         etree.SubElement(person, '{'+TEI_NAMESPACE+'}persName').text = f'Versão {wit_key.lstrip("#")}'
+    return tei_header
 
-    return etree.tostring(tei_root, pretty_print=True, encoding='utf-8', xml_declaration=True).decode('utf-8')
-
-# --- collate_line (MODIFICADA para <w>/<pc> dentro de <rdg> E tratamento de atributos/inserções) ---
-def collate_line(tokens_mod_full, tokens_vesq_full, tokens_vdir_full, wit_ids):
-    collated_l = etree.Element('{'+TEI_NAMESPACE+'}l')
+def _cantos(caminho, incluir=None):
+    """
+    (canto, título, [(@n, <lg> serializado), ...]) para cada canto da versão, em
+    ordem, lidos com leitor_tei: só um canto fica na memória, e como bytes.
+    O título é o texto do último <head> do canto (None se não houver).
+    `incluir` restringe os cantos lidos; a leitura para depois do último.
+    """
+    faltam = set(incluir) if incluir is not None else None
+    atual, titulo, estrofes = None, None, []
+    for registro in leitor_tei.iterar_estrofes(caminho, titulos=True):
+        if registro.canto != atual:
+            if atual is not None and (incluir is None or atual in incluir):
+                yield atual, titulo, estrofes
+                if faltam is not None:
+                    faltam.discard(atual)
+                    if not faltam:
+                        return
+            atual, titulo, estrofes = registro.canto, None, []
+        if incluir is not None and registro.canto not in incluir:
+            continue
+        if registro.estrofe is None:
+            titulo = registro.elemento.text or ''
+        else:
+            estrofes.append((registro.estrofe, etree.tostring(registro.elemento, with_tail=False)))
+    if atual is not None and (incluir is None or atual in incluir):
+        yield atual, titulo, estrofes
 
-    mod_comparable = [t[2] for t in tokens_mod_full]
-    esq_comparable = [t[1] for t in tokens_vesq_full] 
-    dir_comparable = [t[1] for t in tokens_vdir_full]
-
-    aligned_esq_to_mod, esq_inserts = _align_target_to_base(tokens_mod_full, tokens_vesq_full, mod_comparable, esq_comparable)
-    aligned_dir_to_mod, dir_inserts = _align_target_to_base(tokens_mod_full, tokens_vdir_full, mod_comparable, dir_comparable)
-
-    all_inserts_data = []
-    # Inserções são blocos de tokens, vamos mantê-los como blocos para agrupamento
-    for base_idx, ins_tokens_list in esq_inserts:
-        all_inserts_data.append((base_idx, 'VEsq', ins_tokens_list))
-    for base_idx, ins_tokens_list in dir_inserts:
-        all_inserts_data.append((base_idx, 'VDir', ins_tokens_list))
-    all_inserts_data.sort(key=lambda x: x[0])
-
-    insert_ptr = 0
-
-    for mod_idx in range(len(tokens_mod_full) + 1):
-        current_insert_blocks = {} # {block_representation_tuple: [list_of_wit_ids]}
-        # Agrupar inserções no mesmo ponto da base
-        while insert_ptr < len(all_inserts_data) and all_inserts_data[insert_ptr][0] == mod_idx:
-            _, source_wit, inserted_tokens_full_data_block = all_inserts_data[insert_ptr]
-            
-            # CRIAR REPRESENTAÇÃO HASHABLE DO BLOCO DE TOKENS
-            # Cada token_data é (original_text, comparable_text, is_punct, tag, attrs)
-            # Precisamos converter 'attrs' para frozenset para que o tuple seja hashable.
-            hashable_block_parts = []
-            for token_data in inserted_tokens_full_data_block:
-                # Assuming token_data is (original_text, comparable_text, is_punct, tag, attrs)
-                # Ensure attrs is the last element and is a dict
-                if len(token_data) == 5 and isinstance(token_data[4], dict):
-                    hashable_token = token_data[:-1] + (frozenset(token_data[4].items()),)
-                else: # Fallback if attrs is not a dict or token structure is different
-                    hashable_token = tuple(token_data)
-                hashable_block_parts.append(hashable_token)
-            
-            block_representation = tuple(hashable_block_parts) # This tuple of tuples is now hashable
-            
-            current_insert_blocks.setdefault(block_representation, []).append(wit_ids[source_wit])
-            insert_ptr += 1
-
-        if current_insert_blocks:
-            app = etree.Element('{'+TEI_NAMESPACE+'}app')
-            collated_l.append(app)
-            
-            # Adicionar o rdg vazio para VMod primeiro
-            rdg_mod_empty = etree.SubElement(app, '{'+TEI_NAMESPACE+'}rdg', wit=wit_ids['VMod'])
-            
-            # Criar rdgs agrupados para as inserções (não VMod)
-            # current_insert_blocks: {block_representation_tuple: [list_of_wit_ids]}
-            
-            # Ordenar keys para consistência, garantindo que não seja a VMod (já tratada)
-            # e que keys vazias ou None sejam tratadas.
-            ordered_insert_keys = sorted(current_insert_blocks.keys(), 
-                                         key=lambda k: (0 if k else 1, str(k))) # 0 para não-vazio, 1 para vazio, depois lexicográfico
-            
-            for block_key in ordered_insert_keys:
-                wits_list = current_insert_blocks[block_key]
-                # Não criar rdg para VMod aqui, já foi feito
-                if wit_ids['VMod'] in wits_list:
-                    continue 
-
-                rdg = etree.SubElement(app, '{'+TEI_NAMESPACE+'}rdg', wit=" ".join(sorted(wits_list)))
-                
-                # Reconstruir os elementos <w> ou <pc> a partir do block_key
-                for token_data_tuple in block_key:
-                    original_text = token_data_tuple[0]
-                    tag_type = token_data_tuple[3]
-                    # attrs aqui é um frozenset, precisa converter de volta para dict
-                    attrs = dict(token_data_tuple[4])
-                    
-                    inner_elem = etree.Element('{'+TEI_NAMESPACE+'}' + tag_type, attrs)
-                    inner_elem.text = original_text
-                    rdg.append(inner_elem)
-            
-
-        if mod_idx < len(tokens_mod_full):
-            mod_token = tokens_mod_full[mod_idx]
-            esq_token = aligned_esq_to_mod[mod_idx]
-            dir_token = aligned_dir_to_mod[mod_idx]
-
-            mod_original_text = mod_token[1]
-            esq_original_text = esq_token[0] if esq_token else None
-            dir_original_text = dir_token[0] if dir_token else None
-
-            mod_tag = mod_token[0]
-            mod_attrs = mod_token[4]
-
-            esq_tag = esq_token[3] if esq_token else None
-            esq_attrs = esq_token[4] if esq_token else {}
-            dir_tag = dir_token[3] if dir_token else None
-            dir_attrs = dir_token[4] if dir_token else {}
-
-
-            if (esq_original_text is not None and dir_original_text is not None and
-                mod_original_text == esq_original_text and 
-                mod_original_text == dir_original_text and
-                mod_tag == esq_tag and mod_tag == dir_tag): 
-                
-                elem = etree.Element('{'+TEI_NAMESPACE+'}' + mod_tag, mod_attrs)
-                elem.text = mod_original_text
-                collated_l.append(elem)
+def _procurar_canto(fluxo, lidos, canto_n):
+    """
+    Estrofes do canto pedido numa versão, avançando o fluxo de _cantos;
+    os cantos que ficam para trás são guardados em `lidos` (nas versões
+    na mesma ordem da base, no máximo um). False se a versão não o tem.
+    """
+    while canto_n not in lidos:
+        outro = next(fluxo, None)
+        if outro is None:
+            return False
+        lidos[outro[0]] = outro[2]
+    return lidos.pop(canto_n)
+
+def _tarefas(paths, wit_ids, cantos):
+    """
+    ((canto, título, posição), tarefa) para cada estrofe, na ordem do poema,
+    lendo as versões em paralelo, canto a canto.
+    """
+    incluir = {str(c) for c in cantos} if cantos is not None else None
+    fluxos = [_cantos(path, incluir) for path in paths.values()]
+    lidos = [{} for _ in fluxos]
+
+    algum = False
+    for canto_n, titulo, estrofes_base in fluxos[0]:
+        algum = True
+        if not estrofes_base:
+            raise ValueError(f"Não foi possível encontrar estrofes na versão base do Canto {canto_n}.")
+
+        # False: a versão não tem este canto e fica fora da colação dele
+        estrofes_por_versao = [estrofes_base] + [
+            _procurar_canto(fluxo, lidos_k, canto_n) for fluxo, lidos_k in zip(fluxos[1:], lidos[1:])
+        ]
+        max_estrofes = max(len(e) for e in estrofes_por_versao if e is not False)
+
+        for i in range(max_estrofes):
+            estrofes = [
+                False if estrofes_k is False else (estrofes_k[i] if i < len(estrofes_k) else None)
+                for estrofes_k in estrofes_por_versao
+            ]
+            # o @n vem da primeira versão que tem a estrofe
+            estrofe_n = next(
+                (e[0] for e in estrofes if e is not None and e is not False),
+                None,
+            )
+            if estrofe_n is None: continue
+
+            xml_estrofes = [e if e is None or e is False else e[1] for e in estrofes]
+            yield (canto_n, titulo, f"{canto_n}.{i + 1}"), (estrofe_n, xml_estrofes, wit_ids)
+
+    if not algum:
+        raise ValueError("Não foi possível encontrar cantos na versão base. Verifique os caminhos e o XML.")
+
+LOTE = 16     # estrofes por viagem ao pool
+JANELA = 512  # estrofes no máximo entre a leitura e a gravação
+
+class _Entrada:
+    """Uma estrofe entre a leitura e a gravação."""
+    __slots__ = ('meta', 'chave', 'lg_xml', 'futuro', 'indice', 'do_cache')
+
+    def __init__(self, meta, chave):
+        self.meta, self.chave = meta, chave
+        self.lg_xml = self.futuro = self.indice = None
+        self.do_cache = False
+
+def _colacionar_em_ordem(tarefas, processos=None, cache=None, contagem=None):
+    """
+    (meta, <lg> colacionado em bytes) para cada (meta, tarefa), na mesma
+    ordem. As estrofes vão ao pool em lotes de LOTE, com no máximo JANELA
+    estrofes em andamento; as que estão no cache não são colacionadas, e
+    as colacionadas entram no cache. O pool só é criado quando se junta
+    um lote inteiro: poucas estrofes alteradas são colacionadas no
+    processo atual. `contagem` recebe quantas foram colacionadas e quantas
+    vieram do cache.
+    """
+    contagem = contagem if contagem is not None else {}
+    contagem.update(colacionadas=0, cache=0)
+
+    with ExitStack() as pilha:
+        executor = None
+        fila = deque()  # _Entrada, na ordem do poema
+        lote = []       # (_Entrada, tarefa) ainda não enviadas
+
+        def enviar(no_processo_atual=False):
+            nonlocal executor
+            if not lote:
+                return
+            tarefas_lote = [tarefa for _, tarefa in lote]
+            if processos == 0 or no_processo_atual:
+                for (entrada, _), lg_xml in zip(lote, _collate_stanzas_worker(tarefas_lote)):
+                    entrada.lg_xml = lg_xml
+            else:
+                if executor is None:
+                    executor = pilha.enter_context(ProcessPoolExecutor(max_workers=processos))
+                futuro = executor.submit(_collate_stanzas_worker, tarefas_lote)
+                for indice, (entrada, _) in enumerate(lote):
+                    entrada.futuro, entrada.indice = futuro, indice
+            lote.clear()
+
+        def prontas(ate):
+            while len(fila) > ate:
+                entrada = fila.popleft()
+                if entrada.lg_xml is None:
+                    if entrada.futuro is None:
+                        enviar(no_processo_atual=executor is None)
+                    if entrada.lg_xml is None:
+                        entrada.lg_xml = entrada.futuro.result()[entrada.indice]
+                # colacionada aqui ou num lote enviado antes: entra no cache
+                if cache is not None and not entrada.do_cache:
+                    cache.gravar(entrada.chave, entrada.lg_xml)
+                yield entrada.meta, entrada.lg_xml
+
+        for meta, tarefa in tarefas:
+            entrada = _Entrada(meta, cache.chave(tarefa) if cache is not None else None)
+            if cache is not None:
+                cache.usar(meta[2], entrada.chave)
+            if cache is not None and cache.contem(entrada.chave):
+                entrada.lg_xml = cache.ler(entrada.chave)
+                entrada.do_cache = True
+                contagem['cache'] += 1
             else:
-                app = etree.Element('{'+TEI_NAMESPACE+'}app')
-                collated_l.append(app)
-
-                grouped_rdgs = {} 
-                
-                # Para VMod
-                mod_key = (mod_original_text, mod_tag, frozenset(mod_attrs.items()))
-                grouped_rdgs.setdefault(mod_key, []).append(wit_ids['VMod'])
-                
-                # Para VEsq
-                if esq_original_text is not None:
-                    esq_key_attrs = mod_attrs if esq_tag == 'w' else esq_attrs # Usar attrs da VMod se for palavra, senão os próprios (e.g. &)
-                    esq_key = (esq_original_text, esq_tag, frozenset(esq_key_attrs.items()))
-                else: # rdg vazio
-                    esq_key = (None, None, frozenset())
-                grouped_rdgs.setdefault(esq_key, []).append(wit_ids['VEsq'])
-
-                # Para VDir
-                if dir_original_text is not None:
-                    dir_key_attrs = mod_attrs if dir_tag == 'w' else dir_attrs # Usar attrs da VMod se for palavra, senão os próprios (e.g. &)
-                    dir_key = (dir_original_text, dir_tag, frozenset(dir_key_attrs.items()))
-                else: # rdg vazio
-                    dir_key = (None, None, frozenset())
-                grouped_rdgs.setdefault(dir_key, []).append(wit_ids['VDir'])
-
-                ordered_keys = sorted(grouped_rdgs.keys(), 
-                                      key=lambda k: (0 if k[0] is not None and wit_ids['VMod'] in grouped_rdgs[k] else 
-                                                     (2 if k[0] is None else 1),
-                                                     k[0] or ''))
-
-                for key in ordered_keys:
-                    text_val, tag_type_val, attrs_tuple = key
-                    wits_list = grouped_rdgs[key]
-                    
-                    rdg = etree.SubElement(app, '{'+TEI_NAMESPACE+'}rdg', wit=" ".join(sorted(wits_list)))
-                    
-                    if text_val is not None:
-                        inner_elem = etree.Element('{'+TEI_NAMESPACE+'}' + tag_type_val, dict(attrs_tuple))
-                        inner_elem.text = text_val
-                        rdg.append(inner_elem)
+                lote.append((entrada, tarefa))
+                contagem['colacionadas'] += 1
+                if len(lote) == LOTE:
+                    enviar()
+            fila.append(entrada)
+            yield from prontas(JANELA)
 
-    return collated_l
+        yield from prontas(0)
 
-# --- Exemplo de Uso (mantido inalterado) ---
-modern_file_path = 'LusiadasModernizadoLematizado.xml'
-vesq_file_path = 'LusiadasEsquerda.xml'
-vdir_file_path = 'LusiadasDireita.xml'
+def collate_witnesses(base_xml_path, witness_xml_paths, saida=None, base_id='VMod', processos=None, cantos=None,
+                      cache_dir=None):
+    """
+    Colaciona todos os cantos da versão base (etiquetada, com <w>/<pc>;
+    ou só os de `cantos`) com qualquer número de versões antigas, dadas
+    em `witness_xml_paths` como {id: caminho}. As versões são lidas canto
+    a canto (leitor_tei), as estrofes distribuídas entre `processos`
+    processos (padrão: um por núcleo; 0 = no processo atual) e gravadas em
+    `saida` (caminho ou arquivo binário) na ordem do poema, à medida que
+    ficam prontas; sem `saida`, retorna o XML como string.
+    Com `cache_dir`, só são colacionadas as estrofes cujas entradas
+    mudaram desde a última execução; as demais vêm do cache.
+    """
+    if saida is None:
+        buffer = io.BytesIO()
+        collate_witnesses(base_xml_path, witness_xml_paths, buffer, base_id, processos, cantos,
+                          cache_dir)
+        return buffer.getvalue().decode('utf-8')
+
+    paths = {base_id: base_xml_path, **witness_xml_paths}
+    wit_ids = {wit_key: '#' + wit_key for wit_key in paths}
+    namespaces = {'tei': TEI_NAMESPACE}
 
-collated_xml = collate_lus(modern_file_path, vesq_file_path, vdir_file_path)
+    cache = _CacheEstrofes(cache_dir, wit_ids) if cache_dir is not None else None
+    contagem = {}
+    resultados = _colacionar_em_ordem(_tarefas(paths, wit_ids, cantos), processos, cache, contagem)
+
+    with escritor_tei.documento(saida, '{'+TEI_NAMESPACE+'}TEI', nsmap=namespaces) as escrita:
+        with escritor_tei.elemento(escrita, 1, '{'+TEI_NAMESPACE+'}text'):
+            with escritor_tei.elemento(escrita, 2, '{'+TEI_NAMESPACE+'}body'):
+                for (canto_n, titulo), grupo in groupby(resultados, key=lambda r: r[0][:2]):
+                    with escritor_tei.elemento(escrita, 3, '{'+TEI_NAMESPACE+'}div', {'type': 'canto', 'n': canto_n}):
+                        if titulo is not None:
+                            new_head = etree.Element('{'+TEI_NAMESPACE+'}head', nsmap=namespaces)
+                            new_head.text = titulo or None
+                            escritor_tei.escrever(escrita, new_head, 4)
+                        for meta, lg_xml in grupo:
+                            escritor_tei.escrever(escrita, etree.fromstring(lg_xml), 4)
+        escritor_tei.escrever(escrita, _tei_header(wit_ids), 1)
+
+    if cache is not None:
+        cache.gravar_manifesto()
+        print(f"{contagem['colacionadas']} estrofes colacionadas, {contagem['cache']} do cache em '{cache_dir}'.")
+
+def collate_lus(modern_xml_path, vesq_xml_path, vdir_xml_path, saida=None, processos=None, cantos=None,
+                cache_dir=None):
+    """Colação das três versões do projeto (VMod, VEsq, VDir); ver collate_witnesses."""
+    return collate_witnesses(
+        modern_xml_path,
+        {'VEsq': vesq_xml_path, 'VDir': vdir_xml_path},
+        saida, processos=processos, cantos=cantos, cache_dir=cache_dir,
+    )
+
+# --- collate_line: N versões alinhadas em colunas (alinhador.alinhar_testemunhas) ---
+def _append_token(parent, token):
+    elem = etree.SubElement(parent, _TAGS.get(token.tag) or '{'+TEI_NAMESPACE+'}' + token.tag, token.attrib)
+    elem.text = token.texto
+
+def _ordem_bloco(bloco):
+    return str(tuple((token.texto, token.tag, token.atributos) for token in bloco))
+
+def collate_line(tokens_por_versao, wit_ids):
+    """
+    Colaciona um verso. `tokens_por_versao` segue a ordem de wit_ids: o
+    primeiro item são os tokens da base (preprocess_modern_l), os demais
+    das versões antigas (preprocess_old_version_l); None marca uma versão
+    sem o trecho, que não entra em nenhum <rdg>.
+
+    Colunas da base viram o próprio <w>/<pc> quando todas as versões
+    concordam, ou um <app> com um <rdg> por leitura. Colunas sem token na
+    base (inserções) são agrupadas num <app> cujo primeiro <rdg>, vazio,
+    é o da base; como na colação par a par, as versões sem a inserção não
+    aparecem nesse <app>.
+    """
+    collated_l = etree.Element('{'+TEI_NAMESPACE+'}l')
+    wit_keys = list(wit_ids)
+    base_key = wit_keys[0]
+    presentes = [k for k, tokens in enumerate(tokens_por_versao) if tokens is not None]
+
+    comparaveis = [
+        None if tokens is None else [t.comparavel for t in tokens]
+        for tokens in tokens_por_versao
+    ]
+    colunas = alinhar_testemunhas(comparaveis)
+
+    def leitura(k, coluna):
+        return None if coluna[k] is None else tokens_por_versao[k][coluna[k]]
+
+    tokens_base = tokens_por_versao[0]
+    outras = presentes[1:]
+    c = 0
+    while c < len(colunas):
+        coluna = colunas[c]
+        if coluna[0] is None:
+            # inserção: junta as colunas seguidas sem token na base
+            fim = c
+            while fim < len(colunas) and colunas[fim][0] is None:
+                fim += 1
+            blocos = {}  # leituras do bloco (inteiros) -> versões
+            for k in outras:
+                bloco = tuple(t.leitura for t in (leitura(k, coluna) for coluna in colunas[c:fim]) if t is not None)
+                blocos.setdefault(bloco, []).append(wit_ids[wit_keys[k]])
+            blocos.pop((), None)
+
+            app = etree.SubElement(collated_l, '{'+TEI_NAMESPACE+'}app')
+            etree.SubElement(app, '{'+TEI_NAMESPACE+'}rdg', wit=wit_ids[base_key])
+            tokens_blocos = {bloco: [TABELA.tokens[i] for i in bloco] for bloco in blocos}
+            for bloco in sorted(blocos, key=lambda b: _ordem_bloco(tokens_blocos[b])):
+                rdg = etree.SubElement(app, '{'+TEI_NAMESPACE+'}rdg', wit=" ".join(sorted(blocos[bloco])))
+                for token in tokens_blocos[bloco]:
+                    _append_token(rdg, token)
+            c = fim
+            continue
+
+        base = tokens_base[coluna[0]]
+        # caso comum: todas as versões têm a mesma grafia da base
+        for k in outras:
+            i = coluna[k]
+            if i is None or tokens_por_versao[k][i].grafia != base.grafia:
+                break
+        else:
+            _append_token(collated_l, base)
+            c += 1
+            continue
+
+        grouped_rdgs = {base.leitura: [wit_ids[base_key]]}
+        for k in outras:
+            t = leitura(k, coluna)
+            if t is None: # rdg vazio
+                key = None
+            elif t.tag == 'w':
+                # palavra: a leitura herda lemma/pos da base
+                key = TABELA.com_atributos(t, base.atributos).leitura
+            else:
+                key = t.leitura
+            grouped_rdgs.setdefault(key, []).append(wit_ids[wit_keys[k]])
+
+        ordered_keys = sorted(grouped_rdgs.keys(),
+                              key=lambda k: (2, '') if k is None else
+                                            (0 if wit_ids[base_key] in grouped_rdgs[k] else 1,
+                                             TABELA.tokens[k].texto))
 
-print(collated_xml)
+        app = etree.SubElement(collated_l, '{'+TEI_NAMESPACE+'}app')
+        for key in ordered_keys:
+            rdg = etree.SubElement(app, '{'+TEI_NAMESPACE+'}rdg', wit=" ".join(sorted(grouped_rdgs[key])))
+            if key is not None:
+                _append_token(rdg, TABELA.tokens[key])
+        c += 1
+
+    return collated_l
 
-output_file_path = 'lus_collated_full.xml'
-with open(output_file_path, 'w', encoding='utf-8') as f:
-    f.write(collated_xml)
-print(f"\nXML colacionado salvo em '{output_file_path}'")
\ No newline at end of file
+# --- Exemplo de Uso ---
+# (o guard é necessário: os processos do pool importam este módulo)
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Colaciona os cantos d'Os Lusíadas (VMod, VEsq, VDir e outras versões).")
+    arg_parser.add_argument("--modernizado", default='LusiadasModernizadoLematizado.xml')
+    arg_parser.add_argument("--esquerda", default='LusiadasEsquerda.xml')
+    arg_parser.add_argument("--direita", default='LusiadasDireita.xml')
+    arg_parser.add_argument("--testemunha", action="append", default=[], metavar="ID=ARQUIVO",
+                            help="Versão adicional a colacionar (pode repetir), ex.: VPrinc=LusiadasPrinceps.xml.")
+    arg_parser.add_argument("--saida", default='lus_collated_full.xml')
+    arg_parser.add_argument("--processos", type=int, default=None,
+                            help="Processos no pool (padrão: um por núcleo; 0 = sem pool).")
+    arg_parser.add_argument("--cantos", type=int, nargs="*", default=None,
+                            help="Colaciona só estes cantos (padrão: todos).")
+    arg_parser.add_argument("--cache", default='.colacao_cache',
+                            help="Pasta do cache de estrofes colacionadas (padrão: .colacao_cache).")
+    arg_parser.add_argument("--sem-cache", action="store_true",
+                            help="Colaciona tudo de novo, sem ler nem gravar o cache.")
+    args = arg_parser.parse_args()
+
+    witness_paths = {'VEsq': args.esquerda, 'VDir': args.direita}
+    for testemunha in args.testemunha:
+        wit_key, _, path = testemunha.partition('=')
+        witness_paths[wit_key] = path
+
+    collate_witnesses(args.modernizado, witness_paths, args.saida, processos=args.processos,
+                      cantos=args.cantos, cache_dir=None if args.sem_cache else args.cache)
+    print(f"\nXML colacionado salvo em '{args.saida}'")
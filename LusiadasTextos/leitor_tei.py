@@ -0,0 +1,156 @@
+"""
+Leitura incremental das versões TEI d'Os Lusíadas com lxml.etree.iterparse.
+
+Os scripts desta pasta não carregam mais a árvore inteira de cada versão:
+percorrem o arquivo uma vez e recebem registros (canto, estrofe, verso,
+elemento), e cada elemento é liberado (clear) assim que o registro
+seguinte é pedido. A memória fica limitada a uma estrofe, qualquer que
+seja o tamanho do arquivo (as versões com fac-símile chegam a dezenas de
+MB).
+
+O elemento de um registro só vale até o próximo: quem precisar dele
+depois deve copiá-lo ou serializá-lo (etree.tostring).
+"""
+import sys
+from collections import namedtuple
+
+from lxml import etree
+
+# canto: @n do <div type="canto"> (a posição, se repetido ou ausente) ou None
+# fora de um canto; estrofe: @n do <lg>; verso: posição do <l> na estrofe
+Registro = namedtuple('Registro', 'canto estrofe verso elemento')
+
+# elementos que só agrupam outros: iterar_blocos os abre e fecha em vez de
+# entregá-los inteiros
+CONTEINERES = {'TEI', 'text', 'front', 'body', 'back', 'group', 'div'}
+
+
+def nome_local(tag):
+    """'{http://www.tei-c.org/ns/1.0}lg' → 'lg'."""
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else None
+
+
+def _liberar(elem):
+    """Libera o elemento e os irmãos anteriores, já consumidos."""
+    elem.clear(keep_tail=True)
+    pai = elem.getparent()
+    if pai is None:  # a raiz: os irmãos são o prólogo, fora da árvore
+        return
+    while elem.getprevious() is not None:
+        del pai[0]
+
+
+def _eventos(caminho):
+    return etree.iterparse(caminho, events=('start', 'end'), remove_blank_text=True)
+
+
+def _iterar(caminho, versos, titulos):
+    cantos_vistos = set()
+    posicao_canto = 0
+    canto = None
+    div_canto = None
+    estrofe = None
+    verso = 0
+    nomes = {}  # tag -> nome local: a maioria dos eventos é <w>/<pc>
+
+    for evento, elem in _eventos(caminho):
+        nome = nomes.get(elem.tag)
+        if nome is None:
+            nome = nomes[elem.tag] = nome_local(elem.tag)
+
+        if evento == 'start':
+            if nome == 'div' and elem.get('type') == 'canto':
+                posicao_canto += 1
+                canto = elem.get('n')
+                if canto is None or canto in cantos_vistos:
+                    # ex.: o segundo "8" em LusiadasDireita.xml, que é o canto 9
+                    print(f"Aviso: canto n={canto!r} repetido em '{caminho}'; usando a posição {posicao_canto}.",
+                          file=sys.stderr)
+                    canto = str(posicao_canto)
+                cantos_vistos.add(canto)
+                div_canto = elem
+            elif nome == 'lg' and elem.get('type') == 'estrofe':
+                estrofe = elem.get('n')
+                verso = 0
+            continue
+
+        if nome == 'l' and versos and estrofe is not None:
+            verso += 1
+            yield Registro(canto, estrofe, verso, elem)
+            _liberar(elem)
+        elif nome == 'lg' and elem.get('type') == 'estrofe':
+            if not versos:
+                yield Registro(canto, estrofe, None, elem)
+            _liberar(elem)
+            estrofe = None
+        elif nome == 'head' and titulos and div_canto is not None and elem.getparent() is div_canto:
+            yield Registro(canto, None, None, elem)
+            _liberar(elem)
+        elif elem is div_canto:
+            _liberar(elem)
+            canto = div_canto = None
+        elif estrofe is None and canto is None and nome not in CONTEINERES:
+            # fora das estrofes e dos cantos (teiHeader, front...): nada a guardar
+            _liberar(elem)
+
+
+def iterar_estrofes(caminho, titulos=False):
+    """
+    Registro(canto, estrofe, None, lg) para cada <lg type="estrofe">, em
+    ordem. Com `titulos`, também Registro(canto, None, None, head) para
+    cada <head> filho de um <div type="canto">.
+    """
+    return _iterar(caminho, versos=False, titulos=titulos)
+
+
+def iterar_versos(caminho):
+    """Registro(canto, estrofe, verso, l) para cada <l> de uma estrofe, em ordem."""
+    return _iterar(caminho, versos=True, titulos=False)
+
+
+def iterar_blocos(caminho):
+    """
+    Percorre o documento inteiro para copiá-lo (ver escritor_tei.copiar),
+    gerando pares (tipo, elemento):
+
+    - ('prologo', no): instrução de processamento ou comentário antes da raiz;
+    - ('abrir', elem) / ('fechar', elem): um contêiner (TEI, text, body,
+      div...) que contém outros blocos; só as tags e os atributos valem;
+    - ('bloco', elem): um elemento completo (uma estrofe, o teiHeader,
+      um <head>), liberado depois de consumido.
+    """
+    eventos = etree.iterparse(caminho, events=('start', 'end', 'pi', 'comment'), remove_blank_text=True)
+    raiz = None
+    abertos = []   # contêineres abertos, do mais externo ao atual
+    bloco = None   # raiz do bloco sendo lido, se houver
+
+    for evento, elem in eventos:
+        if evento in ('pi', 'comment'):
+            if raiz is None:
+                yield 'prologo', elem
+            elif bloco is None and elem.getparent() is abertos[-1]:
+                yield 'bloco', elem
+                _liberar(elem)
+            continue
+
+        if evento == 'start':
+            if raiz is None:
+                raiz = elem
+                abertos.append(elem)
+                yield 'abrir', elem
+            elif bloco is None:
+                if nome_local(elem.tag) in CONTEINERES:
+                    abertos.append(elem)
+                    yield 'abrir', elem
+                else:
+                    bloco = elem
+            continue
+
+        if elem is bloco:
+            yield 'bloco', elem
+            _liberar(elem)
+            bloco = None
+        elif abertos and elem is abertos[-1]:
+            abertos.pop()
+            yield 'fechar', elem
+            _liberar(elem)
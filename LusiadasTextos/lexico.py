@@ -0,0 +1,124 @@
+"""
+Léxico compacto forma -> (lema, POS, MSD), construído a partir dos
+arquivos já etiquetados (a saída do etiquetador e a colação, cujos <w>
+das versões antigas herdam lemma/pos da base) e gravado num arquivo que
+se abre com mmap: a busca é binária sobre o próprio arquivo, sem
+carregá-lo na memória nem montar dicionários.
+
+Formato (inteiros de 32 bits, little-endian):
+
+    MAGICO | n | deslocamentos[n + 1] | registros
+
+Cada registro é "forma\\tlema\\tpos\\tmsd\\tpc" em UTF-8 (pc = "1" para
+pontuação), em ordem crescente dos bytes da forma. Uma forma com mais de
+uma análise fica com a mais frequente.
+
+    python lexico.py --saida lexico.bin LusiadasModernizadoLematizado.xml lus_collated_full.xml
+"""
+import argparse
+import hashlib
+import mmap
+import struct
+from collections import Counter, defaultdict, namedtuple
+
+import leitor_tei
+
+MAGICO = b'LEXLUS1\0'
+_INTEIRO = struct.Struct('<I')
+
+Entrada = namedtuple('Entrada', 'lema pos msd pontuacao')
+
+
+def entradas(caminhos):
+    """(forma, Entrada) de cada <w>/<pc> com @pos dos versos dos arquivos."""
+    for caminho in caminhos:
+        for registro in leitor_tei.iterar_versos(caminho):
+            for elem in registro.elemento.iter():
+                nome = leitor_tei.nome_local(elem.tag)
+                if nome not in ('w', 'pc') or not elem.text or elem.get('pos') is None:
+                    continue
+                pontuacao = nome == 'pc'
+                yield elem.text, Entrada(elem.get('lemma', '' if pontuacao else elem.text.lower()),
+                                         elem.get('pos'), elem.get('msd', ''), pontuacao)
+
+
+def construir(caminhos, destino):
+    """Grava o léxico das formas de `caminhos` em `destino`; retorna o número de formas."""
+    contagens = defaultdict(Counter)
+    for forma, entrada in entradas(caminhos):
+        contagens[forma][entrada] += 1
+
+    registros = []
+    for forma, analises in contagens.items():
+        entrada = analises.most_common(1)[0][0]
+        campos = (forma, entrada.lema, entrada.pos, entrada.msd, '1' if entrada.pontuacao else '')
+        registros.append('\t'.join(campos).encode('utf-8'))
+    # o \t vem antes de qualquer caractere de uma forma: ordenar os
+    # registros é ordenar as formas
+    registros.sort()
+
+    deslocamentos = [0]
+    for registro in registros:
+        deslocamentos.append(deslocamentos[-1] + len(registro))
+
+    with open(destino, 'wb') as f:
+        f.write(MAGICO)
+        f.write(_INTEIRO.pack(len(registros)))
+        f.write(struct.pack(f'<{len(deslocamentos)}I', *deslocamentos))
+        f.writelines(registros)
+    return len(registros)
+
+
+class Lexico:
+    """Um léxico gravado por `construir`, aberto com mmap (só leitura)."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        with open(caminho, 'rb') as f:
+            self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mapa[:len(MAGICO)] != MAGICO:
+            self._mapa.close()
+            raise ValueError(f"'{caminho}' não é um léxico (lexico.construir).")
+        self._n = _INTEIRO.unpack_from(self._mapa, len(MAGICO))[0]
+        self._tabela = len(MAGICO) + _INTEIRO.size
+        self._dados = self._tabela + (self._n + 1) * _INTEIRO.size
+        # identifica o conteúdo (ex.: na chave do cache do etiquetador)
+        self.hash = hashlib.sha1(self._mapa).hexdigest()
+
+    def __len__(self):
+        return self._n
+
+    def _registro(self, i):
+        inicio, fim = struct.unpack_from('<2I', self._mapa, self._tabela + i * _INTEIRO.size)
+        return self._dados + inicio, self._dados + fim
+
+    def buscar(self, forma):
+        """A Entrada da forma, ou None se ela não está no léxico."""
+        chave = forma.encode('utf-8')
+        baixo, alto = 0, self._n
+        while baixo < alto:
+            meio = (baixo + alto) // 2
+            inicio, fim = self._registro(meio)
+            separador = self._mapa.find(b'\t', inicio, fim)
+            atual = self._mapa[inicio:separador]
+            if atual < chave:
+                baixo = meio + 1
+            elif atual > chave:
+                alto = meio
+            else:
+                _, lema, pos, msd, pc = self._mapa[inicio:fim].decode('utf-8').split('\t')
+                return Entrada(lema, pos, msd, pc == '1')
+        return None
+
+    def fechar(self):
+        self._mapa.close()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Constrói o léxico forma -> (lema, POS, MSD) dos arquivos etiquetados.")
+    arg_parser.add_argument("arquivos", nargs="+", help="Arquivos TEI com <w>/<pc> etiquetados.")
+    arg_parser.add_argument("--saida", default='lexico.bin')
+    args = arg_parser.parse_args()
+
+    n = construir(args.arquivos, args.saida)
+    print(f"{n} formas gravadas em '{args.saida}'.")
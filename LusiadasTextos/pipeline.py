@@ -0,0 +1,256 @@
+"""
+Executa a cadeia de scripts da edição (etiquetagem, colação, comparação,
+HTML) como um grafo de etapas com entradas e saídas declaradas.
+
+Uma etapa depende das que produzem suas entradas e só é executada quando
+o conteúdo das entradas, do código (o script e os módulos locais que ele
+importa) ou dos argumentos mudou desde a última execução bem-sucedida,
+ou quando uma saída sumiu ou foi alterada à mão: os hashes ficam em
+.pipeline/estado.json. Etapas independentes rodam em paralelo, cada uma
+num processo Python próprio, com a saída em .pipeline/<etapa>.log.
+
+    python pipeline.py                 # tudo o que estiver desatualizado
+    python pipeline.py colacionar      # só esta etapa e as de que depende
+    python pipeline.py --listar        # o grafo e o que seria executado
+"""
+import argparse
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+PASTA = Path(__file__).resolve().parent
+ESTADO = PASTA / '.pipeline'
+
+MODERNIZADO = 'LusiadasModernizado.xml'
+LEMATIZADO = 'LusiadasModernizadoLematizado.xml'
+ESQUERDA = 'LusiadasEsquerda.xml'
+DIREITA = 'LusiadasDireita.xml'
+COMBINADO = 'LusiadasCombinado.xml'
+
+# `comando`: o script e seus argumentos, relativos a PASTA. Uma etapa
+# `opcional` cujas entradas de origem não existem é ignorada.
+Etapa = namedtuple('Etapa', 'nome comando entradas saidas opcional', defaults=(False,))
+
+ETAPAS = [
+    Etapa('tei_pelicano',
+          ['txt_to_tei.py', '--entrada', 'lusiadas_pelicano_direita.txt',
+           '--saida', 'Lusíadas_pelicano_à_direita_tei.xml'],
+          ['lusiadas_pelicano_direita.txt'], ['Lusíadas_pelicano_à_direita_tei.xml'], opcional=True),
+    Etapa('etiquetar',
+          ['etiquetador.py', '--entrada', MODERNIZADO, '--saida', LEMATIZADO],
+          [MODERNIZADO], [LEMATIZADO]),
+    Etapa('colacionar',
+          ['juntarversoescompleto.py', '--modernizado', LEMATIZADO, '--esquerda', ESQUERDA,
+           '--direita', DIREITA, '--saida', 'lus_collated_full.xml'],
+          [LEMATIZADO, ESQUERDA, DIREITA], ['lus_collated_full.xml']),
+    Etapa('comparar',
+          ['comparacao.py', DIREITA, ESQUERDA, '--saida', 'diferencas.csv'],
+          [DIREITA, ESQUERDA], ['diferencas.csv']),
+    Etapa('combinar',
+          ['juntarversoes.py', '--versao1', DIREITA, '--versao2', ESQUERDA, '--saida', COMBINADO],
+          [DIREITA, ESQUERDA], [COMBINADO]),
+    Etapa('html_combinado',
+          ['xmlToHtml.py', '--entrada', COMBINADO, '--xslt', 'transform.xsl', '--saida', 'output.html'],
+          [COMBINADO, 'transform.xsl'], ['output.html']),
+    Etapa('html_esquerda',
+          ['converterhtml.py', '--entrada', ESQUERDA, '--saida', 'lusiadas.html'],
+          [ESQUERDA], ['lusiadas.html']),
+]
+
+
+def _sha1(caminho):
+    h = hashlib.sha1()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1 << 20), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def modulos_locais(script):
+    """O script e os módulos desta pasta que ele importa, direta ou indiretamente."""
+    vistos = set()
+    pendentes = [script]
+    while pendentes:
+        nome = pendentes.pop()
+        if nome in vistos or not (PASTA / nome).exists():
+            continue
+        vistos.add(nome)
+        for no in ast.walk(ast.parse((PASTA / nome).read_bytes())):
+            if isinstance(no, ast.Import):
+                pendentes += [f"{alias.name.split('.')[0]}.py" for alias in no.names]
+            elif isinstance(no, ast.ImportFrom) and no.module and not no.level:
+                pendentes.append(f"{no.module.split('.')[0]}.py")
+    return sorted(vistos)
+
+
+def chave(etapa):
+    """Hash do que determina as saídas: comando, código e conteúdo das entradas."""
+    h = hashlib.sha1(json.dumps(etapa.comando).encode())
+    for nome in modulos_locais(etapa.comando[0]) + list(etapa.entradas):
+        h.update(f"\0{nome}\0{_sha1(PASTA / nome)}".encode())
+    return h.hexdigest()
+
+
+def em_dia(etapa, estado):
+    """True se a última execução teve a mesma chave e as saídas não mudaram desde então."""
+    anterior = estado.get(etapa.nome)
+    if anterior is None or anterior['chave'] != chave(etapa):
+        return False
+    return all((PASTA / nome).exists() and _sha1(PASTA / nome) == anterior['saidas'].get(nome)
+               for nome in etapa.saidas)
+
+
+def ordenar(etapas, alvos=None):
+    """
+    {nome: nomes das etapas de que depende}, restrito aos `alvos` e suas
+    dependências. Falha se duas etapas produzem a mesma saída ou se há ciclo.
+    """
+    produtor = {}
+    for etapa in etapas:
+        for saida in etapa.saidas:
+            if saida in produtor:
+                raise ValueError(f"'{saida}' é saída de '{produtor[saida]}' e de '{etapa.nome}'.")
+            produtor[saida] = etapa.nome
+    dependencias = {
+        etapa.nome: {produtor[e] for e in etapa.entradas if e in produtor}
+        for etapa in etapas
+    }
+
+    if alvos:
+        desconhecidos = set(alvos) - set(dependencias)
+        if desconhecidos:
+            raise ValueError(f"Etapas desconhecidas: {', '.join(sorted(desconhecidos))}.")
+        incluidas, pendentes = set(), list(alvos)
+        while pendentes:
+            nome = pendentes.pop()
+            if nome not in incluidas:
+                incluidas.add(nome)
+                pendentes += dependencias[nome]
+        dependencias = {nome: deps for nome, deps in dependencias.items() if nome in incluidas}
+
+    # ciclo: alguma etapa nunca fica sem dependências pendentes
+    restantes = {nome: set(deps) for nome, deps in dependencias.items()}
+    while restantes:
+        livres = [nome for nome, deps in restantes.items() if not deps]
+        if not livres:
+            raise ValueError(f"Ciclo entre as etapas: {', '.join(sorted(restantes))}.")
+        for nome in livres:
+            del restantes[nome]
+        for deps in restantes.values():
+            deps.difference_update(livres)
+    return dependencias
+
+
+def _executar(etapa):
+    """Roda o comando da etapa; retorna (código de saída, segundos)."""
+    ESTADO.mkdir(exist_ok=True)
+    inicio = time.perf_counter()
+    with open(ESTADO / f"{etapa.nome}.log", 'wb') as log:
+        processo = subprocess.run([sys.executable, *etapa.comando], cwd=PASTA, stdout=log,
+                                  stderr=subprocess.STDOUT)
+    return processo.returncode, time.perf_counter() - inicio
+
+
+def executar(etapas, alvos=None, processos=None, forcar=False, listar=False):
+    """
+    Executa as etapas desatualizadas (todas, com `forcar`) na ordem do
+    grafo, até `processos` ao mesmo tempo. Retorna {nome: (situação, segundos)}.
+    """
+    por_nome = {etapa.nome: etapa for etapa in etapas}
+    dependencias = ordenar(etapas, alvos)
+    arquivo_estado = ESTADO / 'estado.json'
+    try:
+        estado = json.loads(arquivo_estado.read_text('utf-8'))
+    except (OSError, ValueError):
+        estado = {}
+
+    resultado = {}
+    pendentes = dict(dependencias)
+    rodando = {}
+
+    def gravar_estado():
+        ESTADO.mkdir(exist_ok=True)
+        arquivo_estado.write_text(json.dumps(estado, indent=1, sort_keys=True), encoding='utf-8')
+
+    def prontas():
+        """Decide as etapas cujas dependências terminaram; devolve as que precisam rodar."""
+        a_rodar = []
+        decididas = True
+        while decididas:
+            decididas = [nome for nome, deps in pendentes.items() if deps <= resultado.keys()]
+            for nome in decididas:
+                deps = pendentes.pop(nome)
+                etapa = por_nome[nome]
+                faltando = [e for e in etapa.entradas if not (PASTA / e).exists()]
+                if any(resultado[d][0] in ('falhou', 'bloqueada') for d in deps):
+                    resultado[nome] = ('bloqueada', 0.0)
+                elif listar and any(resultado[d][0] == 'a executar' for d in deps):
+                    resultado[nome] = ('a executar', 0.0)
+                elif faltando:
+                    situacao = 'ignorada' if etapa.opcional else 'falhou'
+                    resultado[nome] = (situacao, 0.0)
+                    print(f"{nome}: sem {', '.join(faltando)} ({situacao}).")
+                elif not forcar and em_dia(etapa, estado):
+                    resultado[nome] = ('em dia', 0.0)
+                elif listar:
+                    resultado[nome] = ('a executar', 0.0)
+                else:
+                    a_rodar.append(etapa)
+        return a_rodar
+
+    with ThreadPoolExecutor(max_workers=processos or os.cpu_count()) as executor:
+        while True:
+            for etapa in prontas():
+                print(f"{etapa.nome}: {' '.join(etapa.comando)}")
+                rodando[executor.submit(_executar, etapa)] = (etapa, chave(etapa), time.time())
+            if not rodando:
+                break
+
+            feitos, _ = wait(rodando, return_when=FIRST_COMPLETED)
+            for futuro in feitos:
+                etapa, chave_etapa, inicio = rodando.pop(futuro)
+                codigo, segundos = futuro.result()
+                # um script que engole o erro sai com 0: as saídas têm de ter sido gravadas agora
+                faltando = [s for s in etapa.saidas
+                            if not (PASTA / s).exists() or (PASTA / s).stat().st_mtime < inicio - 1]
+                if codigo != 0 or faltando:
+                    resultado[etapa.nome] = ('falhou', segundos)
+                    motivo = f"código {codigo}" if codigo != 0 else f"não gravou {', '.join(faltando)}"
+                    print(f"{etapa.nome}: falhou ({motivo}); ver {ESTADO / (etapa.nome + '.log')}")
+                else:
+                    resultado[etapa.nome] = ('executada', segundos)
+                    estado[etapa.nome] = {
+                        'chave': chave_etapa,
+                        'saidas': {s: _sha1(PASTA / s) for s in etapa.saidas},
+                    }
+                    gravar_estado()
+                    print(f"{etapa.nome}: concluída em {segundos:.1f}s")
+
+    return {nome: resultado[nome] for nome in dependencias}
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Executa as etapas desatualizadas da edição, em paralelo.")
+    arg_parser.add_argument("alvos", nargs="*", help="Etapas a produzir (padrão: todas).")
+    arg_parser.add_argument("--processos", type=int, default=None,
+                            help="Etapas ao mesmo tempo (padrão: um por núcleo).")
+    arg_parser.add_argument("--forcar", action="store_true", help="Executa as etapas mesmo em dia.")
+    arg_parser.add_argument("--listar", action="store_true", help="Só mostra o que seria executado.")
+    args = arg_parser.parse_args()
+
+    inicio = time.perf_counter()
+    resultado = executar(ETAPAS, args.alvos, args.processos, args.forcar, args.listar)
+
+    print(f"\n{'etapa':16} {'situação':12} {'tempo':>8}")
+    for nome, (situacao, segundos) in resultado.items():
+        print(f"{nome:16} {situacao:12} {segundos:7.1f}s")
+    print(f"total: {time.perf_counter() - inicio:.1f}s")
+    if any(situacao in ('falhou', 'bloqueada') for situacao, _ in resultado.values()):
+        sys.exit(1)
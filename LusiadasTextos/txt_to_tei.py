@@ -1,9 +1,12 @@
-def txt_to_tei(input_file, output_file):
+import argparse
+
+
+def txt_to_tei(input_file, output_file, primeira_estrofe=9):
     with open(input_file, 'r', encoding='utf-8') as file:
         lines = file.readlines()
 
     tei_lines = []
-    stanza_number = 9  # Começa a contagem das estrofes a partir do número necessário
+    stanza_number = primeira_estrofe  # Começa a contagem das estrofes a partir do número necessário
     verse_counter = 0
 
     for line in lines:
@@ -42,6 +45,11 @@ def txt_to_tei(input_file, output_file):
 
 
 # Uso do script
-input_txt = 'lusiadas_pelicano_direita.txt'
-output_tei = 'Lusíadas_pelicano_à_direita_tei.xml'
-txt_to_tei(input_txt, output_tei)
\ No newline at end of file
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Converte versos em texto (8 por estrofe) em <lg>/<l> TEI.")
+    arg_parser.add_argument("--entrada", default='lusiadas_pelicano_direita.txt')
+    arg_parser.add_argument("--saida", default='Lusíadas_pelicano_à_direita_tei.xml')
+    arg_parser.add_argument("--primeira-estrofe", type=int, default=9)
+    args = arg_parser.parse_args()
+
+    txt_to_tei(args.entrada, args.saida, args.primeira_estrofe)
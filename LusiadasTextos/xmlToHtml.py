@@ -1,13 +1,27 @@
+import argparse
+
 from lxml import etree
 
-# Carregar o arquivo TEI e o XSLT
-tei = etree.parse("LusiadasCombinado.xml")
-xslt = etree.parse("transform.xsl")
 
-# Aplicar a transformação
-transform = etree.XSLT(xslt)
-html = transform(tei)
+def transformar(tei_path, xslt_path, saida):
+    # Carregar o arquivo TEI e o XSLT
+    tei = etree.parse(tei_path)
+    xslt = etree.parse(xslt_path)
+
+    # Aplicar a transformação
+    transform = etree.XSLT(xslt)
+    html = transform(tei)
+
+    # Salvar o resultado em um arquivo HTML
+    with open(saida, "wb") as f:
+        f.write(etree.tostring(html, pretty_print=True))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Aplica transform.xsl a um arquivo TEI.")
+    arg_parser.add_argument("--entrada", default="LusiadasCombinado.xml")
+    arg_parser.add_argument("--xslt", default="transform.xsl")
+    arg_parser.add_argument("--saida", default="output.html")
+    args = arg_parser.parse_args()
 
-# Salvar o resultado em um arquivo HTML
-with open("output.html", "wb") as f:
-    f.write(etree.tostring(html, pretty_print=True))
\ No newline at end of file
+    transformar(args.entrada, args.xslt, args.saida)
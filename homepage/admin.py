@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Canto, PaginaImagem, PaginaTexto
+from django.db import transaction
+
+from .models import Canto, PaginaImagem, PaginaTexto, Verso
 
 class PaginaImagemInline(admin.TabularInline):
     model = PaginaImagem
@@ -15,14 +17,17 @@ class CantoAdmin(admin.ModelAdmin):
 @admin.register(PaginaImagem)
 class PaginaImagemAdmin(admin.ModelAdmin):
     list_display = ("canto", "numero", "imagem")
+    list_select_related = ("canto",)
 
 
 @admin.register(PaginaTexto)
 class PaginaTextoAdmin(admin.ModelAdmin):
     list_display = ("canto", "numero", "versao")
+    list_select_related = ("canto",)
     list_filter = ("canto", "versao")
     ordering = ("canto", "numero")
     search_fields = ("tei_xml",)
+    actions = ["regenerar_html"]
 
     fieldsets = (
         ("Metadados", {
@@ -32,4 +37,25 @@ class PaginaTextoAdmin(admin.ModelAdmin):
             "fields": ("tei_xml",),
             "description": "Cole o XML TEI aqui"
         }),
-    )
\ No newline at end of file
+    )
+
+    @admin.action(description="Regenerar HTML das páginas selecionadas")
+    def regenerar_html(self, request, queryset):
+        textos = list(queryset.select_related("canto"))
+        for texto in textos:
+            texto.renderizar(forcar=True)
+        with transaction.atomic():
+            PaginaTexto.objects.bulk_update(
+                textos, ["html_renderizado", "tei_hash", "atualizado_em"]
+            )
+            # bulk_update não chama save(): as tabelas e a busca são refeitas aqui
+            PaginaTexto.derivar_paginas(textos)
+        self.message_user(request, f"{len(textos)} páginas regeneradas.")
+
+
+@admin.register(Verso)
+class VersoAdmin(admin.ModelAdmin):
+    list_display = ("texto", "estrofe", "numero")
+    list_filter = ("estrofe__canto", "estrofe__versao")
+    list_select_related = ("estrofe",)
+    search_fields = ("texto", "tokens__lema")
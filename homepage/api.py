@@ -0,0 +1,226 @@
+import base64
+import hashlib
+
+from django.conf import settings
+from django.http import Http404, JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_GET
+
+from .consultas import (
+    buscar_leitura,
+    cantos,
+    estrofes_da_pagina,
+    marca_das_imagens,
+    marca_dos_textos,
+    paginas_a_partir_de,
+    versos_a_partir_de,
+)
+from .models import PaginaTexto
+
+# -----------------------
+# API JSON (SOMENTE LEITURA)
+# -----------------------
+# Usa as mesmas consultas das views HTML. Listas longas são paginadas por
+# cursor: a resposta traz "proximo", que é passado de volta em ?cursor=.
+# O ETag é calculado antes da view, a partir das datas de alteração (como
+# nas views HTML): um 304 não monta a resposta. gzip e Cache-Control vêm
+# dos decoradores.
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 200
+
+VERSOES = {valor for valor, _ in PaginaTexto.VERSOES}
+
+
+def api(etag_func):
+    """GET apenas, JSON compacto, ETag/304 por `etag_func`, gzip e cache público."""
+    def decorador(view):
+        view = condition(etag_func=etag_func)(view)
+        view = gzip_page(view)
+        view = cache_control(public=True, max_age=settings.LEITURA_CACHE_MAX_AGE)(view)
+        return require_GET(view)
+    return decorador
+
+
+def _etag(request, *partes):
+    partes = [settings.LEITURA_ETAG_VERSAO, request.get_full_path(), *partes]
+    return hashlib.sha1("|".join(map(str, partes)).encode()).hexdigest()
+
+
+def _versao(versao):
+    if versao not in VERSOES:
+        raise Http404("Versão desconhecida.")
+
+
+def _json(dados):
+    return JsonResponse(
+        dados,
+        json_dumps_params={"separators": (",", ":"), "ensure_ascii": False},
+    )
+
+
+def _limite(request):
+    try:
+        limite = int(request.GET.get("limite", LIMITE_PADRAO))
+    except ValueError:
+        limite = LIMITE_PADRAO
+    return max(1, min(limite, LIMITE_MAXIMO))
+
+
+def _codificar_cursor(*valores):
+    texto = ".".join(str(v) for v in valores)
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip("=")
+
+
+def _decodificar_cursor(request, partes):
+    """Lê ?cursor= como tupla de `partes` inteiros; None se ausente."""
+    cursor = request.GET.get("cursor")
+    if not cursor:
+        return None
+    try:
+        texto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        valores = tuple(int(v) for v in texto.split("."))
+    except ValueError:
+        raise Http404("Cursor inválido.")
+    if len(valores) != partes:
+        raise Http404("Cursor inválido.")
+    return valores
+
+
+def _verso(verso, com_tokens):
+    if not com_tokens:
+        return verso.texto
+    return {
+        "texto": verso.texto,
+        # [forma, lema, classe, espaço depois]
+        "tokens": [[t.forma, t.lema, t.pos, t.espaco] for t in verso.tokens.all()],
+    }
+
+
+def _imagem(request, pagina):
+    return {
+        "url": request.build_absolute_uri(pagina.imagem.url),
+        "miniatura": request.build_absolute_uri(pagina.url_miniatura),
+        "largura": pagina.largura,
+        "altura": pagina.altura,
+    }
+
+
+def _cantos(request):
+    # a lista é pequena: o ETag sai dela mesma, buscada uma vez por requisição
+    if not hasattr(request, "cantos"):
+        request.cantos = cantos()
+    return request.cantos
+
+
+def _etag_cantos(request):
+    return _etag(request, *((c.numero, c.titulo, c.total_paginas) for c in _cantos(request)))
+
+
+@api(_etag_cantos)
+def lista_cantos(request):
+    return _json({
+        "cantos": [
+            {"numero": c.numero, "titulo": c.titulo, "paginas": c.total_paginas}
+            for c in _cantos(request)
+        ]
+    })
+
+
+def _etag_paginas(request, canto):
+    return _etag(request, *marca_das_imagens(canto), *marca_dos_textos(canto))
+
+
+@api(_etag_paginas)
+def paginas(request, canto):
+    depois = _decodificar_cursor(request, 1)
+    limite = _limite(request)
+
+    resultado = paginas_a_partir_de(canto, depois[0] if depois else 0, limite)
+
+    proximo = None
+    if len(resultado) == limite:
+        proximo = _codificar_cursor(resultado[-1].numero)
+
+    return _json({
+        "canto": canto,
+        "paginas": [
+            {
+                "numero": p.numero,
+                "versoes": p.versoes,
+                "imagem": _imagem(request, p),
+            }
+            for p in resultado
+        ],
+        "proximo": proximo,
+    })
+
+
+def _leitura(request, canto, pagina, versao):
+    """Imagem e texto da página, buscados uma vez para o ETag e a view."""
+    if not hasattr(request, "leitura"):
+        _versao(versao)
+        request.leitura = buscar_leitura(canto, pagina, versoes=(versao,))
+        if request.leitura.texto(versao) is None:
+            raise Http404("Texto não disponível para esta página.")
+    return request.leitura
+
+
+def _etag_texto(request, canto, pagina, versao):
+    return _etag(request, _leitura(request, canto, pagina, versao).etag)
+
+
+@api(_etag_texto)
+def texto_pagina(request, canto, pagina, versao):
+    leitura = _leitura(request, canto, pagina, versao)
+    texto = leitura.texto(versao)
+
+    com_tokens = bool(request.GET.get("tokens"))
+    dados = {
+        "canto": canto,
+        "pagina": pagina,
+        "versao": versao,
+        "imagem": _imagem(request, leitura.imagem) if leitura.imagem else None,
+        "estrofes": [
+            {"n": e.numero, "versos": [_verso(v, com_tokens) for v in e.versos.all()]}
+            for e in estrofes_da_pagina(canto, pagina, versao)
+        ],
+    }
+    # ?tokens=1 troca cada verso por {texto, tokens}; ?html=1 inclui o
+    # HTML já convertido, o mesmo usado no site
+    if request.GET.get("html"):
+        dados["html"] = texto.html_renderizado
+
+    return _json(dados)
+
+
+def _etag_versos(request, canto, versao):
+    _versao(versao)
+    return _etag(request, *marca_dos_textos(canto, versao))
+
+
+@api(_etag_versos)
+def versos(request, canto, versao):
+    depois = _decodificar_cursor(request, 3)
+    limite = _limite(request)
+
+    resultado = versos_a_partir_de(canto, versao, depois, limite)
+
+    proximo = None
+    if len(resultado) == limite:
+        ultimo = resultado[-1]
+        proximo = _codificar_cursor(
+            ultimo.estrofe.pagina, ultimo.estrofe.ordem, ultimo.numero
+        )
+
+    return _json({
+        "canto": canto,
+        "versao": versao,
+        # [página, estrofe, verso, texto]
+        "versos": [
+            [v.estrofe.pagina, v.estrofe.numero, v.numero, v.texto]
+            for v in resultado
+        ],
+        "proximo": proximo,
+    })
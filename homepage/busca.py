@@ -0,0 +1,168 @@
+import re
+
+from django.db import connection, transaction
+from django.utils.html import escape
+
+from .utils.tei import extrair_estrofes
+
+# -----------------------
+# BUSCA NO POEMA (SQLite FTS5)
+# -----------------------
+# Um registro por verso, com a forma do texto e os atributos lemma/pos
+# escritos por LusiadasTextos/etiquetador.py. A tabela é criada na
+# migração 0009; o ranking usa o bm25 do próprio FTS5.
+
+TABELA = "homepage_verso_busca"
+
+# colunas pesquisáveis expostas na interface
+CAMPOS = {
+    "texto": "Texto",
+    "lemas": "Lema",
+    "pos": "Classe gramatical",
+}
+
+# marcadores do highlight(); trocados por <mark> depois de escapar o texto
+_INICIO_DESTAQUE = "\x02"
+_FIM_DESTAQUE = "\x03"
+
+
+def extrair_versos(tei_xml):
+    """Gera (estrofe, verso, texto, lemas, pos) para cada <l> do TEI."""
+    for n, versos in extrair_estrofes(tei_xml):
+        estrofe = "" if n is None else str(n)
+        for numero, (texto, tokens) in enumerate(versos, start=1):
+            yield (
+                estrofe,
+                numero,
+                texto,
+                " ".join(t[2] for t in tokens if t[2]),
+                " ".join(t[3] for t in tokens if t[3]),
+            )
+
+
+def disponivel():
+    return connection.vendor == "sqlite"
+
+
+def indexar_pagina(texto):
+    """Substitui no índice os versos de uma PaginaTexto."""
+    if not disponivel():
+        return 0
+
+    chave = (texto.canto.numero, texto.numero, texto.versao)
+    linhas = [chave + verso for verso in extrair_versos(texto.tei_xml)]
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        remover_pagina(*chave, cursor=cursor)
+        cursor.executemany(
+            f"INSERT INTO {TABELA} "
+            "(canto, pagina, versao, estrofe, verso, texto, lemas, pos) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+            linhas,
+        )
+    return len(linhas)
+
+
+def remover_pagina(canto, pagina, versao, cursor=None):
+    if not disponivel():
+        return
+
+    sql = f"DELETE FROM {TABELA} WHERE canto = %s AND pagina = %s AND versao = %s"
+    if cursor is not None:
+        cursor.execute(sql, [canto, pagina, versao])
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [canto, pagina, versao])
+
+
+def renumerar_canto(anterior, novo):
+    """Acompanha a troca do número de um Canto nas chaves do índice."""
+    if not disponivel():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {TABELA} SET canto = %s WHERE canto = %s", [novo, anterior]
+        )
+
+
+def reindexar(textos):
+    """Recria o índice inteiro a partir das PaginaTexto informadas."""
+    total = 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABELA}")
+        for texto in textos:
+            total += indexar_pagina(texto)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {TABELA}({TABELA}) VALUES ('optimize')")
+    return total
+
+
+def montar_consulta(termos, campo="texto"):
+    """
+    Converte o que o leitor digitou numa expressão MATCH do FTS5: cada
+    palavra vira uma frase entre aspas (sem operadores), todas obrigatórias,
+    e a última aceita prefixo.
+    """
+    palavras = re.findall(r"\w+", termos)
+    if not palavras:
+        return ""
+    frases = [f'"{p}"' for p in palavras]
+    frases[-1] += "*"
+    return f"{campo} : ({' '.join(frases)})"
+
+
+class ResultadosBusca:
+    """
+    Resultado preguiçoso compatível com o Paginator do Django: count() e
+    fatias viram COUNT e LIMIT/OFFSET na tabela FTS5.
+    """
+
+    def __init__(self, consulta):
+        self.consulta = consulta
+
+    def count(self):
+        if not self.consulta or not disponivel():
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT count(*) FROM {TABELA} WHERE {TABELA} MATCH %s",
+                [self.consulta],
+            )
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, fatia):
+        if not self.consulta or not disponivel():
+            return []
+        inicio = fatia.start or 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT canto, pagina, versao, estrofe, verso, texto, "
+                f"highlight({TABELA}, 0, %s, %s) "
+                f"FROM {TABELA} WHERE {TABELA} MATCH %s "
+                f"ORDER BY bm25({TABELA}) LIMIT %s OFFSET %s",
+                [
+                    _INICIO_DESTAQUE, _FIM_DESTAQUE,
+                    self.consulta, fatia.stop - inicio, inicio,
+                ],
+            )
+            colunas = [c[0] for c in cursor.description[:-1]]
+            resultados = []
+            for *valores, destaque in cursor.fetchall():
+                resultado = dict(zip(colunas, valores))
+                resultado["destaque"] = (
+                    escape(destaque)
+                    .replace(_INICIO_DESTAQUE, "<mark>")
+                    .replace(_FIM_DESTAQUE, "</mark>")
+                )
+                resultados.append(resultado)
+            return resultados
+
+
+def buscar(termos, campo="texto"):
+    if campo not in CAMPOS:
+        campo = "texto"
+    return ResultadosBusca(montar_consulta(termos, campo))
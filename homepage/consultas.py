@@ -0,0 +1,186 @@
+import hashlib
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+
+from .models import Canto, Estrofe, PaginaImagem, PaginaTexto, Verso
+
+# -----------------------
+# ACESSO AOS DADOS DAS PÁGINAS
+# -----------------------
+# Concentra as consultas usadas pelas views para que cada página seja
+# montada com o menor número possível de idas ao banco.
+
+
+def colunas(conteudo=None, coluna=None):
+    """
+    (esquerda, direita): o conteúdo de cada coluna da leitura quando
+    `coluna` ("esq" ou "dir") mostra `conteudo`; a outra fica no padrão.
+    """
+    esq = "modernizado"
+    dir = "original"
+
+    if coluna == "esq":
+        esq = conteudo
+    elif coluna == "dir":
+        dir = conteudo
+
+    return esq, dir
+
+
+@dataclass
+class Leitura:
+    canto: int
+    pagina_num: int
+    paginas: list
+    imagem: PaginaImagem | None = None
+    versoes: tuple = ()
+    textos: dict = field(default_factory=dict)
+
+    def texto(self, versao):
+        return self.textos.get(versao)
+
+    @property
+    def etag(self):
+        """Hash das versões de conteúdo das linhas usadas na página."""
+        partes = [settings.LEITURA_ETAG_VERSAO, self.canto, self.pagina_num]
+        partes += self.versoes
+        partes += [
+            f"{p.pk}:{p.numero}:{p.imagem.name}:{p.atualizado_em.isoformat()}"
+            for p in self.paginas
+        ]
+        partes += [
+            f"{versao}:{t.tei_hash}:{t.atualizado_em.isoformat()}"
+            for versao, t in sorted(self.textos.items())
+        ]
+        return hashlib.sha1("|".join(map(str, partes)).encode()).hexdigest()
+
+    @property
+    def ultima_modificacao(self):
+        datas = [p.atualizado_em for p in self.paginas]
+        datas += [t.atualizado_em for t in self.textos.values()]
+        return max(datas, default=None)
+
+
+def cantos():
+    """Cantos com o número de páginas de imagem de cada um (1 consulta)."""
+    return list(
+        Canto.objects.annotate(total_paginas=Count("paginas")).order_by("numero")
+    )
+
+
+def _marca(consulta):
+    marca = consulta.aggregate(total=Count("pk"), ultima=Max("atualizado_em"))
+    return marca["total"], marca["ultima"]
+
+
+def marca_das_imagens(canto):
+    """(quantidade, última alteração) das páginas de imagem do canto (1 consulta)."""
+    return _marca(PaginaImagem.objects.filter(canto__numero=canto))
+
+
+def marca_dos_textos(canto, versao=None):
+    """
+    (quantidade, última alteração) das páginas de texto do canto, numa
+    versão ou em todas (1 consulta). Estrofes, versos e tokens são
+    refeitos junto com o texto, então a marca vale para eles também.
+    """
+    textos = PaginaTexto.objects.filter(canto__numero=canto)
+    if versao is not None:
+        textos = textos.filter(versao=versao)
+    return _marca(textos)
+
+
+def paginas_do_canto(canto):
+    """Lista de PaginaImagem do canto, em ordem (1 consulta)."""
+    return list(
+        PaginaImagem.objects.filter(canto__numero=canto)
+        .select_related("canto").order_by("numero")
+    )
+
+
+def buscar_leitura(canto, pagina_num, versoes=()):
+    """
+    Imagem da página, lista de páginas do canto e os textos pedidos.
+    Usa 1 consulta, ou 2 quando há versões de texto a buscar.
+    """
+    paginas = paginas_do_canto(canto)
+    imagem = next((p for p in paginas if p.numero == pagina_num), None)
+
+    textos = {}
+    if versoes:
+        # o TEI bruto não é usado na leitura, só o HTML já convertido
+        consulta = PaginaTexto.objects.filter(
+            canto__numero=canto,
+            numero=pagina_num,
+            versao__in=set(versoes),
+        ).defer("tei_xml")
+        textos = {texto.versao: texto for texto in consulta}
+
+    return Leitura(
+        canto=canto,
+        pagina_num=pagina_num,
+        paginas=paginas,
+        imagem=imagem,
+        versoes=tuple(versoes),
+        textos=textos,
+    )
+
+
+def estrofes_da_pagina(canto, pagina_num, versao):
+    """
+    Estrofes da página com versos e tokens já carregados, sem ler o TEI
+    (3 consultas, independente do tamanho da página).
+    """
+    return list(
+        Estrofe.objects.filter(
+            canto__numero=canto, pagina=pagina_num, versao=versao
+        ).prefetch_related("versos__tokens")
+    )
+
+
+def paginas_a_partir_de(canto, depois=0, limite=50):
+    """
+    Até `limite` páginas do canto com número maior que `depois`, cada uma
+    com as versões de texto disponíveis (2 consultas).
+    """
+    paginas = list(
+        PaginaImagem.objects.filter(canto__numero=canto, numero__gt=depois)
+        .order_by("numero")[:limite]
+    )
+
+    versoes = {}
+    if paginas:
+        consulta = PaginaTexto.objects.filter(
+            canto__numero=canto,
+            numero__in=[p.numero for p in paginas],
+        ).values_list("numero", "versao")
+        for numero, versao in consulta:
+            versoes.setdefault(numero, []).append(versao)
+
+    for pagina in paginas:
+        pagina.versoes = sorted(versoes.get(pagina.numero, []))
+    return paginas
+
+
+def versos_a_partir_de(canto, versao, depois=None, limite=100):
+    """
+    Até `limite` versos do canto na ordem do poema, depois da posição
+    `depois` = (página, ordem da estrofe, número do verso). 1 consulta.
+    """
+    versos = Verso.objects.filter(
+        estrofe__canto__numero=canto, estrofe__versao=versao
+    )
+    if depois is not None:
+        pagina, ordem, numero = depois
+        versos = versos.filter(
+            Q(estrofe__pagina__gt=pagina)
+            | Q(estrofe__pagina=pagina, estrofe__ordem__gt=ordem)
+            | Q(estrofe__pagina=pagina, estrofe__ordem=ordem, numero__gt=numero)
+        )
+
+    return list(
+        versos.select_related("estrofe")
+        .order_by("estrofe__pagina", "estrofe__ordem", "numero")[:limite]
+    )
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import multiprocessing
+import re
+import shutil
+from pathlib import Path, PurePosixPath
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.http import Http404
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from .consultas import Leitura, colunas
+from .models import Canto, PaginaImagem, PaginaTexto
+
+# -----------------------
+# EXPORTAÇÃO ESTÁTICA DA EDIÇÃO
+# -----------------------
+# Cada URL de leitura é gravada como <url>/index.html, chamando a view
+# direto, sem middleware. A chave de cada arquivo é o mesmo ETag das
+# views (consultas.Leitura) mais o hash do manifesto dos arquivos
+# estáticos: só é renderado de novo o que mudou. Os estáticos são
+# copiados com hash no nome, e as URLs deles reescritas no HTML.
+#
+# As views canto e leitura também paginam por ?p=, que um servidor
+# estático ignora: delas só é exportada a página 1, e os links com ?p=
+# são reescritos para a URL de leitura_paginada equivalente, que é
+# exportada para todas as páginas (ver paginacao_em_caminhos).
+
+ARQUIVO_MANIFESTO = ".exportacao.json"
+
+CONTEUDOS = ("original", "modernizado", "imagem")
+COLUNAS = ("esq", "dir")
+
+# padrões ignorados ao coletar os estáticos, os mesmos do collectstatic
+IGNORAR_ESTATICOS = ["CVS", ".*", "*~"]
+
+# href/src com ?p=, absoluto ('/canto/1/?p=2') ou relativo à página ('?p=2')
+_RE_PAGINA = re.compile(r"(?<=[\"'])(/[^\"'?#\s]*)?\?p=(\d+)(?=[\"'#])")
+
+# estado de cada processo do pool (montado em preparar_processo)
+_requisicoes = None
+_estaticos = None
+
+
+def caminho_de(url):
+    """'/canto/1/' → 'canto/1/index.html'; '/api/cantos.json' fica igual."""
+    relativo = PurePosixPath(url.lstrip("/"))
+    if url.endswith("/"):
+        relativo = relativo / "index.html"
+    return str(relativo)
+
+
+def _chave(*partes):
+    return hashlib.sha1("|".join(map(str, partes)).encode()).hexdigest()
+
+
+def listar_urls(versao_estaticos):
+    """
+    Todas as URLs exportáveis com a chave do conteúdo de cada uma.
+    Usa 3 consultas, qualquer que seja o tamanho da edição.
+    """
+    base = (settings.LEITURA_ETAG_VERSAO, versao_estaticos)
+    urls = {reverse(nome): _chave(*base) for nome in ("homepage", "sobre", "autor")}
+
+    paginas = {}
+    for pagina in PaginaImagem.objects.select_related("canto").order_by("numero"):
+        paginas.setdefault(pagina.canto.numero, []).append(pagina)
+
+    textos = {}
+    consulta = PaginaTexto.objects.select_related("canto").only(
+        "canto__numero", "numero", "versao", "tei_hash", "atualizado_em"
+    )
+    for texto in consulta:
+        textos[texto.canto.numero, texto.numero, texto.versao] = texto
+
+    for canto in Canto.objects.values_list("numero", flat=True):
+        do_canto = paginas.get(canto, [])
+        numeros = {p.numero for p in do_canto}
+        numeros |= {n for (c, n, _) in textos if c == canto}
+
+        def leitura(pagina_num, versoes=()):
+            return Leitura(
+                canto=canto,
+                pagina_num=pagina_num,
+                paginas=do_canto,
+                imagem=next((p for p in do_canto if p.numero == pagina_num), None),
+                versoes=versoes,
+                textos={
+                    v: textos[canto, pagina_num, v]
+                    for v in versoes if (canto, pagina_num, v) in textos
+                },
+            )
+
+        etag = leitura(1).etag
+        urls[reverse("canto", args=[canto])] = _chave(*base, etag)
+        urls[reverse("canto_index", args=[canto])] = _chave(*base, etag)
+
+        for conteudo in CONTEUDOS:
+            for coluna in COLUNAS:
+                versoes = colunas(conteudo, coluna)
+                # sem página na URL a leitura abre na página 1
+                urls[reverse("leitura", args=[canto, conteudo, coluna])] = _chave(
+                    *base, leitura(1, versoes).etag
+                )
+                for numero in sorted(numeros):
+                    url = reverse(
+                        "leitura_paginada", args=[canto, conteudo, coluna, numero]
+                    )
+                    urls[url] = _chave(*base, leitura(numero, versoes).etag)
+
+    return urls
+
+
+def coletar_estaticos(destino):
+    """
+    Copia os estáticos para o caminho de STATIC_URL em destino, com hash
+    no nome (ManifestStaticFilesStorage, sem mexer em STORAGES). Retorna
+    (hash do manifesto, {URL do estático: URL com hash}).
+    """
+    armazenamento = ManifestStaticFilesStorage(
+        location=Path(destino) / settings.STATIC_URL.strip("/"),
+    )
+    encontrados = {}
+    for finder in finders.get_finders():
+        for caminho, origem in finder.list(IGNORAR_ESTATICOS):
+            prefixo = getattr(origem, "prefix", None)
+            nome = str(PurePosixPath(prefixo, caminho)) if prefixo else caminho
+            if nome in encontrados:
+                continue  # vale o primeiro encontrado, como no collectstatic
+            encontrados[nome] = (origem, caminho)
+            if armazenamento.exists(nome):
+                if armazenamento.get_modified_time(nome) >= origem.get_modified_time(caminho):
+                    continue
+                armazenamento.delete(nome)
+            with origem.open(caminho) as arquivo:
+                armazenamento.save(nome, arquivo)
+
+    for _, _, processado in armazenamento.post_process(encontrados):
+        if isinstance(processado, Exception):
+            raise processado
+
+    manifesto = Path(armazenamento.path(armazenamento.manifest_name)).read_bytes()
+    urls = {
+        # force: com DEBUG, url() devolveria o nome sem hash
+        armazenamento.base_url + nome: armazenamento.url(nome, force=True)
+        for nome in encontrados
+    }
+    return hashlib.sha1(manifesto).hexdigest(), urls
+
+
+def preparar_processo(estaticos):
+    """
+    Guarda o mapa {URL do estático: URL com hash} usado por renderizar_url.
+    Num processo do pool, inicializa o Django antes.
+    """
+    global _requisicoes, _estaticos
+
+    if multiprocessing.parent_process() is not None:
+        from django.db import connections
+
+        if not apps.ready:
+            import django
+
+            django.setup()
+        # com fork, não reaproveitar a conexão aberta pelo processo principal
+        connections.close_all()
+
+    _requisicoes = RequestFactory()
+    # a mais longa primeiro, para '/static/a.css' não casar dentro de '/static/a.css.map'
+    padrao = "|".join(map(re.escape, sorted(estaticos, key=len, reverse=True)))
+    _estaticos = (re.compile(f"(?:{padrao})(?=[\"'\\s)?#])"), estaticos)
+
+
+def paginacao_em_caminhos(html, url):
+    """
+    Troca os links '?p=N' das views canto e leitura pela URL de
+    leitura_paginada com as mesmas colunas; `url` é a da página, base
+    dos links relativos. Os demais links ficam como estão.
+    """
+    def trocar(m):
+        try:
+            rota = resolve(m.group(1) or url)
+        except Http404:
+            return m.group()
+        if rota.url_name == "canto":
+            conteudo, coluna = colunas()[0], "esq"  # a leitura padrão
+        elif rota.url_name == "leitura":
+            conteudo, coluna = rota.kwargs["conteudo"], rota.kwargs["coluna"]
+        else:
+            return m.group()
+        return reverse(
+            "leitura_paginada",
+            args=[rota.kwargs["canto"], conteudo, coluna, int(m.group(2))],
+        )
+
+    return _RE_PAGINA.sub(trocar, html)
+
+
+def renderizar_url(destino, url):
+    """Renderiza uma URL e grava o HTML em destino; retorna o status HTTP."""
+    rota = resolve(url)
+    requisicao = _requisicoes.get(url)
+    requisicao.user = AnonymousUser()
+    try:
+        resposta = rota.func(requisicao, *rota.args, **rota.kwargs)
+    except Http404:
+        return 404
+
+    if resposta.status_code == 200:
+        padrao, estaticos = _estaticos
+        html = paginacao_em_caminhos(resposta.content.decode(resposta.charset), url)
+        if estaticos:
+            html = padrao.sub(lambda m: estaticos[m.group()], html)
+        arquivo = Path(destino) / caminho_de(url)
+        arquivo.parent.mkdir(parents=True, exist_ok=True)
+        arquivo.write_text(html, encoding=resposta.charset)
+    return resposta.status_code
+
+
+def sincronizar(origem, destino):
+    """
+    Copia para destino os arquivos de origem ausentes ou com tamanho/data
+    diferentes. Retorna quantos arquivos foram copiados.
+    """
+    origem, destino = Path(origem), Path(destino)
+    if not origem.exists():
+        return 0
+
+    copiados = 0
+    for arquivo in origem.rglob("*"):
+        if not arquivo.is_file():
+            continue
+        alvo = destino / arquivo.relative_to(origem)
+        info = arquivo.stat()
+        if alvo.exists():
+            atual = alvo.stat()
+            if atual.st_size == info.st_size and atual.st_mtime == info.st_mtime:
+                continue
+        alvo.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(arquivo, alvo)
+        copiados += 1
+    return copiados
+
+
+def exportar_midia(destino):
+    """
+    Copia MEDIA_ROOT para o caminho de MEDIA_URL: fac-símiles, derivadas e
+    as pirâmides de tiles, que o zoom lê direto de lá.
+    """
+    return sincronizar(settings.MEDIA_ROOT, Path(destino) / settings.MEDIA_URL.strip("/"))
+
+
+def ler_manifesto(destino):
+    try:
+        return json.loads((Path(destino) / ARQUIVO_MANIFESTO).read_text("utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def gravar_manifesto(destino, manifesto):
+    (Path(destino) / ARQUIVO_MANIFESTO).write_text(
+        json.dumps(manifesto, indent=0, sort_keys=True), encoding="utf-8"
+    )
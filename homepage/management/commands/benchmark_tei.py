@@ -0,0 +1,49 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from homepage.utils.tei import tei_para_html
+
+ARQUIVOS = ["LusiadasModernizado.xml", "LusiadasDireita.xml"]
+
+
+def _cronometrar(funcao, tei_xml, repeticoes):
+    """Retorna (primeira execução, melhor das demais) em segundos."""
+    inicio = time.perf_counter()
+    funcao(tei_xml)
+    fria = time.perf_counter() - inicio
+
+    melhor = fria
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(tei_xml)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return fria, melhor
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede tei_para_html sobre os arquivos completos de "
+        "LusiadasTextos/."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeticoes",
+            type=int,
+            default=10,
+            help="Execuções medidas após a primeira (padrão: 10).",
+        )
+
+    def handle(self, *args, **options):
+        pasta = settings.BASE_DIR / "LusiadasTextos"
+
+        for nome in ARQUIVOS:
+            tei_xml = (pasta / nome).read_text(encoding="utf-8")
+
+            fria, melhor = _cronometrar(tei_para_html, tei_xml, options["repeticoes"])
+            self.stdout.write(
+                f"{nome} ({len(tei_xml) // 1024} KB): primeira {fria * 1000:.1f} ms, "
+                f"melhor {melhor * 1000:.1f} ms"
+            )
@@ -0,0 +1,91 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from homepage import exportacao
+from homepage.utils.paralelo import mapear_em_processos
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta a edição como site estático (HTML, estáticos com hash no "
+        "nome e mídia), renderando em paralelo só as páginas cujo conteúdo "
+        "mudou desde a última exportação. As páginas da leitura vão para as "
+        "URLs /canto/N/leitura/<conteúdo>/<coluna>/<página>/, e os links "
+        "com ?p= são reescritos para elas. A busca e a API não são exportadas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--destino",
+            default=settings.EXPORTACAO_ESTATICA_DIR,
+            help="Pasta do site gerado (padrão: EXPORTACAO_ESTATICA_DIR).",
+        )
+        parser.add_argument(
+            "--forcar",
+            action="store_true",
+            help="Renderiza todas as páginas, mesmo as inalteradas.",
+        )
+        parser.add_argument(
+            "--processos",
+            type=int,
+            default=None,
+            help="Processos no pool (padrão: um por núcleo; 0 = sem pool).",
+        )
+
+    def handle(self, *args, **options):
+        destino = Path(options["destino"])
+        destino.mkdir(parents=True, exist_ok=True)
+
+        # estáticos com hash no nome; as URLs deles são reescritas no HTML
+        versao_estaticos, estaticos = exportacao.coletar_estaticos(destino)
+
+        urls = exportacao.listar_urls(versao_estaticos)
+        anterior = exportacao.ler_manifesto(destino)
+        pendentes = [
+            url for url, chave in urls.items()
+            if options["forcar"] or anterior.get(url) != chave
+        ]
+
+        # páginas que deixaram de existir
+        removidas = 0
+        for url in set(anterior) - set(urls):
+            (destino / exportacao.caminho_de(url)).unlink(missing_ok=True)
+            removidas += 1
+
+        manifesto = {url: c for url, c in anterior.items() if url in urls}
+        erros = 0
+        for url, status, erro in self._renderizar(destino, pendentes, estaticos, options):
+            if erro or status != 200:
+                erros += 1
+                self.stderr.write(f"{url}: {erro or f'HTTP {status}'}")
+                manifesto.pop(url, None)
+                continue
+            manifesto[url] = urls[url]
+        exportacao.gravar_manifesto(destino, manifesto)
+
+        copiados = exportacao.exportar_midia(destino)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(pendentes) - erros} páginas renderadas "
+            f"({len(urls) - len(pendentes)} inalteradas, {removidas} removidas, "
+            f"{erros} erros); {copiados} arquivos de mídia copiados para {destino}."
+        ))
+
+    def _renderizar(self, destino, urls, estaticos, options):
+        if options["processos"] != 0:
+            # os processos abrem as próprias conexões com o banco
+            connections.close_all()
+        itens = [(url, (destino, url)) for url in urls]
+        # um erro numa página é relatado e não interrompe as outras
+        yield from mapear_em_processos(
+            exportacao.renderizar_url,
+            itens,
+            options["processos"],
+            inicializar=exportacao.preparar_processo,
+            argumentos_inicializar=(estaticos,),
+            lote=20,
+            erros=(Exception,),
+        )
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from homepage.models import PaginaImagem
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera as versões reduzidas (JPEG e WebP) dos fac-símiles, "
+        "em paralelo, para uso em srcset."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--forcar",
+            action="store_true",
+            help="Regera também as imagens que já têm derivadas.",
+        )
+        parser.add_argument(
+            "--processos",
+            type=int,
+            default=None,
+            help="Processos no pool (padrão: um por núcleo).",
+        )
+
+    def handle(self, *args, **options):
+        imagens = PaginaImagem.objects.exclude(imagem="")
+        if not options["forcar"]:
+            # largura preenchida = já processada, mesmo sem derivadas
+            # (imagens menores que a menor largura)
+            imagens = imagens.filter(largura__isnull=True)
+        imagens = list(imagens)
+
+        alteradas, erros = PaginaImagem.gerar_derivados_de(imagens, options["processos"])
+        for imagem, erro in erros:
+            self.stderr.write(f"{imagem}: {erro}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Derivadas geradas para {len(alteradas)} de {len(imagens)} imagens."
+        ))
@@ -0,0 +1,67 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from homepage.models import PaginaImagem
+from homepage.utils.paralelo import mapear_em_processos
+from homepage.utils.tiles import gerar_piramide, hash_arquivo
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera, em paralelo, as pirâmides de tiles (Deep Zoom) dos "
+        "fac-símiles cuja imagem mudou desde a última geração."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--forcar",
+            action="store_true",
+            help="Regera todas as pirâmides, mesmo as atualizadas.",
+        )
+        parser.add_argument(
+            "--processos",
+            type=int,
+            default=None,
+            help="Processos no pool (padrão: um por núcleo).",
+        )
+
+    def handle(self, *args, **options):
+        raiz_media = Path(settings.MEDIA_ROOT)
+        imagens = {}
+        for imagem in PaginaImagem.objects.select_related("canto").exclude(imagem=""):
+            caminho = raiz_media / imagem.imagem.name
+            if not caminho.exists():
+                self.stderr.write(f"{imagem}: arquivo {caminho} não encontrado")
+                continue
+            if options["forcar"] or hash_arquivo(caminho) != imagem.tiles_origem:
+                imagens[imagem.pk] = imagem
+
+        itens = [
+            (pk, (raiz_media, imagem.imagem.name, imagem.canto.numero, imagem.numero))
+            for pk, imagem in imagens.items()
+        ]
+
+        alteradas = []
+        agora = timezone.now()
+        for pk, origem, erro in mapear_em_processos(
+            gerar_piramide, itens, options["processos"]
+        ):
+            imagem = imagens[pk]
+            if erro:
+                self.stderr.write(f"{imagem}: {erro}")
+                continue
+
+            imagem.tiles_origem = origem
+            imagem.atualizado_em = agora
+            alteradas.append(imagem)
+
+        PaginaImagem.objects.bulk_update(
+            alteradas, ["tiles_origem", "atualizado_em"], batch_size=200
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Pirâmides geradas para {len(alteradas)} imagens."
+        ))
@@ -0,0 +1,207 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from homepage.models import Canto, PaginaImagem, PaginaTexto
+from homepage.utils.tei import paginas_do_testemunho
+
+EXTENSOES_IMAGEM = {".jpg", ".jpeg", ".png", ".webp"}
+
+CAMPOS_TEXTO = ["tei_xml", "tei_hash", "html_renderizado", "atualizado_em"]
+CAMPOS_IMAGEM = ["imagem", "largura", "altura", "derivados", "atualizado_em"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa a edição inteira: divide cada testemunho TEI nas quebras "
+        "de página (<pb/>) em PaginaTexto por canto e versão e associa os "
+        "fac-símiles de media/poema/canto_N/ às PaginaImagem. Só grava o "
+        "que mudou; repetir a importação não altera nada."
+    )
+
+    def add_arguments(self, parser):
+        for versao, rotulo in PaginaTexto.VERSOES:
+            parser.add_argument(
+                f"--{versao}",
+                metavar="ARQUIVO",
+                help=f"Testemunho TEI completo da versão {rotulo.lower()}.",
+            )
+        parser.add_argument(
+            "--imagens",
+            action="store_true",
+            help=(
+                "Associa as imagens de MEDIA_ROOT/poema/canto_N/<página>.jpg "
+                "e gera as derivadas das novas ou trocadas."
+            ),
+        )
+        parser.add_argument(
+            "--remover",
+            action="store_true",
+            help=(
+                "Apaga as páginas de cada versão importada que não existem "
+                "mais no arquivo (só nos cantos presentes nele)."
+            ),
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=200,
+            help="Quantidade de páginas gravadas por transação (padrão: 200).",
+        )
+        parser.add_argument(
+            "--processos",
+            type=int,
+            default=None,
+            help="Processos no pool das derivadas (padrão: um por núcleo; 0 = sem pool).",
+        )
+
+    def handle(self, *args, **options):
+        arquivos = {
+            versao: options[versao]
+            for versao, _ in PaginaTexto.VERSOES
+            if options[versao]
+        }
+        if not arquivos and not options["imagens"]:
+            opcoes = ", ".join(f"--{versao}" for versao, _ in PaginaTexto.VERSOES)
+            raise CommandError(f"Informe ao menos um testemunho ({opcoes}) ou --imagens.")
+        for arquivo in arquivos.values():
+            if not Path(arquivo).is_file():
+                raise CommandError(f"Arquivo '{arquivo}' não encontrado.")
+
+        self.cantos = {canto.numero: canto for canto in Canto.objects.all()}
+        for versao, arquivo in arquivos.items():
+            self.importar_textos(versao, arquivo, options["lote"], options["remover"])
+        if options["imagens"]:
+            self.importar_imagens(options["lote"], options["processos"])
+
+    def canto(self, numero):
+        if numero not in self.cantos:
+            self.cantos[numero] = Canto.objects.create(numero=numero)
+        return self.cantos[numero]
+
+    # -----------------------
+    # TEXTOS
+    # -----------------------
+
+    def importar_textos(self, versao, arquivo, lote, remover):
+        # o HTML só é lido se a página mudar, e então é regenerado
+        existentes = {
+            (texto.canto.numero, texto.numero): texto
+            for texto in PaginaTexto.objects.filter(versao=versao)
+            .select_related("canto").defer("html_renderizado")
+        }
+        vistas = set()
+        novas, alteradas = [], []
+        total = criadas = atualizadas = 0
+
+        for numero_canto, numero, tei_xml in paginas_do_testemunho(arquivo):
+            total += 1
+            vistas.add((numero_canto, numero))
+            texto = existentes.get((numero_canto, numero))
+            if texto is None:
+                texto = PaginaTexto(
+                    canto=self.canto(numero_canto), numero=numero,
+                    versao=versao, tei_xml=tei_xml,
+                )
+                texto.renderizar()
+                novas.append(texto)
+            elif texto.tei_xml != tei_xml:
+                texto.tei_xml = tei_xml
+                texto.renderizar()
+                alteradas.append(texto)
+
+            if len(novas) + len(alteradas) >= lote:
+                self.gravar_textos(novas, alteradas, lote)
+                criadas += len(novas)
+                atualizadas += len(alteradas)
+                novas, alteradas = [], []
+
+        self.gravar_textos(novas, alteradas, lote)
+        criadas += len(novas)
+        atualizadas += len(alteradas)
+
+        removidas = 0
+        if remover:
+            cantos = {numero_canto for numero_canto, _ in vistas}
+            ausentes = [
+                texto for chave, texto in existentes.items()
+                if chave[0] in cantos and chave not in vistas
+            ]
+            # o índice de busca é limpo pelo sinal pre_delete (sinais.py)
+            PaginaTexto.objects.filter(pk__in=[t.pk for t in ausentes]).delete()
+            removidas = len(ausentes)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{versao}: {total} páginas em '{arquivo}'; {criadas} criadas, "
+            f"{atualizadas} atualizadas, {removidas} removidas."
+        ))
+
+    def gravar_textos(self, novas, alteradas, lote):
+        """Grava um lote de páginas e refaz as tabelas derivadas do TEI delas."""
+        if not novas and not alteradas:
+            return
+        with transaction.atomic():
+            PaginaTexto.objects.bulk_create(novas, batch_size=lote)
+            PaginaTexto.objects.bulk_update(alteradas, CAMPOS_TEXTO, batch_size=lote)
+            # bulk_create/bulk_update não chamam save(): estrofes, versos,
+            # tokens e o índice de busca são refeitos aqui
+            PaginaTexto.derivar_paginas(novas + alteradas)
+
+    # -----------------------
+    # IMAGENS
+    # -----------------------
+
+    def importar_imagens(self, lote, processos):
+        raiz_media = Path(settings.MEDIA_ROOT)
+        existentes = {
+            (imagem.canto_id, imagem.numero): imagem
+            for imagem in PaginaImagem.objects.all()
+        }
+        novas, alteradas = [], []
+        total = 0
+        agora = timezone.now()
+
+        for pasta in sorted((raiz_media / "poema").glob("canto_*")):
+            numero_canto = pasta.name.removeprefix("canto_")
+            if not pasta.is_dir() or not numero_canto.isdigit():
+                continue
+            canto = self.canto(int(numero_canto))
+            for arquivo in sorted(pasta.iterdir()):
+                if arquivo.suffix.lower() not in EXTENSOES_IMAGEM or not arquivo.stem.isdigit():
+                    continue
+                total += 1
+                nome = arquivo.relative_to(raiz_media).as_posix()
+                imagem = existentes.get((canto.pk, int(arquivo.stem)))
+                if imagem is None:
+                    novas.append(PaginaImagem(
+                        canto=canto, numero=int(arquivo.stem), imagem=nome,
+                        atualizado_em=agora,
+                    ))
+                elif imagem.imagem.name != nome:
+                    # as derivadas antigas não valem para a imagem nova
+                    imagem.imagem = nome
+                    imagem.largura = imagem.altura = None
+                    imagem.derivados = []
+                    imagem.atualizado_em = agora
+                    alteradas.append(imagem)
+
+        with transaction.atomic():
+            PaginaImagem.objects.bulk_create(novas, batch_size=lote)
+            PaginaImagem.objects.bulk_update(alteradas, CAMPOS_IMAGEM, batch_size=lote)
+
+        # bulk_create/bulk_update não chamam save(): as derivadas são geradas aqui
+        derivadas, erros = PaginaImagem.gerar_derivados_de(novas + alteradas, processos)
+        for imagem, erro in erros:
+            self.stderr.write(f"{imagem}: {erro}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"imagens: {total} arquivos; {len(novas)} criadas, "
+            f"{len(alteradas)} atualizadas, derivadas de {len(derivadas)}."
+        ))
+        if novas or alteradas:
+            self.stdout.write(
+                "Os tiles do zoom não são gerados na importação: rode gerar_tiles."
+            )
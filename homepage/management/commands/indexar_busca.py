@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from homepage import busca
+from homepage.models import PaginaTexto
+
+
+class Command(BaseCommand):
+    help = "Recria o índice de busca (FTS5) com os versos de todas as PaginaTexto."
+
+    def handle(self, *args, **options):
+        if not busca.disponivel():
+            raise CommandError("A busca de texto completo requer SQLite com FTS5.")
+
+        textos = PaginaTexto.objects.select_related("canto").iterator(chunk_size=200)
+        total = busca.reindexar(textos)
+
+        self.stdout.write(self.style.SUCCESS(f"{total} versos indexados."))
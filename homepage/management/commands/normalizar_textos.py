@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from homepage.models import PaginaTexto
+
+
+class Command(BaseCommand):
+    help = (
+        "Recria as tabelas de estrofes, versos e tokens a partir do TEI "
+        "de cada PaginaTexto."
+    )
+
+    def handle(self, *args, **options):
+        paginas = versos = 0
+
+        for texto in PaginaTexto.objects.iterator(chunk_size=200):
+            with transaction.atomic():
+                versos += texto.normalizar()
+            paginas += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{versos} versos gravados a partir de {paginas} páginas."
+        ))
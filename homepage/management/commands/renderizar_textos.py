@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from homepage.models import PaginaTexto
+
+
+class Command(BaseCommand):
+    help = "Regenera o HTML guardado de cada PaginaTexto a partir do TEI."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--forcar",
+            action="store_true",
+            help="Regenera mesmo as páginas cujo TEI não mudou.",
+        )
+        parser.add_argument(
+            "--lote",
+            type=int,
+            default=200,
+            help="Quantidade de páginas gravadas por vez (padrão: 200).",
+        )
+
+    def handle(self, *args, **options):
+        alterados = []
+        total = 0
+
+        textos = PaginaTexto.objects.select_related("canto")
+        for texto in textos.iterator(chunk_size=options["lote"]):
+            total += 1
+            if texto.renderizar(forcar=options["forcar"]):
+                alterados.append(texto)
+
+        with transaction.atomic():
+            PaginaTexto.objects.bulk_update(
+                alterados,
+                ["html_renderizado", "tei_hash", "atualizado_em"],
+                batch_size=options["lote"],
+            )
+            # bulk_update não chama save(): as tabelas e a busca são refeitas aqui
+            PaginaTexto.derivar_paginas(alterados)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(alterados)} de {total} páginas regeneradas."
+        ))
@@ -0,0 +1,69 @@
+# Generated by Django 6.0 on 2026-10-18 10:00
+
+import hashlib
+
+from django.db import migrations, models
+from lxml import etree
+
+
+def tei_para_html(tei_xml):
+    """
+    Cópia congelada da conversão TEI → HTML desta época: a migração não
+    deve mudar de resultado quando homepage/utils/tei.py for alterado.
+    """
+    parser = etree.XMLParser(remove_blank_text=True)
+    root = etree.fromstring(tei_xml.encode(), parser=parser)
+
+    for elem in root.iter():
+        if isinstance(elem.tag, str):
+            elem.tag = etree.QName(elem).localname
+    etree.cleanup_namespaces(root)
+
+    body = root.find(".//body")
+    if body is not None:
+        root = body
+
+    for lg in root.findall(".//lg"):
+        lg.tag = "div"
+        lg.attrib.clear()
+        lg.attrib["class"] = "estrofe"
+    for l in root.findall(".//l"):
+        l.tag = "div"
+        l.attrib.clear()
+        l.attrib["class"] = "verso"
+    for lb in root.findall(".//lb"):
+        lb.tag = "br"
+        lb.attrib.clear()
+    for head in root.findall(".//head"):
+        head.tag = "h3"
+
+    return etree.tostring(root, encoding="unicode", method="html")
+
+
+def renderizar_textos(apps, schema_editor):
+    PaginaTexto = apps.get_model("homepage", "PaginaTexto")
+    for texto in PaginaTexto.objects.all():
+        texto.html_renderizado = tei_para_html(texto.tei_xml)
+        texto.tei_hash = hashlib.sha256(texto.tei_xml.encode()).hexdigest()
+        texto.save(update_fields=["html_renderizado", "tei_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0004_paginatexto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paginatexto',
+            name='html_renderizado',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='paginatexto',
+            name='tei_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.RunPython(renderizar_textos, migrations.RunPython.noop),
+    ]
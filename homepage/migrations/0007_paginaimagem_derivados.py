@@ -0,0 +1,28 @@
+# Generated by Django 6.0 on 2026-10-18 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0006_atualizado_em'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paginaimagem',
+            name='altura',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='paginaimagem',
+            name='derivados',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name='paginaimagem',
+            name='largura',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
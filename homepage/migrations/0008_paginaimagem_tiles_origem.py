@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0007_paginaimagem_derivados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paginaimagem',
+            name='tiles_origem',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 6.0 on 2026-10-18 12:10
+
+import re
+
+from django.db import migrations
+from lxml import etree
+
+TABELA = "homepage_verso_busca"
+
+
+def _juntar_texto(elem, partes):
+    for filho in elem:
+        if isinstance(filho.tag, str):
+            if etree.QName(filho).localname == "lb" and filho.get("break") == "no":
+                partes[:] = ["".join(partes).rstrip().rstrip("-")]
+            else:
+                partes.append(filho.text or "")
+                _juntar_texto(filho, partes)
+        partes.append(filho.tail or "")
+
+
+def extrair_versos(tei_xml):
+    """
+    Cópia congelada da extração dos versos para a busca desta época
+    (homepage.busca.extrair_versos): a migração não deve mudar de
+    resultado quando o código da busca for alterado.
+    Gera (estrofe, verso, texto, lemas, pos) para cada <l> do TEI.
+    """
+    # sem remove_blank_text: os espaços entre <w> separam as palavras
+    root = etree.fromstring(tei_xml.encode())
+    for lg in root.iter("{*}lg"):
+        n = lg.get("n", "")
+        estrofe = str(int(n)) if n.isdigit() else ""
+        for numero, l in enumerate(lg.iterchildren("{*}l"), start=1):
+            partes = [l.text or ""]
+            _juntar_texto(l, partes)
+            marcados = list(l.iter("{*}w", "{*}pc"))
+            yield (
+                estrofe,
+                numero,
+                re.sub(r"\s+", " ", "".join(partes)).strip(),
+                " ".join(elem.get("lemma") for elem in marcados if elem.get("lemma")),
+                " ".join(elem.get("pos") for elem in marcados if elem.get("pos")),
+            )
+
+
+def criar_indice(apps, schema_editor):
+    # FTS5 é um recurso do SQLite; em outros bancos a busca fica desativada
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS homepage_verso_busca USING fts5("
+        "texto, lemas, pos, "
+        "canto UNINDEXED, pagina UNINDEXED, versao UNINDEXED, "
+        "estrofe UNINDEXED, verso UNINDEXED, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+
+
+def remover_indice(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS homepage_verso_busca")
+
+
+def indexar_textos(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    PaginaTexto = apps.get_model("homepage", "PaginaTexto")
+    for texto in PaginaTexto.objects.select_related("canto"):
+        for verso in extrair_versos(texto.tei_xml):
+            schema_editor.execute(
+                f"INSERT INTO {TABELA} "
+                "(canto, pagina, versao, estrofe, verso, texto, lemas, pos) "
+                "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                (texto.canto.numero, texto.numero, texto.versao) + verso,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0008_paginaimagem_tiles_origem'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice, remover_indice),
+        migrations.RunPython(indexar_textos, migrations.RunPython.noop),
+    ]
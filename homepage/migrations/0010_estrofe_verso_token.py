@@ -0,0 +1,156 @@
+# Generated by Django 6.0 on 2026-10-18 12:45
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+from lxml import etree
+
+_RE_TOKEN = re.compile(r"([.,:;?!])|([^\s.,:;?!]+)")
+
+
+def _juntar_texto(elem, partes):
+    for filho in elem:
+        if isinstance(filho.tag, str):
+            if etree.QName(filho).localname == "lb" and filho.get("break") == "no":
+                partes[:] = ["".join(partes).rstrip().rstrip("-")]
+            else:
+                partes.append(filho.text or "")
+                _juntar_texto(filho, partes)
+        partes.append(filho.tail or "")
+
+
+def _texto_do_verso(l):
+    partes = [l.text or ""]
+    _juntar_texto(l, partes)
+    return re.sub(r"\s+", " ", "".join(partes)).strip()
+
+
+def _tokens_do_verso(l):
+    marcados = list(l.iter("{*}w", "{*}pc"))
+    if marcados:
+        return [
+            (
+                etree.QName(elem).localname,
+                elem.text or "",
+                elem.get("lemma", ""),
+                elem.get("pos", ""),
+                elem.get("msd", ""),
+                " " if elem.tail and elem.tail[0].isspace() else "",
+            )
+            for elem in marcados
+        ]
+
+    texto = _texto_do_verso(l)
+    tokens = []
+    for match in _RE_TOKEN.finditer(texto):
+        espaco = " " if texto[match.end():match.end() + 1] == " " else ""
+        tipo = "pc" if match.group(1) else "w"
+        tokens.append((tipo, match.group(0), "", "", "", espaco))
+    return tokens
+
+
+def extrair_estrofes(tei_xml):
+    """
+    Cópia congelada de homepage.utils.tei.extrair_estrofes desta época:
+    a migração não deve mudar de resultado quando a extração for alterada.
+    """
+    # sem remove_blank_text: os espaços entre <w> separam as palavras
+    root = etree.fromstring(tei_xml.encode())
+
+    estrofes = []
+    for lg in root.iter("{*}lg"):
+        n = lg.get("n", "")
+        versos = [(_texto_do_verso(l), _tokens_do_verso(l)) for l in lg.iterchildren("{*}l")]
+        estrofes.append((int(n) if n.isdigit() else None, versos))
+    return estrofes
+
+
+def normalizar_textos(apps, schema_editor):
+    PaginaTexto = apps.get_model("homepage", "PaginaTexto")
+    Estrofe = apps.get_model("homepage", "Estrofe")
+    Verso = apps.get_model("homepage", "Verso")
+    Token = apps.get_model("homepage", "Token")
+
+    for texto in PaginaTexto.objects.all():
+        for ordem, (numero, versos) in enumerate(extrair_estrofes(texto.tei_xml)):
+            estrofe = Estrofe.objects.create(
+                texto=texto, canto_id=texto.canto_id, pagina=texto.numero,
+                versao=texto.versao, numero=numero, ordem=ordem,
+            )
+            for numero_verso, (texto_verso, tokens) in enumerate(versos, start=1):
+                verso = Verso.objects.create(
+                    estrofe=estrofe, numero=numero_verso, texto=texto_verso
+                )
+                Token.objects.bulk_create(
+                    Token(verso=verso, ordem=i, tipo=tipo, forma=forma, lema=lema,
+                          pos=pos, msd=msd, espaco=espaco)
+                    for i, (tipo, forma, lema, pos, msd, espaco) in enumerate(tokens)
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('homepage', '0009_verso_busca'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Estrofe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pagina', models.PositiveIntegerField()),
+                ('versao', models.CharField(choices=[('original', 'Original'), ('modernizado', 'Modernizado')], max_length=20)),
+                ('numero', models.PositiveIntegerField(blank=True, null=True)),
+                ('ordem', models.PositiveIntegerField()),
+                ('canto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estrofes', to='homepage.canto')),
+                ('texto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='estrofes', to='homepage.paginatexto')),
+            ],
+            options={
+                'ordering': ['canto', 'pagina', 'ordem'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Verso',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveIntegerField()),
+                ('texto', models.TextField()),
+                ('estrofe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='versos', to='homepage.estrofe')),
+            ],
+            options={
+                'ordering': ['numero'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Token',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ordem', models.PositiveIntegerField()),
+                ('tipo', models.CharField(choices=[('w', 'Palavra'), ('pc', 'Pontuação')], max_length=2)),
+                ('forma', models.CharField(max_length=100)),
+                ('lema', models.CharField(blank=True, max_length=100)),
+                ('pos', models.CharField(blank=True, max_length=20)),
+                ('msd', models.CharField(blank=True, max_length=200)),
+                ('espaco', models.CharField(blank=True, max_length=1)),
+                ('verso', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens', to='homepage.verso')),
+            ],
+            options={
+                'ordering': ['ordem'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='estrofe',
+            index=models.Index(fields=['canto', 'versao', 'numero'], name='homepage_es_canto_i_acdcbc_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='verso',
+            unique_together={('estrofe', 'numero')},
+        ),
+        migrations.AddIndex(
+            model_name='token',
+            index=models.Index(fields=['lema'], name='homepage_to_lema_5c56c3_idx'),
+        ),
+        migrations.RunPython(normalizar_textos, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,20 @@
-from django.db import models
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.db import connection, models, transaction
+from django.utils import timezone
+from lxml import etree
+
+from . import busca
+from .utils.imagens import gerar_derivados, nome_derivado
+from .utils.paralelo import mapear_em_processos
+from .utils.tiles import pasta_tiles
+from .utils.tei import extrair_estrofes, tei_para_html
+
+logger = logging.getLogger(__name__)
 
 ## CANTO
 
@@ -6,6 +22,15 @@ class Canto(models.Model):
     numero = models.PositiveIntegerField(unique=True)
     titulo = models.CharField(max_length=200, blank=True)
 
+    # número como está no banco (None se ainda não salvo); ver sinais.py
+    _numero_salvo = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._numero_salvo = instancia.__dict__.get("numero")
+        return instancia
+
     def __str__(self):
         return f"Canto {self.numero}"
 
@@ -19,6 +44,16 @@ class PaginaImagem(models.Model):
     )
     numero = models.PositiveIntegerField()
     imagem = models.ImageField(upload_to="poema/")
+    # preenchidos junto com as derivadas, sem abrir o arquivo a cada consulta;
+    # largura None = derivadas ainda não geradas (uma imagem menor que a
+    # menor derivada fica com largura e derivados vazio, e não é refeita)
+    largura = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    altura = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # larguras das versões reduzidas já geradas (ver utils/imagens.py)
+    derivados = models.JSONField(default=list, blank=True, editable=False)
+    # hash do arquivo a partir do qual a pirâmide de zoom foi gerada
+    tiles_origem = models.CharField(max_length=64, blank=True, editable=False)
+    atualizado_em = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = "Página de imagem"
@@ -26,11 +61,110 @@ class PaginaImagem(models.Model):
         ordering = ["numero"]
         unique_together = ("canto", "numero")
 
+    # nome do arquivo de imagem como está no banco (None se ainda não salvo)
+    _imagem_salva = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._imagem_salva = instancia.__dict__.get("imagem")
+        return instancia
+
     def __str__(self):
         return f"Canto {self.canto.numero} – pág. {self.numero}"
 
+    def save(self, *args, **kwargs):
+        imagem_nova = self.imagem.name != self._imagem_salva
+        if imagem_nova:
+            # as derivadas e os tiles eram da imagem anterior; os tiles são
+            # refeitos pelo comando gerar_tiles, fora da requisição
+            self.largura = self.altura = None
+            self.derivados = []
+            self.tiles_origem = ""
+        super().save(*args, **kwargs)
+        self._imagem_salva = self.imagem.name
+
+        if imagem_nova and self.imagem:
+            # só depois do commit: um rollback não deixa arquivos de uma imagem que não ficou
+            transaction.on_commit(self._gerar_derivados_ao_salvar)
+
+    def _gerar_derivados_ao_salvar(self):
+        for imagem, erro in PaginaImagem.gerar_derivados_de([self], processos=0)[1]:
+            logger.warning("Derivadas de %s não geradas: %s", imagem.imagem.name, erro)
+
+    @classmethod
+    def gerar_derivados_de(cls, imagens, processos=None):
+        """
+        Gera as versões reduzidas das imagens num pool de processos
+        (processos=0: no processo atual) e grava largura, altura e
+        derivados. Retorna (imagens atualizadas, [(imagem, erro)]).
+        """
+        imagens = {imagem.pk: imagem for imagem in imagens}
+        itens = [
+            (pk, (settings.MEDIA_ROOT, imagem.imagem.name))
+            for pk, imagem in imagens.items()
+        ]
+
+        alteradas, erros = [], []
+        agora = timezone.now()
+        for pk, resultado, erro in mapear_em_processos(gerar_derivados, itens, processos):
+            imagem = imagens[pk]
+            if erro:
+                erros.append((imagem, erro))
+                continue
+            (imagem.largura, imagem.altura), imagem.derivados = resultado
+            imagem.atualizado_em = agora
+            alteradas.append(imagem)
+
+        cls.objects.bulk_update(
+            alteradas,
+            ["largura", "altura", "derivados", "atualizado_em"],
+            batch_size=200,
+        )
+        return alteradas, erros
+
+    def _srcset(self, extensao):
+        partes = [
+            f"{default_storage.url(nome_derivado(self.imagem.name, largura, extensao))} {largura}w"
+            for largura in self.derivados
+        ]
+        # o original entra no srcset JPEG como a maior opção
+        if extensao == "jpg" and self.largura:
+            partes.append(f"{self.imagem.url} {self.largura}w")
+        return ", ".join(partes)
+
+    @property
+    def srcset_jpg(self):
+        return self._srcset("jpg")
+
+    @property
+    def srcset_webp(self):
+        return self._srcset("webp")
+
+    @property
+    def url_dzi(self):
+        """Descritor Deep Zoom em MEDIA_URL, servido direto pelo servidor web."""
+        return default_storage.url(
+            f"{pasta_tiles(self.canto.numero, self.numero)}/imagem.dzi"
+        )
+
+    @property
+    def url_miniatura(self):
+        """Menor derivada disponível; o original se ainda não houver nenhuma."""
+        if not self.derivados:
+            return self.imagem.url
+        return default_storage.url(
+            nome_derivado(self.imagem.name, min(self.derivados), "jpg")
+        )
+
 
 ## TEXTO
+
+# colunas de Token gravadas por normalizar_paginas, na ordem de cada linha:
+# o verso, a ordem e os campos de utils.tei.extrair_estrofes
+CAMPOS_TOKEN = ("verso", "ordem", "tipo", "forma", "lema", "pos", "msd", "espaco")
+
+
 class PaginaTexto(models.Model):
     VERSOES = [
         ("original", "Original"),
@@ -51,12 +185,205 @@ class PaginaTexto(models.Model):
         help_text="Cole aqui o TEI-XML"
     )
 
+    # HTML gerado a partir do TEI, guardado para não converter a cada acesso
+    tei_hash = models.CharField(max_length=64, blank=True, editable=False)
+    html_renderizado = models.TextField(blank=True, editable=False)
+    atualizado_em = models.DateTimeField(auto_now=True)
+
     class Meta:
         unique_together = ("canto", "numero", "versao")
         ordering = ["numero"]
 
+    # (canto_id, numero, versao, tei_hash) como estão no banco (None se
+    # ainda não salvo): sinais.py refaz as tabelas derivadas se mudarem
+    _salvo = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        instancia._salvo = instancia.estado_derivado()
+        return instancia
+
     def __str__(self):
         return f"Canto {self.canto.numero} – pág. {self.numero} ({self.versao})"
 
+    def estado_derivado(self):
+        """Campos dos quais Estrofe, Verso, Token e o índice de busca dependem."""
+        return tuple(
+            self.__dict__.get(campo)
+            for campo in ("canto_id", "numero", "versao", "tei_hash")
+        )
+
+    def renderizar(self, forcar=False):
+        """Regenera o HTML se o TEI mudou. Retorna True se houve regeneração."""
+        tei_hash = hashlib.sha256(self.tei_xml.encode()).hexdigest()
+        if not forcar and tei_hash == self.tei_hash:
+            return False
+
+        self.html_renderizado = tei_para_html(self.tei_xml)
+        self.tei_hash = tei_hash
+        # bulk_update não aplica auto_now; o ETag da leitura depende disto
+        self.atualizado_em = timezone.now()
+        return True
+
+    def clean(self):
+        # sem isto um TEI malformado colado no admin vira erro 500 ao salvar
+        try:
+            etree.fromstring(self.tei_xml.encode())
+        except etree.XMLSyntaxError as erro:
+            raise ValidationError({"tei_xml": f"TEI-XML inválido: {erro}"})
+
+    def save(self, *args, **kwargs):
+        if self.renderizar():
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {
+                    *update_fields, "tei_hash", "html_renderizado",
+                    "atualizado_em",
+                }
+        # Estrofe, Verso, Token e a busca são refeitos em sinais.py, na
+        # mesma transação: se falharem, o novo tei_hash não fica gravado
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def derivar_paginas(cls, textos):
+        """
+        Refaz o que é derivado do TEI das páginas (Estrofe, Verso, Token e
+        o índice de busca), para quem grava sem save(), como bulk_update.
+        """
+        cls.normalizar_paginas(textos)
+        for texto in textos:
+            busca.indexar_pagina(texto)
+
+    def normalizar(self):
+        """Recria as linhas de Estrofe, Verso e Token desta página a partir do TEI."""
+        return PaginaTexto.normalizar_paginas([self])
+
+    @classmethod
+    def normalizar_paginas(cls, textos):
+        """
+        normalizar() de várias páginas de uma vez, numa transação: um
+        INSERT por tabela para todas elas, e os tokens (a maior parte das
+        linhas) gravados direto com executemany, sem instanciar um Token
+        por linha (bulk_create leva o dobro do tempo). As colunas são as
+        de CAMPOS_TOKEN, que os testes comparam com os campos de Token.
+        Retorna o número de versos gravados.
+        """
+        with transaction.atomic():
+            return cls._normalizar_paginas(textos)
+
+    @classmethod
+    def _normalizar_paginas(cls, textos):
+        Estrofe.objects.filter(texto__in=[texto.pk for texto in textos]).delete()
+
+        estrofes, versos, tokens = [], [], []
+        for texto in textos:
+            for ordem, (numero, dados_versos) in enumerate(extrair_estrofes(texto.tei_xml)):
+                estrofe = Estrofe(
+                    texto=texto,
+                    canto_id=texto.canto_id,
+                    pagina=texto.numero,
+                    versao=texto.versao,
+                    numero=numero,
+                    ordem=ordem,
+                )
+                estrofes.append(estrofe)
+                for numero_verso, (texto_verso, dados_tokens) in enumerate(dados_versos, start=1):
+                    verso = Verso(estrofe=estrofe, numero=numero_verso, texto=texto_verso)
+                    versos.append(verso)
+                    tokens.append((verso, dados_tokens))
 
+        # bulk_create preenche as chaves, e os filhos as herdam dos pais já salvos
+        Estrofe.objects.bulk_create(estrofes, batch_size=500)
+        Verso.objects.bulk_create(versos, batch_size=500)
 
+        colunas = ", ".join(
+            connection.ops.quote_name(Token._meta.get_field(campo).column)
+            for campo in CAMPOS_TOKEN
+        )
+        marcas = ", ".join(["%s"] * len(CAMPOS_TOKEN))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {connection.ops.quote_name(Token._meta.db_table)} "
+                f"({colunas}) VALUES ({marcas})",
+                [
+                    (verso.pk, ordem_token, *dados)
+                    for verso, dados_tokens in tokens
+                    for ordem_token, dados in enumerate(dados_tokens)
+                ],
+            )
+        return len(versos)
+
+
+## ESTROFES, VERSOS E TOKENS
+# Forma normalizada do TEI de cada PaginaTexto, gerada ao salvar a página.
+# O TEI continua sendo a fonte; estas tabelas só existem para consulta.
+
+class Estrofe(models.Model):
+    texto = models.ForeignKey(
+        PaginaTexto,
+        on_delete=models.CASCADE,
+        related_name="estrofes"
+    )
+    canto = models.ForeignKey(
+        Canto,
+        on_delete=models.CASCADE,
+        related_name="estrofes"
+    )
+    pagina = models.PositiveIntegerField()
+    versao = models.CharField(max_length=20, choices=PaginaTexto.VERSOES)
+    # atributo n do <lg>; uma estrofe dividida entre páginas aparece nas duas
+    numero = models.PositiveIntegerField(null=True, blank=True)
+    ordem = models.PositiveIntegerField()
+
+    class Meta:
+        ordering = ["canto", "pagina", "ordem"]
+        indexes = [models.Index(fields=["canto", "versao", "numero"])]
+
+    def __str__(self):
+        return f"Estrofe {self.numero} – pág. {self.pagina} ({self.versao})"
+
+
+class Verso(models.Model):
+    estrofe = models.ForeignKey(
+        Estrofe,
+        on_delete=models.CASCADE,
+        related_name="versos"
+    )
+    numero = models.PositiveIntegerField()
+    texto = models.TextField()
+
+    class Meta:
+        ordering = ["numero"]
+        unique_together = ("estrofe", "numero")
+
+    def __str__(self):
+        return self.texto
+
+
+class Token(models.Model):
+    TIPOS = [
+        ("w", "Palavra"),
+        ("pc", "Pontuação"),
+    ]
+
+    verso = models.ForeignKey(
+        Verso,
+        on_delete=models.CASCADE,
+        related_name="tokens"
+    )
+    ordem = models.PositiveIntegerField()
+    tipo = models.CharField(max_length=2, choices=TIPOS)
+    forma = models.CharField(max_length=100)
+    lema = models.CharField(max_length=100, blank=True)
+    pos = models.CharField(max_length=20, blank=True)
+    msd = models.CharField(max_length=200, blank=True)
+    espaco = models.CharField(max_length=1, blank=True)
+
+    class Meta:
+        ordering = ["ordem"]
+        indexes = [models.Index(fields=["lema"])]
+
+    def __str__(self):
+        return self.forma
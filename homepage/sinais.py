@@ -0,0 +1,47 @@
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+
+from . import busca
+from .models import Canto, PaginaTexto
+
+# -----------------------
+# TABELAS DERIVADAS DO TEI
+# -----------------------
+# Estrofe, Verso, Token e o índice de busca (homepage_verso_busca) são
+# chaveados por canto, página e versão. Os sinais os mantêm em dia também
+# quando a página é apagada por um queryset (ação "excluir" do admin) ou
+# quando só a chave muda. bulk_create/bulk_update não enviam sinais: quem
+# os usa chama PaginaTexto.derivar_paginas.
+
+
+@receiver(post_save, sender=PaginaTexto)
+def derivar_pagina_salva(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    anterior, atual = instance._salvo, instance.estado_derivado()
+    if anterior == atual:
+        return
+
+    if anterior is not None and anterior[:3] != atual[:3]:
+        canto_id, numero, versao, _ = anterior
+        numero_canto = (
+            instance.canto.numero if canto_id == instance.canto_id
+            else Canto.objects.filter(pk=canto_id).values_list("numero", flat=True).first()
+        )
+        busca.remover_pagina(numero_canto, numero, versao)
+    PaginaTexto.derivar_paginas([instance])
+    instance._salvo = atual
+
+
+@receiver(pre_delete, sender=PaginaTexto)
+def remover_pagina_da_busca(sender, instance, **kwargs):
+    # Estrofe, Verso e Token saem em cascata; o índice FTS não tem chave estrangeira
+    busca.remover_pagina(instance.canto.numero, instance.numero, instance.versao)
+
+
+@receiver(post_save, sender=Canto)
+def renumerar_canto(sender, instance, raw=False, **kwargs):
+    anterior = instance._numero_salvo
+    if not raw and anterior is not None and anterior != instance.numero:
+        busca.renumerar_canto(anterior, instance.numero)
+    instance._numero_salvo = instance.numero
@@ -0,0 +1,9 @@
+from django import template
+from django.contrib.staticfiles import finders
+
+register = template.Library()
+
+@register.simple_tag
+def estatico_disponivel(caminho):
+    """Se o arquivo está entre os estáticos (ex.: uma biblioteca copiada à mão para static/vendor)."""
+    return finders.find(caminho) is not None
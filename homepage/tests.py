@@ -1,3 +1,1505 @@
-from django.test import TestCase
+import importlib
+import json
+import re
+import shutil
+import sys
+import tempfile
+from difflib import SequenceMatcher
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from lxml import etree
+from PIL import Image
+
+from . import busca as busca_fts
+from .consultas import estrofes_da_pagina
+from .exportacao import caminho_de, listar_urls, paginacao_em_caminhos
+from .models import CAMPOS_TOKEN, Canto, Estrofe, PaginaImagem, PaginaTexto, Token, Verso
+from .utils import aparato
+from .utils.imagens import nome_derivado
+from .utils.tei import extrair_estrofes, tei_para_html
+
+MEDIA_TESTES = tempfile.mkdtemp()
+
+
+def tearDownModule():
+    shutil.rmtree(MEDIA_TESTES, ignore_errors=True)
+
+
+def imagem_de_teste(nome, tamanho=(400, 600)):
+    """Cria um JPEG em MEDIA_TESTES e devolve o nome relativo."""
+    caminho = Path(MEDIA_TESTES) / nome
+    if not caminho.exists():
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        Image.new("RGB", tamanho, "white").save(caminho, "JPEG")
+    return nome
+
+TEI = (
+    '<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body>'
+    '<lg type="estrofe" n="1"><l>As armas e os barões assinalados,</l></lg>'
+    "</body></text></TEI>"
+)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TESTES)
+class ConsultasLeituraTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.canto = Canto.objects.create(numero=1)
+        for numero in (1, 2, 3):
+            PaginaImagem.objects.create(
+                canto=cls.canto, numero=numero, imagem=imagem_de_teste(f"poema/canto_1/{numero}.jpg")
+            )
+            for versao in ("original", "modernizado"):
+                PaginaTexto.objects.create(
+                    canto=cls.canto, numero=numero, versao=versao, tei_xml=TEI
+                )
+
+    def test_leitura_usa_duas_consultas(self):
+        url = reverse("leitura_paginada", args=[1, "modernizado", "esq", 2])
+        with self.assertNumQueries(2):
+            resposta = self.client.get(url)
+
+        self.assertEqual(resposta.context["pagina_num"], 2)
+        self.assertEqual(resposta.context["imagem"].numero, 2)
+        self.assertEqual(len(resposta.context["paginas"]), 3)
+        self.assertIn('class="verso"', resposta.context["html_esq"])
+        self.assertIn('class="verso"', resposta.context["html_dir"])
+
+    def test_leitura_de_imagem_busca_um_texto(self):
+        url = reverse("leitura", args=[1, "imagem", "esq"])
+        with self.assertNumQueries(2):
+            resposta = self.client.get(url, {"p": 3})
+
+        self.assertEqual(resposta.context["imagem"].numero, 3)
+        self.assertEqual(resposta.context["html_esq"], "")
+        self.assertNotEqual(resposta.context["html_dir"], "")
+
+    def test_canto_usa_uma_consulta(self):
+        with self.assertNumQueries(1):
+            resposta = self.client.get(reverse("canto", args=[1]), {"p": 2})
+
+        self.assertEqual(resposta.context["pagina"].numero, 2)
+
+    def test_canto_index_usa_uma_consulta(self):
+        with self.assertNumQueries(1):
+            resposta = self.client.get(reverse("canto_index", args=[1]))
+
+        self.assertEqual(
+            [p.numero for p in resposta.context["paginas"]], [1, 2, 3]
+        )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TESTES)
+class AdminConsultasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser("admin", "", "senha")
+        cls.canto = Canto.objects.create(numero=1)
+
+    def _consultas_da_listagem(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(url)
+        return len(consultas)
+
+    def test_listagens_nao_consultam_o_canto_por_linha(self):
+        self.client.force_login(self.usuario)
+        urls = [
+            reverse("admin:homepage_paginaimagem_changelist"),
+            reverse("admin:homepage_paginatexto_changelist"),
+        ]
+
+        def criar_paginas(numeros):
+            for numero in numeros:
+                PaginaImagem.objects.create(
+                    canto=self.canto, numero=numero, imagem=imagem_de_teste(f"poema/{numero}.jpg")
+                )
+                PaginaTexto.objects.create(
+                    canto=self.canto, numero=numero, versao="original", tei_xml=TEI
+                )
+
+        criar_paginas([1])
+        antes = [self._consultas_da_listagem(url) for url in urls]
+        criar_paginas([2, 3, 4])
+        depois = [self._consultas_da_listagem(url) for url in urls]
+
+        self.assertEqual(antes, depois)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TESTES)
+class CacheHttpLeituraTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.canto = Canto.objects.create(numero=1)
+        PaginaImagem.objects.create(
+            canto=cls.canto, numero=1, imagem=imagem_de_teste("poema/canto_1/1.jpg")
+        )
+        cls.texto = PaginaTexto.objects.create(
+            canto=cls.canto, numero=1, versao="modernizado", tei_xml=TEI
+        )
+        cls.url = reverse("leitura_paginada", args=[1, "modernizado", "esq", 1])
+
+    def test_resposta_tem_validadores_e_cache_control(self):
+        resposta = self.client.get(self.url)
+
+        self.assertTrue(resposta.has_header("ETag"))
+        self.assertTrue(resposta.has_header("Last-Modified"))
+        self.assertIn("public", resposta["Cache-Control"])
+        self.assertIn("max-age=", resposta["Cache-Control"])
+
+    def test_etag_igual_retorna_304_sem_consultas_extras(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        with self.assertNumQueries(2):
+            resposta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(resposta.status_code, 304)
+        self.assertEqual(resposta.content, b"")
+
+    def test_etag_muda_quando_o_tei_muda(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        self.texto.tei_xml = TEI.replace("armas", "Armas")
+        self.texto.save()
+
+        resposta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+        self.assertNotEqual(resposta["ETag"], etag)
+
+    def test_etag_depende_das_colunas(self):
+        outra = reverse("leitura_paginada", args=[1, "imagem", "esq", 1])
+        self.assertNotEqual(
+            self.client.get(self.url)["ETag"], self.client.get(outra)["ETag"]
+        )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TESTES)
+class DerivadasImagemTests(TestCase):
+    def setUp(self):
+        self.canto = Canto.objects.create(numero=2)
+
+    def test_derivadas_geradas_pelo_comando(self):
+        nome = imagem_de_teste("poema/canto_2/1.jpg", tamanho=(700, 1000))
+        # sem commit (o TestCase não confirma a transação) o save não gera nada
+        imagem = PaginaImagem.objects.create(canto=self.canto, numero=1, imagem=nome)
+        self.assertEqual(imagem.derivados, [])
+        self.assertEqual(imagem.url_miniatura, "/media/poema/canto_2/1.jpg")
+
+        call_command("gerar_derivados", processos=1, stdout=StringIO())
+
+        salva = PaginaImagem.objects.get(pk=imagem.pk)
+        self.assertEqual(salva.derivados, [160, 320, 640])
+        self.assertEqual((salva.largura, salva.altura), (700, 1000))
+        for largura in salva.derivados:
+            for extensao in ("jpg", "webp"):
+                derivada = Path(MEDIA_TESTES) / nome_derivado(nome, largura, extensao)
+                self.assertTrue(derivada.exists(), derivada)
+        self.assertIn("canto_2/1-320.webp 320w", salva.srcset_webp)
+        self.assertTrue(salva.srcset_jpg.endswith("/media/poema/canto_2/1.jpg 700w"))
+        self.assertTrue(salva.url_miniatura.endswith("canto_2/1-160.jpg"))
+
+    def test_derivadas_geradas_ao_salvar_depois_do_commit(self):
+        nome = imagem_de_teste("poema/canto_2/4.jpg", tamanho=(400, 600))
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            imagem = PaginaImagem.objects.create(canto=self.canto, numero=4, imagem=nome)
+            self.assertEqual(imagem.derivados, [])
+        self.assertEqual(len(callbacks), 1)
+
+        salva = PaginaImagem.objects.get(pk=imagem.pk)
+        self.assertEqual(salva.derivados, [160, 320])
+        self.assertEqual((salva.largura, salva.altura), (400, 600))
+        self.assertTrue((Path(MEDIA_TESTES) / nome_derivado(nome, 320, "webp")).exists())
+
+        # salvar sem trocar a imagem não agenda nada
+        with self.captureOnCommitCallbacks() as callbacks:
+            salva.save()
+        self.assertEqual(callbacks, [])
+
+    def test_imagem_menor_que_as_derivadas_so_e_processada_uma_vez(self):
+        nome = imagem_de_teste("poema/canto_2/5.jpg", tamanho=(120, 180))
+        PaginaImagem.objects.create(canto=self.canto, numero=5, imagem=nome)
+
+        saida = StringIO()
+        call_command("gerar_derivados", processos=0, stdout=saida)
+        self.assertIn("para 1 de 1 imagens", saida.getvalue())
+        salva = PaginaImagem.objects.get(numero=5)
+        self.assertEqual((salva.largura, salva.derivados), (120, []))
+        self.assertEqual(salva.url_miniatura, "/media/poema/canto_2/5.jpg")
+
+        saida = StringIO()
+        call_command("gerar_derivados", processos=0, stdout=saida)
+        self.assertIn("para 0 de 0 imagens", saida.getvalue())
+
+    def test_imagem_nova_descarta_as_derivadas(self):
+        imagem = PaginaImagem.objects.create(
+            canto=self.canto, numero=3, imagem=imagem_de_teste("poema/canto_2/3.jpg")
+        )
+        call_command("gerar_derivados", processos=1, stdout=StringIO())
+        imagem.refresh_from_db()
+        self.assertTrue(imagem.derivados)
+
+        imagem.imagem = imagem_de_teste("poema/canto_2/3b.jpg")
+        imagem.save()
+
+        salva = PaginaImagem.objects.get(pk=imagem.pk)
+        self.assertEqual(salva.derivados, [])
+        self.assertIsNone(salva.largura)
+
+    def test_canto_index_usa_srcset(self):
+        nome = imagem_de_teste("poema/canto_2/2.jpg")
+        PaginaImagem.objects.create(canto=self.canto, numero=2, imagem=nome)
+        call_command("gerar_derivados", processos=1, stdout=StringIO())
+
+        resposta = self.client.get(reverse("canto_index", args=[2]))
+
+        self.assertContains(resposta, 'type="image/webp"')
+        self.assertContains(resposta, "/media/poema/derivados/canto_2/2-160.jpg")
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TESTES)
+class TilesTests(TestCase):
+    def setUp(self):
+        self.canto = Canto.objects.create(numero=3)
+        nome = imagem_de_teste("poema/canto_3/1.jpg", tamanho=(600, 300))
+        self.imagem = PaginaImagem.objects.create(
+            canto=self.canto, numero=1, imagem=nome
+        )
+        self.pasta = Path(MEDIA_TESTES) / "poema/tiles/canto_3/1"
+
+    def gerar(self):
+        call_command("gerar_tiles", processos=1, stdout=StringIO())
+        self.imagem.refresh_from_db()
+
+    def test_piramide_gerada_pelo_comando(self):
+        self.assertEqual(self.imagem.tiles_origem, "")
+
+        self.gerar()
+
+        self.assertEqual(len(self.imagem.tiles_origem), 64)
+        descritor = (self.pasta / "imagem.dzi").read_bytes()
+        self.assertIn(b'Width="600" Height="300"', descritor)
+        self.assertEqual(self.imagem.url_dzi, "/media/poema/tiles/canto_3/1/imagem.dzi")
+
+    def test_tiles_de_cada_nivel(self):
+        self.gerar()
+        # nível 10 = original (600x300): 3 colunas x 2 linhas de 254 px
+        self.assertTrue((self.pasta / "imagem_files/10/2_1.jpg").exists())
+        self.assertFalse((self.pasta / "imagem_files/10/3_0.jpg").exists())
+        self.assertTrue((self.pasta / "imagem_files/0/0_0.jpg").exists())
+
+    def test_leitura_oferece_zoom_com_a_biblioteca_local(self):
+        url = reverse("leitura_paginada", args=[3, "imagem", "esq", 1])
+        estaticos = Path(MEDIA_TESTES) / "estaticos"
+        biblioteca = estaticos / "vendor/openseadragon/openseadragon.min.js"
+        biblioteca.parent.mkdir(parents=True, exist_ok=True)
+        biblioteca.write_text("// OpenSeadragon")
+        com_biblioteca = override_settings(
+            STATICFILES_DIRS=[*settings.STATICFILES_DIRS, estaticos]
+        )
+        with com_biblioteca:
+            self.assertNotContains(self.client.get(url), "data-dzi")
+
+        self.gerar()
+
+        # sem a biblioteca em static/vendor, o botão levaria a um ReferenceError
+        if not (settings.BASE_DIR / "static" / "vendor/openseadragon/openseadragon.min.js").exists():
+            resposta = self.client.get(url)
+            self.assertNotContains(resposta, "data-dzi")
+            self.assertNotContains(resposta, "Ampliar")
+
+        with com_biblioteca:
+            resposta = self.client.get(url)
+        self.assertContains(resposta, 'data-dzi="/media/poema/tiles/canto_3/1/imagem.dzi"')
+        self.assertContains(resposta, "/static/vendor/openseadragon/openseadragon.min.js")
+        self.assertNotContains(resposta, "cdn.jsdelivr.net/npm/openseadragon")
+
+
+TEI_ETIQUETADO = (
+    '<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body>'
+    '<lg type="estrofe" n="3">'
+    '<l><w lemma="cessar" pos="VERB">Cessem</w> <w lemma="de" pos="ADP">do</w> '
+    '<w lemma="sábio" pos="ADJ">sábio</w> <w lemma="grego" pos="PROPN">Grego</w></l>'
+    "<l>As navega-<lb break=\"no\"/>ções grandes que fizeram</l>"
+    "</lg></body></text></TEI>"
+)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TESTES)
+class BuscaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.canto = Canto.objects.create(numero=1)
+        cls.texto = PaginaTexto.objects.create(
+            canto=cls.canto, numero=2, versao="original", tei_xml=TEI_ETIQUETADO
+        )
+        PaginaTexto.objects.create(
+            canto=cls.canto, numero=1, versao="modernizado", tei_xml=TEI
+        )
+
+    def test_busca_por_forma_sem_acentos(self):
+        resposta = self.client.get(reverse("busca"), {"q": "sabio"})
+
+        resultados = list(resposta.context["pagina"])
+        self.assertEqual(len(resultados), 1)
+        self.assertEqual(resultados[0]["estrofe"], "3")
+        self.assertEqual(resultados[0]["verso"], 1)
+        self.assertIn("<mark>sábio</mark>", resultados[0]["destaque"])
+        self.assertContains(
+            resposta, reverse("leitura_paginada", args=[1, "original", "esq", 2])
+        )
+
+    def test_busca_por_lema_e_palavra_hifenizada(self):
+        resposta = self.client.get(reverse("busca"), {"q": "cessar", "campo": "lemas"})
+        self.assertEqual(resposta.context["pagina"].paginator.count, 1)
+
+        resposta = self.client.get(reverse("busca"), {"q": "navegacoes"})
+        self.assertEqual(resposta.context["pagina"].paginator.count, 1)
+
+    def test_indice_acompanha_alteracoes(self):
+        self.texto.tei_xml = TEI
+        self.texto.save()
+        self.assertEqual(busca_fts.buscar("sabio").count(), 0)
+        self.assertEqual(busca_fts.buscar("armas").count(), 2)
+
+        self.texto.delete()
+        self.assertEqual(busca_fts.buscar("armas").count(), 1)
+
+    def test_exclusao_em_massa_limpa_o_indice(self):
+        # a ação "excluir selecionados" do admin apaga por queryset
+        PaginaTexto.objects.filter(canto=self.canto).delete()
+        self.assertEqual(busca_fts.buscar("sabio").count(), 0)
+        self.assertEqual(busca_fts.buscar("armas").count(), 0)
+
+    def test_trocar_a_pagina_refaz_o_indice_e_as_estrofes(self):
+        self.texto.numero = 5
+        self.texto.save()
+
+        resultados = list(busca_fts.buscar("sabio")[:10])
+        self.assertEqual([r["pagina"] for r in resultados], [5])
+        self.assertEqual(
+            set(Estrofe.objects.filter(texto=self.texto).values_list("pagina", flat=True)),
+            {5},
+        )
+
+        self.canto.numero = 7
+        self.canto.save()
+        resultados = list(busca_fts.buscar("sabio")[:10])
+        self.assertEqual([(r["canto"], r["pagina"]) for r in resultados], [(7, 5)])
+
+    def test_consulta_ignora_operadores(self):
+        resposta = self.client.get(reverse("busca"), {"q": 'armas" OR NOT ('})
+        self.assertEqual(resposta.status_code, 200)
+
+    def test_migracao_indexa_como_a_busca_atual(self):
+        # a extração está congelada na migração que criou o índice
+        migracao = importlib.import_module("homepage.migrations.0009_verso_busca")
+        modernizado = settings.BASE_DIR / "LusiadasTextos" / "LusiadasModernizado.xml"
+        for tei_xml in (TEI, TEI_ETIQUETADO, modernizado.read_text(encoding="utf-8")):
+            self.assertEqual(
+                list(migracao.extrair_versos(tei_xml)), list(busca_fts.extrair_versos(tei_xml))
+            )
+        self.assertEqual(migracao.TABELA, busca_fts.TABELA)
+
+
+class NormalizacaoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.canto = Canto.objects.create(numero=1)
+        cls.texto = PaginaTexto.objects.create(
+            canto=cls.canto, numero=2, versao="original", tei_xml=TEI_ETIQUETADO
+        )
+
+    def test_estrofes_versos_e_tokens_gravados(self):
+        with self.assertNumQueries(3):
+            estrofes = estrofes_da_pagina(1, 2, "original")
+            versos = [list(e.versos.all()) for e in estrofes]
+            tokens = [list(v.tokens.all()) for v in versos[0]]
+
+        self.assertEqual([e.numero for e in estrofes], [3])
+        self.assertEqual(
+            [v.texto for v in versos[0]],
+            ["Cessem do sábio Grego", "As navegações grandes que fizeram"],
+        )
+        self.assertEqual(
+            [(t.forma, t.lema, t.pos, t.espaco) for t in tokens[0]][:2],
+            [("Cessem", "cessar", "VERB", " "), ("do", "de", "ADP", " ")],
+        )
+        self.assertEqual(tokens[0][-1].espaco, "")
+        # sem <w>/<pc>, o verso é separado a partir do texto corrido
+        self.assertEqual(
+            [t.forma for t in tokens[1]],
+            ["As", "navegações", "grandes", "que", "fizeram"],
+        )
+
+    def test_migracao_extrai_como_a_normalizacao_atual(self):
+        # a extração está congelada na migração que criou as tabelas
+        migracao = importlib.import_module("homepage.migrations.0010_estrofe_verso_token")
+        modernizado = settings.BASE_DIR / "LusiadasTextos" / "LusiadasModernizado.xml"
+        for tei_xml in (TEI, TEI_ETIQUETADO, modernizado.read_text(encoding="utf-8")):
+            self.assertEqual(migracao.extrair_estrofes(tei_xml), extrair_estrofes(tei_xml))
+
+    def test_campos_token_acompanham_o_modelo(self):
+        # normalizar_paginas grava os tokens com SQL direto: um campo novo
+        # ou renomeado em Token tem de entrar em CAMPOS_TOKEN
+        campos = [f.name for f in Token._meta.concrete_fields if not f.primary_key]
+        self.assertCountEqual(campos, CAMPOS_TOKEN)
+        token = Token.objects.get(forma="Cessem")
+        self.assertEqual(
+            [getattr(token, campo) for campo in CAMPOS_TOKEN[1:]],
+            [0, "w", "Cessem", "cessar", "VERB", "", " "],
+        )
+
+    def test_alterar_tei_recria_as_linhas(self):
+        self.texto.tei_xml = TEI
+        self.texto.save()
+
+        self.assertEqual(Estrofe.objects.count(), 1)
+        self.assertEqual(
+            list(Verso.objects.values_list("texto", flat=True)),
+            ["As armas e os barões assinalados,"],
+        )
+        self.assertEqual(
+            list(Token.objects.filter(tipo="pc").values_list("forma", flat=True)),
+            [","],
+        )
+
+        self.texto.delete()
+        self.assertFalse(Token.objects.exists())
+
+    def test_falha_ao_derivar_nao_grava_o_tei(self):
+        hash_anterior = self.texto.tei_hash
+        self.texto.tei_xml = TEI
+        with mock.patch.object(busca_fts, "indexar_pagina", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.texto.save()
+
+        salvo = PaginaTexto.objects.get(pk=self.texto.pk)
+        self.assertEqual(salvo.tei_hash, hash_anterior)
+        self.assertEqual(busca_fts.buscar("sabio").count(), 1)
+
+        # a próxima gravação ainda refaz as tabelas derivadas
+        self.texto.save()
+        self.assertEqual(busca_fts.buscar("armas").count(), 1)
+        self.assertEqual(Estrofe.objects.get().numero, 1)
+
+    def test_tei_malformado_e_erro_de_formulario(self):
+        self.client.force_login(User.objects.create_superuser("admin", "", "senha"))
+
+        resposta = self.client.post(reverse("admin:homepage_paginatexto_add"), {
+            "canto": self.canto.pk, "numero": 3, "versao": "original",
+            "tei_xml": "<TEI><text><l>sem fechar</text>",
+        })
+
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn("tei_xml", resposta.context["adminform"].form.errors)
+        self.assertFalse(PaginaTexto.objects.filter(numero=3).exists())
+
+    def test_renderizar_textos_refaz_linhas_e_busca(self):
+        # update() não passa por save(): só o comando deixa tudo em dia
+        PaginaTexto.objects.filter(pk=self.texto.pk).update(tei_xml=TEI)
+        call_command("renderizar_textos", stdout=StringIO())
+
+        self.assertEqual(
+            list(Verso.objects.values_list("texto", flat=True)),
+            ["As armas e os barões assinalados,"],
+        )
+        self.assertEqual(busca_fts.buscar("armas").count(), 1)
+        self.assertEqual(busca_fts.buscar("sabio").count(), 0)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TESTES)
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.canto = Canto.objects.create(numero=1)
+        for numero in (1, 2, 3):
+            PaginaImagem.objects.create(
+                canto=cls.canto, numero=numero, imagem=imagem_de_teste(f"poema/canto_1/{numero}.jpg")
+            )
+            PaginaTexto.objects.create(
+                canto=cls.canto, numero=numero, versao="original", tei_xml=TEI_ETIQUETADO
+            )
+
+    def test_paginas_por_cursor(self):
+        url = reverse("api_paginas", args=[1])
+        dados = self.client.get(url, {"limite": 2}).json()
+        self.assertEqual([p["numero"] for p in dados["paginas"]], [1, 2])
+        self.assertEqual(dados["paginas"][0]["versoes"], ["original"])
+
+        dados = self.client.get(url, {"limite": 2, "cursor": dados["proximo"]}).json()
+        self.assertEqual([p["numero"] for p in dados["paginas"]], [3])
+        self.assertIsNone(dados["proximo"])
+
+    def test_versos_por_cursor_seguem_a_ordem_do_poema(self):
+        url = reverse("api_versos", args=[1, "original"])
+        vistos, cursor = [], None
+        while True:
+            parametros = {"limite": 4}
+            if cursor:
+                parametros["cursor"] = cursor
+            # a marca dos textos (ETag) e os versos
+            with self.assertNumQueries(2):
+                dados = self.client.get(url, parametros).json()
+            vistos += [(pagina, verso) for pagina, _, verso, _ in dados["versos"]]
+            cursor = dados["proximo"]
+            if not cursor:
+                break
+        self.assertEqual(vistos, [(p, v) for p in (1, 2, 3) for v in (1, 2)])
+
+    def test_texto_da_pagina_com_tokens(self):
+        url = reverse("api_texto_pagina", args=[1, 2, "original"])
+        dados = self.client.get(url, {"tokens": 1}).json()
+        verso = dados["estrofes"][0]["versos"][0]
+        self.assertEqual(verso["texto"], "Cessem do sábio Grego")
+        self.assertEqual(verso["tokens"][0], ["Cessem", "cessar", "VERB", " "])
+
+        self.assertEqual(
+            self.client.get(reverse("api_texto_pagina", args=[1, 2, "modernizado"])).status_code,
+            404,
+        )
+
+    def test_etag_gzip_e_cache(self):
+        url = reverse("api_paginas", args=[1])
+        resposta = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(resposta["Content-Encoding"], "gzip")
+        self.assertIn("public", resposta["Cache-Control"])
+
+        resposta = self.client.get(
+            url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=resposta["ETag"]
+        )
+        self.assertEqual(resposta.status_code, 304)
+
+    def test_304_nao_monta_a_resposta(self):
+        url = reverse("api_texto_pagina", args=[1, 2, "original"])
+        etag = self.client.get(url, {"tokens": 1})["ETag"]
+
+        # só a leitura usada no ETag; estrofes, versos e tokens não são buscados
+        with self.assertNumQueries(2):
+            resposta = self.client.get(url, {"tokens": 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 304)
+
+        texto = PaginaTexto.objects.get(canto=self.canto, numero=2)
+        texto.tei_xml = TEI
+        texto.save()
+        resposta = self.client.get(url, {"tokens": 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resposta.status_code, 200)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TESTES)
+class ExportacaoEstaticaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.canto = Canto.objects.create(numero=1)
+        PaginaImagem.objects.create(
+            canto=cls.canto, numero=1, imagem=imagem_de_teste("poema/canto_1/1.jpg")
+        )
+        cls.texto = PaginaTexto.objects.create(
+            canto=cls.canto, numero=1, versao="original", tei_xml=TEI
+        )
+
+    def setUp(self):
+        self.destino = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.destino, ignore_errors=True)
+
+    def exportar(self):
+        call_command(
+            "exportar_estatico", destino=self.destino, processos=0, stdout=StringIO()
+        )
+        return json.loads((self.destino / ".exportacao.json").read_text())
+
+    def test_exporta_paginas_com_estaticos_versionados(self):
+        manifesto = self.exportar()
+
+        pagina = self.destino / "canto/1/leitura/original/dir/1/index.html"
+        html = pagina.read_text()
+        self.assertIn("As armas e os barões assinalados", html)
+        self.assertRegex(html, r"/static/css/style\.[0-9a-f]{12}\.css")
+        self.assertTrue((self.destino / "index.html").exists())
+        self.assertTrue((self.destino / "media/poema/canto_1/1.jpg").exists())
+        self.assertIn("/canto/1/index/", manifesto)
+
+    def test_reexporta_so_o_que_mudou(self):
+        anterior = self.exportar()
+
+        self.texto.tei_xml = TEI.replace("armas", "Armas")
+        self.texto.save()
+        atual = self.exportar()
+
+        alteradas = {url for url in atual if atual[url] != anterior[url]}
+        # só as leituras da página 1 que mostram a versão original
+        self.assertEqual(alteradas, {
+            "/canto/1/leitura/original/esq/", "/canto/1/leitura/original/esq/1/",
+            "/canto/1/leitura/modernizado/esq/", "/canto/1/leitura/modernizado/esq/1/",
+            "/canto/1/leitura/imagem/esq/", "/canto/1/leitura/imagem/esq/1/",
+            "/canto/1/leitura/original/dir/", "/canto/1/leitura/original/dir/1/",
+        })
+        pagina = self.destino / "canto/1/leitura/original/dir/1/index.html"
+        self.assertIn("As Armas", pagina.read_text())
+
+    def test_erro_numa_pagina_e_relatado_sem_parar_a_exportacao(self):
+        erros = StringIO()
+        with mock.patch("homepage.views.buscar_leitura", side_effect=RuntimeError("falhou")):
+            call_command(
+                "exportar_estatico", destino=self.destino, processos=0,
+                stdout=StringIO(), stderr=erros,
+            )
+
+        self.assertIn("/canto/1/: RuntimeError: falhou", erros.getvalue())
+        self.assertTrue((self.destino / "sobre/index.html").exists())
+        manifesto = json.loads((self.destino / ".exportacao.json").read_text())
+        self.assertIn("/sobre/", manifesto)
+        self.assertNotIn("/canto/1/", manifesto)
+
+    def test_links_com_p_viram_urls_exportadas(self):
+        PaginaImagem.objects.create(
+            canto=self.canto, numero=2, imagem=imagem_de_teste("poema/canto_1/2.jpg")
+        )
+        html = (
+            '<a href="?p=2">2</a> <a href="/canto/1/?p=2#v3">2</a> '
+            '<a href="/canto/1/leitura/imagem/dir/?p=2">2</a> '
+            '<a href="/sobre/?p=2">sobre</a>'
+        )
+
+        convertido = paginacao_em_caminhos(html, "/canto/1/")
+
+        self.assertEqual(convertido, (
+            '<a href="/canto/1/leitura/modernizado/esq/2/">2</a> '
+            '<a href="/canto/1/leitura/modernizado/esq/2/#v3">2</a> '
+            '<a href="/canto/1/leitura/imagem/dir/2/">2</a> '
+            '<a href="/sobre/?p=2">sobre</a>'
+        ))
+        exportaveis = listar_urls("")
+        for url in ("/canto/1/leitura/modernizado/esq/2/", "/canto/1/leitura/imagem/dir/2/"):
+            self.assertIn(url, exportaveis)
+
+    def test_links_da_leitura_exportada_existem(self):
+        self.exportar()
+
+        for pagina in (self.destino / "canto").rglob("index.html"):
+            html = pagina.read_text()
+            self.assertNotIn("?p=", html, pagina)
+            # os links para os outros cantos do menu dependem de eles existirem no banco
+            for link in re.findall(r'href="(/canto/1/[^"#?]*)', html):
+                self.assertTrue((self.destino / caminho_de(link)).exists(), (pagina, link))
+
+
+TESTEMUNHO = (
+    '<TEI xmlns="http://www.tei-c.org/ns/1.0"><teiHeader/><text><body>'
+    '<div type="canto" n="1"><head>Canto Primeiro.</head>'
+    '<lg type="estrofe" n="1"><l>As armas e os barões assinalados,</l></lg>'
+    '<fw type="catch" place="bottom">Que</fw><pb n="2"/>'
+    '<fw type="header" place="top">CANTO I.</fw>'
+    '<lg type="estrofe" n="2"><l>Que da ocidental praia Lusitana,</l></lg>'
+    "</div>"
+    '<div type="canto" n="2"><pb n="3"/>'
+    '<lg type="estrofe" n="1"><l>Já neste tempo o lúcido planeta,</l></lg>'
+    "</div></body></text></TEI>"
+)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_TESTES)
+class ImportacaoEdicaoTests(TestCase):
+    def setUp(self):
+        self.arquivo = Path(MEDIA_TESTES) / "testemunho.xml"
+        self.arquivo.write_text(TESTEMUNHO, encoding="utf-8")
+        imagem_de_teste("poema/canto_2/1.jpg")
+
+    def importar(self, *argumentos):
+        saida = StringIO()
+        call_command(
+            "importar_edicao", "--original", str(self.arquivo), "--processos", "0",
+            *argumentos, stdout=saida,
+        )
+        return saida.getvalue()
+
+    def test_divide_nas_quebras_de_pagina(self):
+        self.importar("--imagens")
+
+        paginas = {
+            (t.canto.numero, t.numero): t
+            for t in PaginaTexto.objects.select_related("canto")
+        }
+        self.assertEqual(sorted(paginas), [(1, 1), (1, 2), (2, 1)])
+        # cabeçalho e reclamo (<fw>) ficam fora do texto da página
+        self.assertNotIn("CANTO I.", paginas[1, 2].tei_xml)
+        self.assertIn('<div class="estrofe">', paginas[1, 2].html_renderizado)
+        self.assertEqual(
+            list(Verso.objects.filter(estrofe__texto=paginas[2, 1])
+                 .values_list("texto", flat=True)),
+            ["Já neste tempo o lúcido planeta,"],
+        )
+        self.assertEqual(busca_fts.buscar("lusitana").count(), 1)
+        imagem = PaginaImagem.objects.get(canto__numero=2, numero=1)
+        self.assertEqual(imagem.imagem.name, "poema/canto_2/1.jpg")
+        # bulk_create não passa pelo save(): a importação gera as derivadas
+        self.assertEqual(imagem.derivados[:2], [160, 320])
+
+    def test_reimportar_so_grava_o_que_mudou(self):
+        self.importar("--imagens")
+        saida = self.importar("--imagens")
+        self.assertIn("0 criadas, 0 atualizadas, 0 removidas", saida)
+        self.assertIn("imagens: ", saida)
+        self.assertIn("derivadas de 0.", saida)
+        self.assertNotIn("rode gerar_tiles", saida)
+
+        self.arquivo.write_text(
+            TESTEMUNHO.replace("Lusitana", "Lvsitana").replace('<pb n="3"/>', ""),
+            encoding="utf-8",
+        )
+        saida = self.importar("--remover")
+        self.assertIn("0 criadas, 1 atualizadas, 0 removidas", saida)
+        self.assertEqual(busca_fts.buscar("lvsitana").count(), 1)
+        self.assertEqual(Verso.objects.count(), 3)
+
+
+COLACAO = (
+    '<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body>'
+    '<div type="canto" n="1"><lg type="estrofe" n="1">'
+    '<l><app><rdg wit="#VMod"><w lemma="o" pos="DET">As</w></rdg>'
+    '<rdg wit="#VDir #VEsq"><w lemma="o" pos="DET">AS</w></rdg></app>'
+    '<w lemma="arma" pos="NOUN">armas</w>'
+    '<app><rdg wit="#VMod"/><rdg wit="#VDir #VEsq"><pc>,</pc></rdg></app></l>'
+    '<l><w lemma="que" pos="PRON">Que</w>'
+    '<app><rdg wit="#VMod #VDir"><w lemma="praia" pos="NOUN">praia</w></rdg>'
+    '<rdg wit="#VEsq"><w lemma="praia" pos="NOUN">praya</w></rdg></app></l>'
+    "</lg></div>"
+    '<div type="canto" n="2"><lg type="estrofe" n="3">'
+    '<l><app><rdg wit="#VMod"><w lemma="planeta" pos="NOUN">planeta</w></rdg>'
+    '<rdg wit="#VDir"><w lemma="planeta" pos="NOUN">Planeta</w></rdg></app></l>'
+    "</lg></div></body></text></TEI>"
+)
+
+
+class AparatoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.arquivo = Path(MEDIA_TESTES) / "colacao.xml"
+        cls.arquivo.write_text(COLACAO, encoding="utf-8")
+
+    def test_indice_e_consultas(self):
+        indice = aparato.carregar(self.arquivo)
+
+        self.assertEqual(len(indice), 4)
+        self.assertEqual(indice.testemunhas, ["VMod", "VDir", "VEsq"])
+        # VEsq não aparece no canto 2: a entrada não conta como divergência
+        self.assertEqual(list(indice.divergencias("VEsq", "VDir")), [2])
+        self.assertEqual(list(indice.divergencias("VMod", "VDir")), [0, 1, 3])
+        self.assertEqual(list(indice.do_lema("praia")), [2])
+        self.assertEqual(list(indice.consultar(("VMod", "VDir"), pos="NOUN")), [3])
+        self.assertEqual(indice.densidade(), [(1, 1, 3), (2, 3, 1)])
+
+        entrada = indice.entrada(2)
+        self.assertEqual((entrada.canto, entrada.estrofe, entrada.verso), (1, 1, 2))
+        self.assertEqual(
+            [(l.testemunhas, l.texto) for l in entrada.leituras],
+            [(["VMod", "VDir"], "praia"), (["VEsq"], "praya")],
+        )
+        self.assertEqual(indice.entrada(1).leituras[0].texto, "")
+        self.assertIs(aparato.carregar(self.arquivo), indice)
+        with self.assertRaises(ValueError):
+            indice.divergencias("VEsq", "VPrinc")
+
+    def test_view_filtra_as_entradas(self):
+        with override_settings(APARATO_XML=self.arquivo):
+            resposta = self.client.get(
+                reverse("aparato"), {"a": "VEsq", "b": "VDir", "lema": "praia"}
+            )
+        self.assertEqual(resposta.status_code, 200)
+        self.assertEqual(resposta.context["pagina"].paginator.count, 1)
+        self.assertContains(resposta, "praya")
+
+        # um par incompleto ou repetido não some em silêncio do filtro
+        for a, b, mensagem in [
+            ("VEsq", "", "Informe as duas testemunhas"),
+            ("", "VDir", "Informe as duas testemunhas"),
+            ("VDir", "VDir", "Escolha duas testemunhas diferentes"),
+            ("VEsq", "VPrinc", "Testemunha desconhecida"),
+        ]:
+            with override_settings(APARATO_XML=self.arquivo):
+                resposta = self.client.get(reverse("aparato"), {"a": a, "b": b})
+            self.assertEqual(resposta.status_code, 200)
+            self.assertIn(mensagem, resposta.context["erro"])
+            self.assertIn("(há VMod, VDir, VEsq).", resposta.context["erro"])
+
+        with override_settings(APARATO_XML=Path(MEDIA_TESTES) / "inexistente.xml"):
+            resposta = self.client.get(reverse("aparato"))
+        self.assertEqual(resposta.status_code, 503)
+
+
+class TeiParaHtmlTests(TestCase):
+    def test_saida_igual_a_da_implementacao_anterior(self):
+        # a conversão anterior está congelada na migração que criou o HTML guardado
+        migracao = importlib.import_module(
+            "homepage.migrations.0005_paginatexto_html_renderizado"
+        )
+        modernizado = settings.BASE_DIR / "LusiadasTextos" / "LusiadasModernizado.xml"
+        for tei_xml in (TEI, TEI_ETIQUETADO, modernizado.read_text(encoding="utf-8")):
+            self.assertEqual(tei_para_html(tei_xml), migracao.tei_para_html(tei_xml))
+
+
+def script_de_textos(nome):
+    """Importa um dos scripts de LusiadasTextos, que se importam entre si pelo nome."""
+    pasta = str(settings.BASE_DIR / "LusiadasTextos")
+    if pasta not in sys.path:
+        sys.path.insert(0, pasta)
+    return importlib.import_module(nome)
+
+
+def pretty_print(xml):
+    """
+    O documento como etree.tostring(..., pretty_print=True) o gravaria, sem
+    a indentação atual (os espaços entre os <w> de um verso ficam).
+    """
+    raiz = etree.fromstring(xml)
+    for elem in raiz.iter():
+        if elem.text and not elem.text.strip() and "\n" in elem.text:
+            elem.text = None
+        if elem.tail and not elem.tail.strip() and "\n" in elem.tail:
+            elem.tail = None
+    return etree.tostring(
+        raiz.getroottree(), xml_declaration=True, encoding="utf-8", pretty_print=True
+    )
+
+
+class EscritaTeiTests(SimpleTestCase):
+    def test_namespace_declarado_so_na_raiz(self):
+        escritor_tei = script_de_textos("escritor_tei")
+        leitor_tei = script_de_textos("leitor_tei")
+        tei = "{http://www.tei-c.org/ns/1.0}"
+
+        # prefixado, como a colação, com o bloco montado fora do documento
+        saida = BytesIO()
+        with escritor_tei.documento(saida, f"{tei}TEI", nsmap={"tei": tei[1:-1]}) as escrita:
+            with escritor_tei.elemento(escrita, 1, f"{tei}text"):
+                lg = etree.Element(f"{tei}lg", nsmap={"tei": tei[1:-1]})
+                etree.SubElement(lg, f"{tei}l").text = "As armas"
+                escritor_tei.escrever(escrita, lg, 2)
+        self.assertEqual(saida.getvalue().count(b"xmlns"), 1)
+        self.assertEqual(saida.getvalue(), pretty_print(saida.getvalue()))
+
+        # namespace padrão, como a cópia do etiquetador
+        entrada = Path(MEDIA_TESTES) / "etiquetado.xml"
+        entrada.write_text(TEI_ETIQUETADO, encoding="utf-8")
+        blocos = leitor_tei.iterar_blocos(entrada)
+        _, raiz = next(blocos)
+        saida = BytesIO()
+        with escritor_tei.documento(saida, raiz.tag, nsmap=raiz.nsmap) as escrita:
+            escritor_tei.copiar(escrita, blocos)
+        self.assertEqual(saida.getvalue().count(b"xmlns"), 1)
+        self.assertEqual(saida.getvalue(), pretty_print(saida.getvalue()))
+
+
+    def test_colacao_e_etiquetagem_gravadas_como_pretty_print(self):
+        colacao = script_de_textos("juntarversoescompleto")
+        etiquetador = script_de_textos("etiquetador")
+        pasta = Path(MEDIA_TESTES)
+        (pasta / "base.xml").write_text(
+            '<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body>'
+            '<div type="canto" n="1"><head>Canto Primeiro</head><lg type="estrofe" n="1">'
+            '<l><w lemma="o" pos="DET">As</w> <w lemma="arma" pos="NOUN">armas</w>'
+            '<pc pos="PUNCT">,</pc></l></lg></div></body></text></TEI>',
+            encoding="utf-8",
+        )
+        (pasta / "direita.xml").write_text(
+            '<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body>'
+            '<div type="canto" n="1"><lg type="estrofe" n="1"><l>AS armas,</l></lg></div>'
+            "</body></text></TEI>",
+            encoding="utf-8",
+        )
+        xml = colacao.collate_witnesses(
+            pasta / "base.xml", {"VDir": pasta / "direita.xml"}, processos=0
+        ).encode()
+        self.assertIn(b"<tei:app>", xml)
+        self.assertEqual(xml.count(b"xmlns"), 1)
+        self.assertEqual(xml, pretty_print(xml))
+
+        class Analisador:
+            identificador = "teste"
+
+            def analisar(self, textos, lote, processos):
+                for texto in textos:
+                    yield [
+                        etiquetador.Analise(forma, forma.lower(), "X", "", " ", False, False)
+                        for forma in texto.split()
+                    ]
+
+        (pasta / "modernizado.xml").write_text(TEI, encoding="utf-8")
+        with mock.patch("builtins.print"):
+            etiquetador.lemmatize_and_tag_tei(
+                pasta / "modernizado.xml", pasta / "etiquetado.xml", Analisador()
+            )
+        xml = (pasta / "etiquetado.xml").read_bytes()
+        self.assertIn(b'<w lemma="armas" pos="X">armas</w>', xml)
+        self.assertEqual(xml.count(b"xmlns"), 1)
+        self.assertEqual(xml, pretty_print(xml))
+
+
+def leituras_do_verso(l):
+    """O <l> colacionado como lista: o texto de cada token fora de <app> e, para cada <app>, os pares (wit, texto)."""
+    resultado = []
+    for filho in l:
+        if etree.QName(filho).localname == "app":
+            resultado.append([(rdg.get("wit"), " ".join(t.text for t in rdg)) for rdg in filho])
+        else:
+            resultado.append(filho.text)
+    return resultado
+
+
+class AlinhamentoTests(SimpleTestCase):
+    def test_emparelhar_segue_o_sequence_matcher(self):
+        alinhador = script_de_textos("alinhador")
+        casos = [
+            ("abxcd", "abcxd", [(0, 0), (1, 1), (2, 3), (4, 4)]),
+            # o bloco que começa antes na primeira sequência vence o empate
+            ([1, 2, 3, 4], [5, 6, 4, 2], [(1, 3)]),
+            ("abab", "abab", [(0, 0), (1, 1), (2, 2), (3, 3)]),
+            ("abc", "xyz", []),
+        ]
+        for a, b, esperado in casos:
+            with self.subTest(a=a, b=b):
+                self.assertEqual(alinhador.emparelhar(list(a), list(b)), esperado)
+                blocos = SequenceMatcher(None, list(a), list(b), autojunk=False).get_matching_blocks()
+                self.assertEqual(esperado, [(i + k, j + k) for i, j, n in blocos for k in range(n)])
+
+    def test_alinhar_testemunhas_em_colunas(self):
+        alinhador = script_de_textos("alinhador")
+        base = "e não de agreste avena ou frauta ruda ,".split()
+        esquerda = "e não de agreste , ou frauta ruda :".split()
+        direita = "e nam de agreste a vena , ou frauta ruda :".split()
+        self.assertEqual(
+            alinhador.alinhar_testemunhas([base, esquerda, direita]),
+            [
+                [0, 0, 0], [1, 1, 1], [2, 2, 2], [3, 3, 3], [4, 4, 4],
+                # a sobra da direita fica em colunas de inserção próprias
+                [None, None, 5], [None, None, 6],
+                [5, 5, 7], [6, 6, 8], [7, 7, 9], [8, 8, 10],
+            ],
+        )
+
+        # cada testemunha é alinhada à base como no par a par: a vírgula
+        # casa com a da base, e não "ordene"
+        self.assertEqual(
+            alinhador.alinhar_testemunhas([
+                ["águas", ",", "febo", "ordene"],
+                ["agoas", "phebo", "ordene", ","],
+                ["agoas", "phebo", "ordene", ","],
+            ]),
+            [[0, 0, 0], [None, 1, 1], [None, 2, 2], [1, 3, 3], [2, None, None], [3, None, None]],
+        )
+
+        # inserções iguais de testemunhas diferentes dividem a coluna; None
+        # é uma testemunha sem o trecho
+        self.assertEqual(
+            alinhador.alinhar_testemunhas([["a", "b"], ["a", "x", "y", "b"], ["a", "y", "b"], ["z", "a", "x", "b"], None]),
+            [
+                [None, None, None, 0, None],
+                [0, 0, 0, 1, None],
+                [None, 1, None, 2, None],
+                [None, 2, 1, None, None],
+                [1, 3, 2, 3, None],
+            ],
+        )
+
+    def test_collate_line_com_insercao_e_herança_de_atributos(self):
+        colacao = script_de_textos("juntarversoescompleto")
+        tei = 'xmlns="http://www.tei-c.org/ns/1.0"'
+        moderno = etree.fromstring(
+            f'<l {tei}><w lemma="e" pos="CCONJ">E</w><w lemma="não" pos="ADV">não</w>'
+            '<w lemma="de" pos="ADP">de</w><w lemma="agreste" pos="ADJ">agreste</w>'
+            '<w lemma="avena" pos="NOUN">avena</w><w lemma="ou" pos="CCONJ">ou</w>'
+            '<w lemma="frauta" pos="NOUN">frauta</w><w lemma="rudo" pos="ADJ">ruda</w>'
+            '<pc pos="PUNCT">,</pc></l>'
+        )
+        esquerda = etree.fromstring(f"<l {tei}>E não de agreste, ou frauta ruda:</l>")
+        direita = etree.fromstring(f"<l {tei}>E nam de agreste a vena, ou frauta ruda:</l>")
+        l = colacao.collate_line(
+            [
+                colacao.preprocess_modern_l(moderno),
+                colacao.preprocess_old_version_l(esquerda),
+                colacao.preprocess_old_version_l(direita),
+            ],
+            {"VMod": "#VMod", "VEsq": "#VEsq", "VDir": "#VDir"},
+        )
+        self.assertEqual(leituras_do_verso(l), [
+            "E",
+            [("#VEsq #VMod", "não"), ("#VDir", "nam")],
+            "de",
+            "agreste",
+            [("#VMod", "avena"), ("#VEsq", ","), ("#VDir", "a")],
+            # a inserção só lista a base no <rdg> vazio, como na colação par a par
+            [("#VMod", ""), ("#VDir", "vena ,")],
+            "ou",
+            "frauta",
+            "ruda",
+            [("#VMod", ","), ("#VDir #VEsq", ":")],
+        ])
+
+        # palavras herdam lemma/pos da base; pontuação das versões antigas fica sem atributos
+        nam, virgula, a = l.xpath(
+            ".//tei:rdg[@wit='#VDir']/tei:w[.='nam'] | .//tei:rdg[@wit='#VEsq']/tei:pc"
+            " | .//tei:rdg[@wit='#VDir']/tei:w[.='a']",
+            namespaces={"tei": "http://www.tei-c.org/ns/1.0"},
+        )
+        self.assertEqual(dict(nam.attrib), {"lemma": "não", "pos": "ADV"})
+        self.assertEqual(dict(virgula.attrib), {})
+        self.assertEqual(dict(a.attrib), {"lemma": "avena", "pos": "NOUN"})
+
+        # uma versão sem o trecho (None) fica fora de todos os <rdg>
+        l = colacao.collate_line(
+            [colacao.preprocess_modern_l(moderno), None, colacao.preprocess_old_version_l(esquerda)],
+            {"VMod": "#VMod", "VEsq": "#VEsq", "VDir": "#VDir"},
+        )
+        self.assertNotIn("#VEsq", etree.tostring(l, encoding="unicode"))
+        self.assertEqual(leituras_do_verso(l)[4], [("#VMod", "avena"), ("#VDir", ",")])
+
+
+def escrever_versoes_sinteticas(pasta, cantos=2, estrofes=5, trocas=None):
+    """
+    Uma base etiquetada e uma versão antiga em texto corrido, com `cantos`
+    × `estrofes` estrofes de dois versos. `trocas` mapeia (canto, estrofe)
+    para um texto que substitui o primeiro verso da versão antiga.
+    """
+    trocas = trocas or {}
+    base, antiga = [], []
+    for c in range(1, cantos + 1):
+        base.append(f'<div type="canto" n="{c}"><head>Canto {c}</head>')
+        antiga.append(f'<div type="canto" n="{c}">')
+        for e in range(1, estrofes + 1):
+            versos = [f"as armas {c} e os barões {e} assinalados", f"que da ocidental praia {e} lusitana"]
+            base.append(f'<lg type="estrofe" n="{e}">')
+            for verso in versos:
+                palavras = "".join(f'<w lemma="{p}" pos="X">{p}</w>' for p in verso.split())
+                base.append(f'<l>{palavras}<pc pos="PUNCT">,</pc></l>')
+            base.append("</lg>")
+            antigos = [trocas.get((c, e), versos[0].replace("barões", "barões,")), versos[1] + ":"]
+            antiga.append(f'<lg type="estrofe" n="{e}">' + "".join(f"<l>{v}</l>" for v in antigos) + "</lg>")
+        base.append("</div>")
+        antiga.append("</div>")
+    for nome, corpo in (("base.xml", base), ("antiga.xml", antiga)):
+        (Path(pasta) / nome).write_text(
+            '<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body>' + "".join(corpo) + "</body></text></TEI>",
+            encoding="utf-8",
+        )
+    return {"VMod": Path(pasta) / "base.xml", "VAnt": Path(pasta) / "antiga.xml"}
+
+
+class ColacaoEmParaleloTests(SimpleTestCase):
+    def setUp(self):
+        self.colacao = script_de_textos("juntarversoescompleto")
+        self.pasta = Path(tempfile.mkdtemp(dir=MEDIA_TESTES))
+        self.paths = escrever_versoes_sinteticas(self.pasta)
+        self.wit_ids = {wit_key: "#" + wit_key for wit_key in self.paths}
+
+    def colacionar(self, processos=0, cache=None):
+        contagem = {}
+        tarefas = self.colacao._tarefas(self.paths, self.wit_ids, None)
+        resultados = list(self.colacao._colacionar_em_ordem(tarefas, processos, cache, contagem))
+        if cache is not None:
+            cache.gravar_manifesto()
+        return resultados, contagem
+
+    def test_pool_e_processo_atual_dao_a_mesma_saida(self):
+        no_processo, contagem = self.colacionar(processos=0)
+        self.assertEqual(contagem, {"colacionadas": 10, "cache": 0})
+        self.assertEqual([meta[2] for meta, _ in no_processo],
+                         [f"{c}.{e}" for c in (1, 2) for e in range(1, 6)])
+        self.assertIn(b"<tei:app>", no_processo[0][1])
+
+        # lotes de 3 estrofes: quatro viagens ao pool, a última incompleta
+        pool = mock.patch.object(self.colacao, "ProcessPoolExecutor", wraps=self.colacao.ProcessPoolExecutor)
+        with mock.patch.object(self.colacao, "LOTE", 3), mock.patch.object(self.colacao, "JANELA", 4), \
+                pool as executor:
+            com_pool, contagem = self.colacionar(processos=2)
+        executor.assert_called_once_with(max_workers=2)
+        self.assertEqual(contagem, {"colacionadas": 10, "cache": 0})
+        self.assertEqual(com_pool, no_processo)
+
+    def test_cache_so_colaciona_as_estrofes_alteradas(self):
+        cache_dir = self.pasta / "cache"
+        frio, contagem = self.colacionar(cache=self.colacao._CacheEstrofes(cache_dir, self.wit_ids))
+        self.assertEqual(contagem, {"colacionadas": 10, "cache": 0})
+        self.assertEqual(len(list((cache_dir / "fragmentos").glob("*.xml"))), 10)
+
+        quente, contagem = self.colacionar(cache=self.colacao._CacheEstrofes(cache_dir, self.wit_ids))
+        self.assertEqual(contagem, {"colacionadas": 0, "cache": 10})
+        self.assertEqual(quente, frio)
+
+        # corrigir um verso da versão antiga só invalida a estrofe dele
+        escrever_versoes_sinteticas(self.pasta, trocas={(2, 3): "as armas 2 e os varões 3 assinalados"})
+        alterado, contagem = self.colacionar(cache=self.colacao._CacheEstrofes(cache_dir, self.wit_ids))
+        self.assertEqual(contagem, {"colacionadas": 1, "cache": 9})
+        diferentes = [meta[2] for (meta, xml), (_, antes) in zip(alterado, frio) if xml != antes]
+        self.assertEqual(diferentes, ["2.3"])
+        self.assertIn(b"var&#245;es", dict((meta[2], xml) for meta, xml in alterado)["2.3"])
+        self.assertEqual(alterado, self.colacionar()[0])
+
+        # o manifesto aponta a nova estrofe, e o fragmento antigo é apagado
+        manifesto = json.loads((cache_dir / "manifesto.json").read_text(encoding="utf-8"))
+        self.assertEqual(len(manifesto), 10)
+        self.assertEqual(
+            {p.stem for p in (cache_dir / "fragmentos").glob("*.xml")}, set(manifesto.values())
+        )
+
+        # ids das versões diferentes também invalidam o cache
+        outros_ids = {"VMod": "#VMod", "VAnt": "#VAntiga"}
+        cache = self.colacao._CacheEstrofes(cache_dir, outros_ids)
+        contagem = {}
+        tarefas = self.colacao._tarefas(self.paths, outros_ids, None)
+        list(self.colacao._colacionar_em_ordem(tarefas, 0, cache, contagem))
+        self.assertEqual(contagem, {"colacionadas": 10, "cache": 0})
+
+
+# etapa de teste: registra a execução e grava na saída as entradas seguidas do nome
+ETAPA_COPIAR = """
+import sys
+from pathlib import Path
+
+nome, entradas, saida = sys.argv[1], sys.argv[2:-1], sys.argv[-1]
+with open("execucoes.txt", "a", encoding="utf-8") as registro:
+    registro.write(nome + "\\n")
+Path(saida).write_text("".join(Path(e).read_text() for e in entradas) + nome + "\\n")
+"""
+
+
+class PipelineTests(SimpleTestCase):
+    def setUp(self):
+        self.pipeline = script_de_textos("pipeline")
+        self.pasta = Path(tempfile.mkdtemp(dir=MEDIA_TESTES))
+        (self.pasta / "copiar.py").write_text(ETAPA_COPIAR, encoding="utf-8")
+        (self.pasta / "falhar.py").write_text("import sys\nsys.exit(3)\n", encoding="utf-8")
+        (self.pasta / "nada.py").write_text("pass\n", encoding="utf-8")
+        (self.pasta / "fonte.txt").write_text("fonte\n", encoding="utf-8")
+        (self.pasta / "extra.txt").write_text("extra\n", encoding="utf-8")
+        for nome, valor in (("PASTA", self.pasta), ("ESTADO", self.pasta / ".pipeline")):
+            patcher = mock.patch.object(self.pipeline, nome, valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def etapa(self, nome, entradas, script="copiar.py", **kwargs):
+        Etapa = self.pipeline.Etapa
+        return Etapa(nome, [script, nome, *entradas, f"{nome}.txt"], entradas, [f"{nome}.txt"], **kwargs)
+
+    def grafo(self, script_b="copiar.py"):
+        # a → b, c → d; c também lê extra.txt
+        return [
+            self.etapa("d", ["b.txt", "c.txt"]),
+            self.etapa("b", ["a.txt"], script_b),
+            self.etapa("c", ["a.txt", "extra.txt"]),
+            self.etapa("a", ["fonte.txt"]),
+        ]
+
+    def executar(self, etapas, **kwargs):
+        with mock.patch("builtins.print"):
+            resultado = self.pipeline.executar(etapas, processos=2, **kwargs)
+        return {nome: situacao for nome, (situacao, _) in resultado.items()}
+
+    def execucoes(self):
+        arquivo = self.pasta / "execucoes.txt"
+        execucoes = arquivo.read_text(encoding="utf-8").split() if arquivo.exists() else []
+        arquivo.unlink(missing_ok=True)
+        return execucoes
+
+    def test_ordem_do_grafo(self):
+        self.assertEqual(self.pipeline.ordenar(self.grafo()), {"a": set(), "b": {"a"}, "c": {"a"}, "d": {"b", "c"}})
+        self.assertEqual(self.executar(self.grafo()), dict.fromkeys("dbca", "executada"))
+        execucoes = self.execucoes()
+        self.assertEqual(execucoes[0], "a")
+        self.assertEqual(sorted(execucoes[1:3]), ["b", "c"])
+        self.assertEqual(execucoes[3], "d")
+        self.assertEqual((self.pasta / "d.txt").read_text(), "fonte\na\nb\nfonte\na\nextra\nc\nd\n")
+
+        # só o alvo e as etapas de que ele depende
+        self.assertEqual(self.executar(self.grafo(), alvos=["b"], forcar=True), {"b": "executada", "a": "executada"})
+        self.assertEqual(self.execucoes(), ["a", "b"])
+
+        with self.assertRaisesMessage(ValueError, "Ciclo entre as etapas: a, b."):
+            self.pipeline.ordenar([self.etapa("a", ["b.txt"]), self.etapa("b", ["a.txt"])])
+        with self.assertRaisesMessage(ValueError, "'a.txt' é saída de 'a' e de 'a'."):
+            self.pipeline.ordenar([self.etapa("a", []), self.etapa("a", ["x.txt"])])
+
+    def test_so_executa_o_que_mudou(self):
+        self.executar(self.grafo())
+        self.execucoes()
+        estado = json.loads((self.pasta / ".pipeline" / "estado.json").read_text(encoding="utf-8"))
+        self.assertEqual(set(estado), {"a", "b", "c", "d"})
+        self.assertEqual(estado["a"]["chave"], self.pipeline.chave(self.grafo()[3]))
+
+        # nada mudou: nenhuma etapa roda
+        self.assertEqual(self.executar(self.grafo()), dict.fromkeys("dbca", "em dia"))
+        self.assertEqual(self.execucoes(), [])
+
+        # uma entrada de c mudou: c e as que dependem dele
+        (self.pasta / "extra.txt").write_text("outra\n", encoding="utf-8")
+        self.assertEqual(
+            self.executar(self.grafo()),
+            {"a": "em dia", "b": "em dia", "c": "executada", "d": "executada"},
+        )
+        self.assertEqual(self.execucoes(), ["c", "d"])
+
+        # a entrada de origem mudou com o mesmo tamanho: tudo de novo
+        (self.pasta / "fonte.txt").write_text("FONTE\n", encoding="utf-8")
+        self.assertEqual(self.executar(self.grafo()), dict.fromkeys("dbca", "executada"))
+        self.assertEqual(sorted(self.execucoes()), ["a", "b", "c", "d"])
+
+        # uma saída apagada ou alterada à mão também põe a etapa de volta
+        (self.pasta / "b.txt").unlink()
+        (self.pasta / "c.txt").write_text("editado\n", encoding="utf-8")
+        self.assertEqual(
+            self.executar(self.grafo()),
+            {"a": "em dia", "b": "executada", "c": "executada", "d": "em dia"},
+        )
+        self.assertEqual(sorted(self.execucoes()), ["b", "c"])
+
+    def test_falha_bloqueia_as_etapas_seguintes(self):
+        self.assertEqual(
+            self.executar(self.grafo(script_b="falhar.py")),
+            {"a": "executada", "b": "falhou", "c": "executada", "d": "bloqueada"},
+        )
+        estado = json.loads((self.pasta / ".pipeline" / "estado.json").read_text(encoding="utf-8"))
+        self.assertEqual(set(estado), {"a", "c"})
+        self.assertTrue((self.pasta / ".pipeline" / "b.log").exists())
+
+        # um script que sai com 0 sem gravar a saída também falha
+        self.assertEqual(
+            self.executar(self.grafo(script_b="nada.py")),
+            {"a": "em dia", "b": "falhou", "c": "em dia", "d": "bloqueada"},
+        )
+
+        # uma entrada que não existe: falha, ou é ignorada se a etapa é opcional
+        (self.pasta / "extra.txt").unlink()
+        self.assertEqual(
+            self.executar([self.etapa("c", ["extra.txt"]), self.etapa("e", ["c.txt"])]),
+            {"c": "falhou", "e": "bloqueada"},
+        )
+        self.assertEqual(self.executar([self.etapa("c", ["extra.txt"], opcional=True)]), {"c": "ignorada"})
+
+
+class ComparacaoTests(SimpleTestCase):
+    def setUp(self):
+        self.comparacao = script_de_textos("comparacao")
+        self.pasta = Path(tempfile.mkdtemp(dir=MEDIA_TESTES))
+        versoes = {
+            # a direita tem um verso a mais na estrofe 2
+            "VDir": '<l>As armas, e os barões</l><l>Que da Occidental praya Lusi-<lb break="no"/>tana,</l>'
+                    "</lg><lg type=\"estrofe\" n=\"2\"><l>E também as memórias</l><l>Daqueles Reis</l>",
+            "VEsq": "<l>As armas e os barões</l><l>Que da Occidental praya Lusitana,</l>"
+                    "</lg><lg type=\"estrofe\" n=\"2\"><l>E também as memórias</l>",
+        }
+        self.arquivos = {}
+        for wit_id, versos in versoes.items():
+            caminho = self.pasta / f"{wit_id}.xml"
+            caminho.write_text(
+                '<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body><div type="canto" n="1">'
+                f'<lg type="estrofe" n="1">{versos}</lg></div></body></text></TEI>',
+                encoding="utf-8",
+            )
+            self.arquivos[wit_id] = caminho
+
+    def test_script_de_edicao(self):
+        self.assertEqual(self.comparacao.script_edicao("iguais", "iguais"), (1.0, []))
+        similaridade, operacoes = self.comparacao.script_edicao("Por mares, nunca", "Por mares nunca")
+        self.assertAlmostEqual(similaridade, 30 / 31)
+        self.assertEqual(operacoes, [(9, 10, ",", "")])
+        _, operacoes = self.comparacao.script_edicao("nauegados", "na-vegados")
+        self.assertEqual(operacoes, [(2, 3, "u", "-v")])
+        self.assertEqual(self.comparacao.formatar_script(operacoes), '[2:3]"u"→"-v"')
+        self.assertEqual(
+            self.comparacao.formatar_script([(0, 0, "", "E "), (5, 6, "ç", "")]),
+            '[0:0]""→"E "; [5:6]"ç"→""',
+        )
+
+    def test_versos_ausentes_ficam_fora_por_padrao(self):
+        resultados = list(self.comparacao.comparar_testemunhas(self.arquivos, processos=0))
+        self.assertEqual(
+            [(chave, t1, t2, operacoes) for chave, t1, t2, _, operacoes, _, _ in resultados],
+            [
+                (("1", "1", 1), "VDir", "VEsq", [(8, 9, ",", "")]),
+                # a palavra partida por <lb break="no"/> é juntada
+                (("1", "1", 2), "VDir", "VEsq", []),
+                (("1", "2", 1), "VDir", "VEsq", []),
+                (("1", "2", 2), "VDir", "VEsq", []),
+            ],
+        )
+        self.assertEqual(resultados[3][3:], (None, [], "Daqueles Reis", None))
+
+        csv_padrao = self.pasta / "diferencas.csv"
+        resumo = self.comparacao.gravar(resultados, csv_padrao)
+        self.assertEqual(list(resumo), [("VDir", "VEsq")])
+        versos, diferentes, ausentes, soma = resumo["VDir", "VEsq"]
+        self.assertEqual((versos, diferentes, ausentes), (4, 1, 1))
+        self.assertAlmostEqual(soma, 2 + 40 / 41)
+        self.assertEqual(
+            csv_padrao.read_text(encoding="utf-8").splitlines(),
+            [
+                ";".join(self.comparacao.CAMPOS),
+                '1;1;1;VDir;VEsq;diferente;0.9756;1;"[8:9]"",""→""""";As armas, e os barões;As armas e os barões',
+            ],
+        )
+
+        # com ausentes: o verso só da direita entra sem similaridade nem script
+        json_ausentes = self.pasta / "diferencas.json"
+        self.comparacao.gravar(resultados, json_ausentes, ausentes=True)
+        linhas = json.loads(json_ausentes.read_text(encoding="utf-8"))
+        self.assertEqual([linha["situacao"] for linha in linhas], ["diferente", "ausente"])
+        self.assertEqual(linhas[0]["script"], [[8, 9, ",", ""]])
+        self.assertEqual(
+            linhas[1],
+            {
+                "canto": "1", "estrofe": "2", "verso": 2, "testemunha1": "VDir", "testemunha2": "VEsq",
+                "situacao": "ausente", "similaridade": None, "edicoes": 0, "script": [],
+                "texto1": "Daqueles Reis", "texto2": None,
+            },
+        )
+
+        # todos (limiar acima de 1), um objeto por linha
+        jsonl = self.pasta / "diferencas.jsonl"
+        self.comparacao.gravar(resultados, jsonl, limiar=2.0, ausentes=True)
+        linhas = [json.loads(linha) for linha in jsonl.read_text(encoding="utf-8").splitlines()]
+        self.assertEqual([linha["situacao"] for linha in linhas], ["diferente", "igual", "igual", "ausente"])
+
+        # nada a gravar: uma lista JSON vazia
+        vazio = self.pasta / "vazio.json"
+        self.comparacao.gravar(resultados[1:3], vazio)
+        self.assertEqual(json.loads(vazio.read_text(encoding="utf-8")), [])
+
+        with self.assertRaisesMessage(ValueError, "Formato de saída desconhecido"):
+            self.comparacao.gravar(resultados, self.pasta / "diferencas.txt")
+
+    def test_pares_contra_a_referencia(self):
+        self.arquivos["VTer"] = self.arquivos["VEsq"]
+        pares = {
+            (t1, t2)
+            for _, t1, t2, *_ in self.comparacao.comparar_testemunhas(self.arquivos, "VEsq", processos=0)
+        }
+        self.assertEqual(pares, {("VEsq", "VDir"), ("VEsq", "VTer")})
+        todos = {(t1, t2) for _, t1, t2, *_ in self.comparacao.comparar_testemunhas(self.arquivos, processos=0)}
+        self.assertEqual(todos, {("VDir", "VEsq"), ("VDir", "VTer"), ("VEsq", "VTer")})
+        with self.assertRaisesMessage(ValueError, "Referência 'VX' não está entre as testemunhas"):
+            list(self.comparacao.comparar_testemunhas(self.arquivos, "VX", processos=0))
+
+
+def _modelo_spacy_instalado():
+    from importlib.util import find_spec
+
+    return find_spec("spacy") is not None and find_spec("pt_core_news_lg") is not None
+
+
+class EtiquetadorTests(SimpleTestCase):
+    def test_cache_guarda_as_analises_de_cada_modelo(self):
+        etiquetador = script_de_textos("etiquetador")
+        caminho = Path(MEDIA_TESTES) / "anotacoes.sqlite3"
+        analise = [etiquetador.Analise("armas", "arma", "NOUN", "", "", False, False)]
+
+        for modelo in ("modelo-a", "modelo-b"):
+            cache = etiquetador._CacheAnotacoes(caminho, modelo)
+            self.assertEqual(cache.faltando(["as armas"]), ["as armas"])
+            cache.gravar([("as armas", analise)])
+            cache.fechar()
+
+        # voltar ao primeiro modelo não refaz nada; podar apaga os outros
+        cache = etiquetador._CacheAnotacoes(caminho, "modelo-a")
+        self.assertEqual(cache.faltando(["as armas"]), [])
+        self.assertEqual(cache.ler("as armas"), analise)
+        self.assertEqual(cache.podar(), 1)
+        cache.fechar()
+        cache = etiquetador._CacheAnotacoes(caminho, "modelo-b")
+        self.assertEqual(cache.faltando(["as armas"]), ["as armas"])
+        cache.fechar()
+
+    def _lexico(self):
+        lexico = script_de_textos("lexico")
+        pasta = Path(MEDIA_TESTES)
+        # "armas" duas vezes como substantivo e uma como verbo: fica a mais frequente
+        (pasta / "lexico.xml").write_text(
+            '<TEI xmlns="http://www.tei-c.org/ns/1.0"><text><body><lg type="estrofe" n="1">'
+            '<l><w lemma="arma" pos="NOUN" msd="Number=Plur">armas</w> '
+            '<w lemma="armar" pos="VERB">armas</w><pc pos="PUNCT">,</pc></l>'
+            '<l><w lemma="arma" pos="NOUN" msd="Number=Plur">armas</w> '
+            '<w lemma="o" pos="DET">os</w> <w lemma="barão" pos="NOUN">barões</w> '
+            "<w>sem_pos</w></l>"
+            "</lg></body></text></TEI>",
+            encoding="utf-8",
+        )
+        self.assertEqual(lexico.construir([pasta / "lexico.xml"], pasta / "lexico.bin"), 4)
+        return lexico.Lexico(pasta / "lexico.bin")
+
+    def test_lexico_busca_formas_exatas(self):
+        lexico = script_de_textos("lexico")
+        indice = self._lexico()
+        self.addCleanup(indice.fechar)
+
+        self.assertEqual(len(indice), 4)
+        self.assertEqual(
+            indice.buscar("armas"), lexico.Entrada("arma", "NOUN", "Number=Plur", False)
+        )
+        self.assertEqual(indice.buscar(","), lexico.Entrada("", "PUNCT", "", True))
+        self.assertEqual(indice.buscar("barões").lema, "barão")
+        # prefixos e extensões de formas do léxico não são a forma
+        for forma in ("arma", "armass", "o", "barõe", "Armas", "sem_pos", ""):
+            self.assertIsNone(indice.buscar(forma), forma)
+
+        (Path(MEDIA_TESTES) / "nao_lexico.bin").write_bytes(b"outro arquivo")
+        with self.assertRaises(ValueError):
+            lexico.Lexico(Path(MEDIA_TESTES) / "nao_lexico.bin")
+
+    def test_analisador_lexico_so_manda_a_reserva_os_versos_desconhecidos(self):
+        etiquetador = script_de_textos("etiquetador")
+        self._lexico().fechar()
+
+        class Reserva:
+            identificador = "reserva"
+            analisados = []
+
+            def tokenizar(self, textos, lote):
+                for texto in textos:
+                    yield [(forma, " ") for forma in texto.split()]
+
+            def analisar(self, textos, lote, processos):
+                self.analisados.extend(textos)
+                for texto in textos:
+                    yield [etiquetador.Analise(forma, "?", "X", "", " ", False, False)
+                           for forma in texto.split()]
+
+        reserva = Reserva()
+        analisador = etiquetador.AnalisadorLexico(Path(MEDIA_TESTES) / "lexico.bin", reserva)
+        self.addCleanup(analisador.lexico.fechar)
+        self.assertTrue(analisador.identificador.endswith("|reserva"))
+
+        conhecido, desconhecido = "Armas os barões", "armas os cavaleiros"
+        analises = list(analisador.analisar([conhecido, desconhecido, conhecido]))
+
+        self.assertEqual(reserva.analisados, [desconhecido])
+        self.assertEqual(analisador.contagem, {"lexico": 2, "reserva": 1})
+        # a forma com maiúscula é achada pela minúscula, mas fica como está no verso
+        self.assertEqual(
+            [(a.text, a.lemma_, a.pos_) for a in analises[0]],
+            [("Armas", "arma", "NOUN"), ("os", "o", "DET"), ("barões", "barão", "NOUN")],
+        )
+        self.assertEqual([a.lemma_ for a in analises[1]], ["?", "?", "?"])
+        self.assertEqual(analises[2], analises[0])
+
+    @skipUnless(_modelo_spacy_instalado(), "spaCy e pt_core_news_lg não instalados")
+    def test_lexico_divide_os_versos_como_o_spacy(self):
+        etiquetador = script_de_textos("etiquetador")
+        lexico = script_de_textos("lexico")
+        pasta = Path(MEDIA_TESTES)
+        verso = "Disse-lhe então o Gama, d'ouro e prata:"
+        (pasta / "hifen.xml").write_text(TEI.replace("As armas e os barões assinalados,", verso),
+                                         encoding="utf-8")
+        spacy = etiquetador.AnalisadorSpacy()
+        with mock.patch("builtins.print"):
+            etiquetador.lemmatize_and_tag_tei(pasta / "hifen.xml", pasta / "hifen_etiquetado.xml", spacy)
+        lexico.construir([pasta / "hifen_etiquetado.xml"], pasta / "hifen.bin")
+
+        pelo_lexico = etiquetador.AnalisadorLexico(pasta / "hifen.bin", reserva=spacy)
+        tokens = [(t.text, t.whitespace_) for t in next(pelo_lexico.analisar([verso]))]
+        self.assertEqual(pelo_lexico.contagem, {"lexico": 1, "reserva": 0})
+        self.assertEqual(tokens, [(t.text, t.whitespace_) for t in next(spacy.analisar([verso]))])
@@ -1,11 +1,13 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     # páginas institucionais
     path("", views.homepage, name="homepage"),
     path("sobre/", views.sobre, name="sobre"),
     path("autor/", views.autor, name="autor"),
+    path("busca/", views.busca, name="busca"),
+    path("aparato/", views.aparato, name="aparato"),
     path("canto/<int:canto>/index/", views.canto_index, name="canto_index"),
 
     # leitura COM paginação (mais específico)
@@ -25,6 +27,20 @@ urlpatterns = [
     # índice do canto (miniaturas)
     path("canto/<int:canto>/index/", views.canto_index, name="canto_index"),
 
+    # API JSON somente leitura
+    path("api/cantos/", api.lista_cantos, name="api_cantos"),
+    path("api/cantos/<int:canto>/paginas/", api.paginas, name="api_paginas"),
+    path(
+        "api/cantos/<int:canto>/paginas/<int:pagina>/<str:versao>/",
+        api.texto_pagina,
+        name="api_texto_pagina"
+    ),
+    path(
+        "api/cantos/<int:canto>/versos/<str:versao>/",
+        api.versos,
+        name="api_versos"
+    ),
+
     # canto (genérico — DEIXAR POR ÚLTIMO)
     path("canto/<int:canto>/", views.canto, name="canto"),
 ]
@@ -0,0 +1,255 @@
+import functools
+import os
+from array import array
+from collections import Counter, namedtuple
+
+from lxml import etree
+
+# -----------------------
+# ÍNDICE DO APARATO CRÍTICO
+# -----------------------
+# Cada <app> da colação (LusiadasTextos/juntarversoescompleto.py) vira uma
+# linha de colunas paralelas (arrays de inteiros), e cada <rdg> uma linha
+# de outro conjunto de colunas; as testemunhas de uma leitura são um
+# inteiro com um bit por testemunha. As consultas percorrem arrays ou
+# leem índices invertidos montados na primeira vez, sem voltar ao XML.
+
+Entrada = namedtuple("Entrada", "indice canto estrofe verso posicao leituras")
+Leitura = namedtuple("Leitura", "testemunhas texto lemas pos")
+
+SEM_LEITURA = -1
+
+
+def _numero(valor):
+    return int(valor) if valor and valor.isdigit() else 0
+
+
+class IndiceAparato:
+    """
+    Índice em memória das entradas do aparato de um arquivo colacionado.
+    Monte com de_arquivo(caminho) (ou carregar, com cache); os métodos de
+    consulta devolvem índices de entrada em ordem do poema, e entrada(i)
+    materializa uma delas. Os índices derivados (leituras por testemunha,
+    lemas, classes, densidade) são montados na primeira consulta que os usa.
+    """
+
+    def __init__(self):
+        self.testemunhas = []          # "VMod", "VDir"... na ordem em que aparecem
+        # colunas das entradas
+        self.canto = array("H")
+        self.estrofe = array("H")
+        self.verso = array("H")
+        self.posicao = array("H")      # posição do <app> entre os filhos do <l>
+        self.primeira = array("I")     # primeira leitura de cada entrada, mais uma ao fim
+        # colunas das leituras
+        self.leitura_testemunhas = array("Q")
+        self.leitura_texto = []
+        self.leitura_lemas = []
+        self.leitura_pos = []
+        self._derivados = {}
+
+    def __len__(self):
+        return len(self.canto)
+
+    @classmethod
+    def de_arquivo(cls, caminho):
+        """Lê o arquivo colacionado verso a verso, liberando cada <l> depois de indexado."""
+        indice = cls()
+        mascaras = {}  # valor de @wit → bits das testemunhas
+        textos, lemas, classes = indice.leitura_texto, indice.leitura_lemas, indice.leitura_pos
+        bits_leituras = indice.leitura_testemunhas
+        colunas = (indice.canto, indice.estrofe, indice.verso, indice.posicao)
+        lg_atual, verso, tags = None, 0, None
+
+        for _, l in etree.iterparse(str(caminho), tag="{*}l"):
+            if tags is None:
+                ns = l.tag[:l.tag.index("}") + 1] if l.tag[0] == "{" else ""
+                tags = (f"{ns}app", (f"{ns}rdg", f"{ns}lem"), f"{ns}w", f"{ns}pc")
+            tag_app, tags_leitura, tag_w, tag_pc = tags
+
+            lg = l.getparent()
+            verso = verso + 1 if lg is lg_atual else 1
+            lg_atual = lg
+            div = lg.getparent()
+            posicao_verso = (
+                _numero(div.get("n")) if div is not None else 0,
+                _numero(lg.get("n")),
+                verso,
+            )
+
+            for posicao, app in enumerate(l):
+                if app.tag != tag_app:
+                    continue
+                for coluna, valor in zip(colunas, posicao_verso + (posicao,)):
+                    coluna.append(valor)
+                indice.primeira.append(len(textos))
+
+                for rdg in app:
+                    if rdg.tag not in tags_leitura:
+                        continue
+                    wit = rdg.get("wit") or ""
+                    bits = mascaras.get(wit)
+                    if bits is None:
+                        bits = mascaras[wit] = indice._mascara(wit)
+                    formas, lemas_rdg, classes_rdg = [], [], []
+                    for token in rdg.iter(tag_w, tag_pc):
+                        formas.append(token.text or "")
+                        lema, classe = token.get("lemma"), token.get("pos")
+                        if lema:
+                            lemas_rdg.append(lema)
+                        if classe:
+                            classes_rdg.append(classe)
+                    bits_leituras.append(bits)
+                    textos.append(" ".join(formas))
+                    lemas.append(" ".join(lemas_rdg))
+                    classes.append(" ".join(classes_rdg))
+
+            l.clear(keep_tail=True)
+            while l.getprevious() is not None:
+                del lg[0]
+
+        indice.primeira.append(len(textos))
+        return indice
+
+    def _mascara(self, wit):
+        bits = 0
+        for testemunha in wit.split():
+            testemunha = testemunha.lstrip("#")
+            if testemunha not in self.testemunhas:
+                self.testemunhas.append(testemunha)
+            bits |= 1 << self.testemunhas.index(testemunha)
+        return bits
+
+    def _leituras(self):
+        """(entrada, número da leitura) de cada leitura, em ordem."""
+        primeira = self.primeira
+        for i in range(len(self)):
+            for r in range(primeira[i], primeira[i + 1]):
+                yield i, r
+
+    def _derivado(self, nome, montar):
+        if nome not in self._derivados:
+            self._derivados[nome] = montar()
+        return self._derivados[nome]
+
+    def _erro(self, mensagem):
+        return ValueError(f"{mensagem} (há {', '.join(self.testemunhas)}).")
+
+    def _coluna(self, testemunha):
+        """Leitura da testemunha em cada entrada (SEM_LEITURA se ela não aparece)."""
+        if testemunha not in self.testemunhas:
+            raise self._erro(f"Testemunha desconhecida: {testemunha!r}")
+
+        def montar():
+            bit = 1 << self.testemunhas.index(testemunha)
+            coluna = array("i", [SEM_LEITURA]) * len(self)
+            bits = self.leitura_testemunhas
+            for i, r in self._leituras():
+                if bits[r] & bit:
+                    coluna[i] = r
+            return coluna
+
+        return self._derivado(("testemunha", testemunha), montar)
+
+    def _invertido(self, nome, valores):
+        """Índice valor → entradas a partir de uma coluna de leituras ('lema lema...')."""
+        def montar():
+            indice = {}
+            for i, r in self._leituras():
+                for valor in valores[r].split():
+                    entradas = indice.setdefault(valor, array("I"))
+                    if not entradas or entradas[-1] != i:
+                        entradas.append(i)
+            return indice
+
+        return self._derivado(nome, montar)
+
+    # -----------------------
+    # CONSULTAS
+    # -----------------------
+
+    def divergencias(self, a, b):
+        """Entradas em que as testemunhas `a` e `b` têm leituras diferentes."""
+        if not a or not b:
+            raise self._erro("Informe as duas testemunhas a comparar")
+        if a == b:
+            raise self._erro(f"Escolha duas testemunhas diferentes, não {a!r} com ela mesma")
+        leituras_a, leituras_b = self._coluna(a), self._coluna(b)
+        return array("I", (
+            i for i, (x, y) in enumerate(zip(leituras_a, leituras_b))
+            if x != y and x != SEM_LEITURA and y != SEM_LEITURA
+        ))
+
+    def do_lema(self, lema):
+        """Entradas com o lema em alguma das leituras."""
+        return self._invertido("lemas", self.leitura_lemas).get(lema, array("I"))
+
+    def da_classe(self, pos):
+        """Entradas com a classe gramatical (POS) em alguma das leituras."""
+        return self._invertido("pos", self.leitura_pos).get(pos, array("I"))
+
+    def do_canto(self, canto):
+        return array("I", (i for i, c in enumerate(self.canto) if c == canto))
+
+    def consultar(self, divergentes=None, lema=None, pos=None, canto=None):
+        """
+        Entradas que atendem a todos os filtros informados: `divergentes`
+        é um par de testemunhas (ver divergencias). Sem filtros, todas.
+        """
+        conjuntos = []
+        if divergentes:
+            conjuntos.append(self.divergencias(*divergentes))
+        if lema:
+            conjuntos.append(self.do_lema(lema))
+        if pos:
+            conjuntos.append(self.da_classe(pos))
+        if canto:
+            conjuntos.append(self.do_canto(canto))
+        if not conjuntos:
+            return range(len(self))
+
+        conjuntos.sort(key=len)
+        resultado = conjuntos[0]
+        for outro in conjuntos[1:]:
+            outro = set(outro)
+            resultado = array("I", (i for i in resultado if i in outro))
+        return resultado
+
+    def densidade(self, canto=None):
+        """[(canto, estrofe, entradas)] das estrofes com variantes, da mais densa à menos."""
+        contagem = self._derivado(
+            "densidade", lambda: Counter(zip(self.canto, self.estrofe))
+        )
+        return sorted(
+            ((c, e, n) for (c, e), n in contagem.items()
+             if canto is None or c == canto),
+            key=lambda item: (-item[2], item[0], item[1]),
+        )
+
+    def entrada(self, i):
+        leituras = [
+            Leitura(
+                [t for n, t in enumerate(self.testemunhas)
+                 if self.leitura_testemunhas[r] >> n & 1],
+                self.leitura_texto[r],
+                self.leitura_lemas[r],
+                self.leitura_pos[r],
+            )
+            for r in range(self.primeira[i], self.primeira[i + 1])
+        ]
+        return Entrada(i, self.canto[i], self.estrofe[i], self.verso[i],
+                       self.posicao[i], leituras)
+
+
+@functools.lru_cache(maxsize=2)
+def _carregar(caminho, _modificado, _tamanho):
+    return IndiceAparato.de_arquivo(caminho)
+
+
+def carregar(caminho):
+    """
+    Índice do arquivo colacionado, montado uma vez por processo e refeito
+    só quando o arquivo muda (data de modificação ou tamanho).
+    """
+    estado = os.stat(caminho)
+    return _carregar(str(caminho), estado.st_mtime_ns, estado.st_size)
@@ -0,0 +1,57 @@
+from pathlib import Path, PurePosixPath
+
+from PIL import Image, ImageOps
+
+# Larguras (px) geradas para cada fac-símile; as maiores que o original são puladas
+LARGURAS_DERIVADAS = (160, 320, 640, 1280)
+
+# extensão → (formato do Pillow, opções de gravação)
+FORMATOS_DERIVADOS = {
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+    "webp": ("WEBP", {"quality": 80, "method": 6}),
+}
+
+PASTA_DERIVADOS = "poema/derivados"
+
+
+def nome_derivado(nome, largura, extensao):
+    """
+    Nome (relativo a MEDIA_ROOT) de uma derivada.
+    Ex.: 'poema/canto_1/2.jpg' → 'poema/derivados/canto_1/2-320.webp'
+    """
+    origem = PurePosixPath(nome)
+    relativo = origem.relative_to("poema") if origem.parts[0] == "poema" else origem
+    return str(
+        PurePosixPath(PASTA_DERIVADOS) / relativo.parent
+        / f"{origem.stem}-{largura}.{extensao}"
+    )
+
+
+def gerar_derivados(raiz_media, nome, larguras=LARGURAS_DERIVADAS):
+    """
+    Grava as derivadas de uma imagem em todas as larguras e formatos.
+    Trabalha só com caminhos, para poder rodar em outro processo.
+    Retorna ((largura, altura) do original, larguras geradas).
+    """
+    raiz_media = Path(raiz_media)
+
+    with Image.open(raiz_media / nome) as original:
+        original = ImageOps.exif_transpose(original).convert("RGB")
+        largura_original, altura_original = original.size
+
+        geradas = []
+        for largura in sorted(larguras):
+            if largura >= largura_original:
+                break
+
+            altura = round(altura_original * largura / largura_original)
+            reduzida = original.resize((largura, altura), Image.Resampling.LANCZOS)
+
+            for extensao, (formato, opcoes) in FORMATOS_DERIVADOS.items():
+                destino = raiz_media / nome_derivado(nome, largura, extensao)
+                destino.parent.mkdir(parents=True, exist_ok=True)
+                reduzida.save(destino, formato, **opcoes)
+
+            geradas.append(largura)
+
+    return (largura_original, altura_original), geradas
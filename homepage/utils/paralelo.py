@@ -0,0 +1,37 @@
+from concurrent.futures import ProcessPoolExecutor
+
+
+def _executar(tarefa):
+    funcao, chave, argumentos, erros = tarefa
+    try:
+        return chave, funcao(*argumentos), None
+    except erros as erro:
+        return chave, None, f"{type(erro).__name__}: {erro}"
+
+
+def mapear_em_processos(
+    funcao, itens, processos=None, inicializar=None, argumentos_inicializar=(),
+    lote=1, erros=(OSError,),
+):
+    """
+    Aplica funcao(*argumentos) a cada (chave, argumentos) num pool de
+    processos e produz (chave, resultado, erro) na ordem de entrada.
+    funcao precisa ser de nível de módulo e trabalhar só com caminhos.
+    `inicializar` roda uma vez em cada processo antes das tarefas, e
+    `lote` agrupa tarefas curtas para reduzir a troca de mensagens.
+    As exceções de `erros` viram o texto em erro, sem parar as outras
+    tarefas. processos=0 roda tudo no processo atual.
+    """
+    tarefas = ((funcao, chave, argumentos, erros) for chave, argumentos in itens)
+    if processos == 0:
+        if inicializar is not None:
+            inicializar(*argumentos_inicializar)
+        yield from map(_executar, tarefas)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=processos,
+        initializer=inicializar,
+        initargs=argumentos_inicializar,
+    ) as executor:
+        yield from executor.map(_executar, tarefas, chunksize=lote)
@@ -1,40 +1,232 @@
+import copy
+import re
+import threading
+
 from lxml import etree
 
+# Regras de conversão: tag TEI → (tag HTML, classe, limpar atributos)
+REGRAS_HTML = {
+    "lg": ("div", "estrofe", True),    # <lg> → <div class="estrofe">
+    "l": ("div", "verso", True),       # <l> → <div class="verso">
+    "lb": ("br", None, True),          # <lb> → <br>
+    "head": ("h3", None, False),       # <head> → <h3>
+}
+
+# parsers do lxml não devem ser compartilhados entre threads
+_local = threading.local()
+
+
+def _parser():
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = _local.parser = etree.XMLParser(remove_blank_text=True)
+    return parser
+
+
 def tei_para_html(tei_xml):
-    parser = etree.XMLParser(remove_blank_text=True)
-    root = etree.fromstring(tei_xml.encode(), parser=parser)
+    """
+    Converte TEI em HTML percorrendo a árvore uma única vez: remove o
+    namespace, localiza o <body> e aplica REGRAS_HTML no mesmo laço.
+    A saída é idêntica à da implementação anterior (congelada na
+    migração 0005).
+    """
+    root = etree.fromstring(tei_xml.encode(), parser=_parser())
+    body = None
+    # a implementação anterior apagava atributos só depois do cleanup_namespaces, então as
+    # declarações usadas por eles continuam na saída
+    prefixos = set()
 
-    # remover namespace
     for elem in root.iter():
-        if isinstance(elem.tag, str):
-            elem.tag = etree.QName(elem).localname
+        tag = elem.tag
+        if not isinstance(tag, str):
+            continue
+
+        # remover namespace
+        if tag[0] == "{":
+            tag = elem.tag = tag[tag.index("}") + 1:]
+
+        # a raiz nunca é convertida (como no findall(".//...") original)
+        if elem is root:
+            continue
+
+        if body is None and tag == "body":
+            body = elem
+            continue
 
-    etree.cleanup_namespaces(root)
+        regra = REGRAS_HTML.get(tag)
+        if regra is None:
+            continue
+
+        elem.tag, classe, limpar = regra
+        if limpar and elem.attrib:
+            for nome in elem.attrib:
+                if nome[0] == "{":
+                    uri = nome[1:nome.index("}")]
+                    prefixos.update(
+                        p for p, u in elem.nsmap.items() if u == uri and p
+                    )
+            elem.attrib.clear()
+        if classe:
+            elem.attrib["class"] = classe
+
+    etree.cleanup_namespaces(root, keep_ns_prefixes=prefixos or None)
 
     # 🎯 pegar apenas o corpo do texto
-    body = root.find(".//body")
     if body is not None:
         root = body
 
-    # <lg> → <div class="estrofe">
-    for lg in root.findall(".//lg"):
-        lg.tag = "div"
-        lg.attrib.clear()
-        lg.attrib["class"] = "estrofe"
+    return etree.tostring(root, encoding="unicode", method="html")
 
-    # <l> → <div class="verso">
-    for l in root.findall(".//l"):
-        l.tag = "div"
-        l.attrib.clear()
-        l.attrib["class"] = "verso"
 
-    # <lb> → <br>
-    for lb in root.findall(".//lb"):
-        lb.tag = "br"
-        lb.attrib.clear()
+# -----------------------
+# TEXTO E TOKENS DOS VERSOS
+# -----------------------
 
-    # <head> → <h3>
-    for head in root.findall(".//head"):
-        head.tag = "h3"
+# pontuação tratada como token próprio quando o verso não tem <w>/<pc>
+PONTUACAO = ".,:;?!"
+_RE_TOKEN = re.compile(rf"([{PONTUACAO}])|([^\s{PONTUACAO}]+)")
 
-    return etree.tostring(root, encoding="unicode", method="html")
+
+def _juntar_texto(elem, partes):
+    for filho in elem:
+        if isinstance(filho.tag, str):
+            if etree.QName(filho).localname == "lb" and filho.get("break") == "no":
+                partes[:] = ["".join(partes).rstrip().rstrip("-")]
+            else:
+                partes.append(filho.text or "")
+                _juntar_texto(filho, partes)
+        partes.append(filho.tail or "")
+
+
+def texto_do_verso(l):
+    """
+    Texto corrido de um <l>, juntando as palavras partidas por
+    <lb break="no"/> (ex.: 'ba-<lb break="no"/>rões' → 'barões').
+    """
+    partes = [l.text or ""]
+    _juntar_texto(l, partes)
+    return re.sub(r"\s+", " ", "".join(partes)).strip()
+
+
+def tokens_do_verso(l):
+    """
+    Tokens de um <l> como (tipo, forma, lema, pos, msd, espaço depois).
+    Usa os <w>/<pc> do TEI etiquetado; sem eles, separa o texto corrido.
+    """
+    marcados = list(l.iter("{*}w", "{*}pc"))
+    if marcados:
+        return [
+            (
+                etree.QName(elem).localname,
+                elem.text or "",
+                elem.get("lemma", ""),
+                elem.get("pos", ""),
+                elem.get("msd", ""),
+                " " if elem.tail and elem.tail[0].isspace() else "",
+            )
+            for elem in marcados
+        ]
+
+    texto = texto_do_verso(l)
+    tokens = []
+    for match in _RE_TOKEN.finditer(texto):
+        espaco = " " if texto[match.end():match.end() + 1] == " " else ""
+        tipo = "pc" if match.group(1) else "w"
+        tokens.append((tipo, match.group(0), "", "", "", espaco))
+    return tokens
+
+
+def extrair_estrofes(tei_xml):
+    """
+    Estrutura de estrofes, versos e tokens de um TEI, só com tipos simples:
+    [(n da estrofe ou None, [(texto do verso, tokens), ...]), ...]
+    """
+    # sem remove_blank_text: os espaços entre <w> separam as palavras
+    root = etree.fromstring(tei_xml.encode())
+
+    estrofes = []
+    for lg in root.iter("{*}lg"):
+        n = lg.get("n", "")
+        versos = [
+            (texto_do_verso(l), tokens_do_verso(l))
+            for l in lg.iterchildren("{*}l")
+        ]
+        estrofes.append((int(n) if n.isdigit() else None, versos))
+    return estrofes
+
+
+
+# -----------------------
+# DIVISÃO DE UM TESTEMUNHO EM PÁGINAS
+# -----------------------
+
+TEI_NS = "http://www.tei-c.org/ns/1.0"
+
+# elementos da paginação do impresso (cabeçalho, reclamo, assinatura), que
+# não entram no texto das páginas
+FORA_DO_TEXTO = {"fw"}
+
+
+def _pagina_tei(elementos):
+    raiz = etree.Element(f"{{{TEI_NS}}}TEI", nsmap={None: TEI_NS})
+    corpo = etree.SubElement(etree.SubElement(raiz, f"{{{TEI_NS}}}text"), f"{{{TEI_NS}}}body")
+    corpo.extend(elementos)
+    return etree.tostring(raiz, encoding="unicode")
+
+
+def paginas_do_testemunho(arquivo):
+    """
+    Divide um testemunho TEI completo (ex.: LusiadasTextos/LusiadasDireita.xml)
+    nos <pb/> de cada <div type="canto"> e gera (canto, página, tei_xml) em
+    ordem. As páginas são numeradas a partir de 1 dentro de cada canto, e
+    as que só têm <fw> são puladas; um canto sem <pb/> vira uma página só.
+    Um canto sem número, ou repetido, recebe a sua posição no arquivo.
+
+    O arquivo é lido com iterparse e cada filho do canto é liberado depois
+    de copiado, então a memória fica limitada a uma página.
+    """
+    cantos_vistos = set()
+    posicao = 0
+    div_canto = None
+    canto = pagina = 0
+    elementos = []
+
+    for evento, elem in etree.iterparse(
+        arquivo, events=("start", "end"), remove_blank_text=True
+    ):
+        if not isinstance(elem.tag, str):
+            continue
+        nome = etree.QName(elem).localname
+
+        if evento == "start":
+            if div_canto is None and nome == "div" and elem.get("type") == "canto":
+                posicao += 1
+                n = elem.get("n", "")
+                canto = int(n) if n.isdigit() and int(n) not in cantos_vistos else posicao
+                cantos_vistos.add(canto)
+                div_canto, pagina, elementos = elem, 0, []
+            continue
+
+        if div_canto is not None and elem.getparent() is div_canto:
+            if nome == "pb":
+                if elementos:
+                    pagina += 1
+                    yield canto, pagina, _pagina_tei(elementos)
+                elementos = []
+            elif nome not in FORA_DO_TEXTO:
+                copia = copy.deepcopy(elem)
+                copia.tail = None
+                elementos.append(copia)
+        elif elem is div_canto:
+            if elementos:
+                yield canto, pagina + 1, _pagina_tei(elementos)
+            div_canto, elementos = None, []
+        elif div_canto is not None:
+            # dentro de um filho do canto: liberado junto com ele
+            continue
+
+        elem.clear(keep_tail=True)
+        pai = elem.getparent()
+        if pai is not None:
+            while elem.getprevious() is not None:
+                del pai[0]
@@ -0,0 +1,98 @@
+import hashlib
+import math
+import shutil
+from pathlib import Path, PurePosixPath
+
+from PIL import Image, ImageOps
+
+# Pirâmide no formato Deep Zoom (DZI), lida por visualizadores como o OpenSeadragon
+TAMANHO_TILE = 254
+SOBREPOSICAO = 1
+FORMATO_TILE = "jpg"
+QUALIDADE_TILE = 85
+
+PASTA_TILES = "poema/tiles"
+
+DESCRITOR_DZI = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+    'Format="{formato}" Overlap="{sobreposicao}" TileSize="{tamanho}">'
+    '<Size Width="{largura}" Height="{altura}"/></Image>\n'
+)
+
+
+def pasta_tiles(canto, pagina):
+    """Pasta (relativa a MEDIA_ROOT) com a pirâmide de uma página."""
+    return str(PurePosixPath(PASTA_TILES) / f"canto_{canto}" / str(pagina))
+
+
+def hash_arquivo(caminho):
+    digest = hashlib.sha256()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(1 << 16), b""):
+            digest.update(bloco)
+    return digest.hexdigest()
+
+
+def _cortar_nivel(imagem, destino):
+    destino.mkdir(parents=True, exist_ok=True)
+    largura, altura = imagem.size
+
+    for coluna in range(math.ceil(largura / TAMANHO_TILE)):
+        for linha in range(math.ceil(altura / TAMANHO_TILE)):
+            x = coluna * TAMANHO_TILE
+            y = linha * TAMANHO_TILE
+            caixa = (
+                max(x - SOBREPOSICAO, 0),
+                max(y - SOBREPOSICAO, 0),
+                min(x + TAMANHO_TILE + SOBREPOSICAO, largura),
+                min(y + TAMANHO_TILE + SOBREPOSICAO, altura),
+            )
+            imagem.crop(caixa).save(
+                destino / f"{coluna}_{linha}.{FORMATO_TILE}",
+                "JPEG",
+                quality=QUALIDADE_TILE,
+            )
+
+
+def gerar_piramide(raiz_media, nome, canto, pagina):
+    """
+    Gera imagem.dzi e imagem_files/<nível>/<coluna>_<linha>.jpg para uma
+    página, apagando a pirâmide anterior. Trabalha só com caminhos, para
+    poder rodar em outro processo. Retorna o hash do arquivo de origem.
+    """
+    raiz_media = Path(raiz_media)
+    origem = raiz_media / nome
+    destino = raiz_media / pasta_tiles(canto, pagina)
+
+    with Image.open(origem) as imagem:
+        imagem = ImageOps.exif_transpose(imagem).convert("RGB")
+        largura, altura = imagem.size
+
+        if destino.exists():
+            shutil.rmtree(destino)
+        pasta_niveis = destino / "imagem_files"
+
+        # nível máximo = resolução original; cada nível abaixo tem metade
+        nivel_maximo = math.ceil(math.log2(max(largura, altura)))
+        for nivel in range(nivel_maximo, -1, -1):
+            escala = 2 ** (nivel_maximo - nivel)
+            tamanho = (
+                max(math.ceil(largura / escala), 1),
+                max(math.ceil(altura / escala), 1),
+            )
+            if imagem.size != tamanho:
+                imagem = imagem.resize(tamanho, Image.Resampling.LANCZOS)
+            _cortar_nivel(imagem, pasta_niveis / str(nivel))
+
+    (destino / "imagem.dzi").write_text(
+        DESCRITOR_DZI.format(
+            formato=FORMATO_TILE,
+            sobreposicao=SOBREPOSICAO,
+            tamanho=TAMANHO_TILE,
+            largura=largura,
+            altura=altura,
+        ),
+        encoding="utf-8",
+    )
+    return hash_arquivo(origem)
@@ -1,8 +1,13 @@
-from .models import Canto, PaginaImagem, PaginaTexto
+from . import busca as busca_fts
+from .consultas import buscar_leitura, colunas
+from django.conf import settings
+from django.core.paginator import Paginator
 from django.shortcuts import render
 from django.http import HttpResponse
 from django.template import loader
-from .utils.tei import tei_para_html
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from .utils import aparato as aparato_critico
 
 # -----------------------
 # PÁGINAS
@@ -25,22 +30,52 @@ def autor(request):
 # -----------------------
 
 
-def canto(request, canto):
-    pagina_num = int(request.GET.get("p", 1))
+def _numero_pagina(request, pagina=None):
+    # a página pode vir na URL (leitura_paginada) ou em ?p=
+    if pagina is not None:
+        return pagina
+    return int(request.GET.get("p", 1))
+
+
+def _leitura(request, canto, conteudo=None, coluna=None, pagina=None):
+    """
+    Busca os dados da página uma única vez por requisição: o ETag e o
+    Last-Modified são calculados a partir deles e a view os reaproveita.
+    """
+    if not hasattr(request, "leitura"):
+        versoes = colunas(conteudo, coluna) if conteudo else ()
+        request.leitura = buscar_leitura(
+            canto, _numero_pagina(request, pagina), versoes=versoes
+        )
+    return request.leitura
+
+
+def _etag(request, *args, **kwargs):
+    return _leitura(request, *args, **kwargs).etag
+
+
+def _ultima_modificacao(request, *args, **kwargs):
+    return _leitura(request, *args, **kwargs).ultima_modificacao
+
 
-    paginas = PaginaImagem.objects.filter(
-        canto__numero=canto
-    ).order_by("numero")
+# páginas estáveis: validadores para 304 e cache liberado para proxies
+cache_publico = cache_control(public=True, max_age=settings.LEITURA_CACHE_MAX_AGE)
+validadores = condition(etag_func=_etag, last_modified_func=_ultima_modificacao)
 
-    pagina = paginas.filter(numero=pagina_num).first()
+
+@cache_publico
+@validadores
+def canto(request, canto):
+    leitura = _leitura(request, canto)
+    esq, dir = colunas()
 
     contexto = {
         "canto": canto,
-        "esq": "modernizado",
-        "dir": "original",
-        "pagina": pagina,          # objeto
-        "pagina_num": pagina_num,  # número
-        "paginas": paginas,
+        "esq": esq,
+        "dir": dir,
+        "pagina": leitura.imagem,          # objeto
+        "pagina_num": leitura.pagina_num,  # número
+        "paginas": leitura.paginas,
     }
 
     return render(request, "poema/canto.html", contexto)
@@ -49,14 +84,14 @@ def canto(request, canto):
 # -----------------------
 # Página inicial de CANTO
 # -----------------------
+@cache_publico
+@validadores
 def canto_index(request, canto):
-    paginas = PaginaImagem.objects.filter(
-        canto__numero=canto
-    ).order_by("numero")
+    leitura = _leitura(request, canto)
 
     return render(request, "poema/canto_index.html", {
         "canto": canto,
-        "paginas": paginas
+        "paginas": leitura.paginas
     })
 
 
@@ -65,47 +100,26 @@ def canto_index(request, canto):
 # LEITURA
 # -----------------------
 
+@cache_publico
+@validadores
 def leitura(request, canto, conteudo, coluna, pagina=None):
-    print("ENTROU NA LEITURA")
-    esq = "modernizado"
-    dir = "original"
-
-    if coluna == "esq":
-        esq = conteudo
-    elif coluna == "dir":
-        dir = conteudo
-
-    pagina_num = int(request.GET.get("p", 1))
-
-    imagem = PaginaImagem.objects.filter(
-        canto__numero=canto,
-        numero=pagina_num
-    ).first()
-
-    texto_esq = PaginaTexto.objects.filter(
-        canto__numero=canto,
-        numero=pagina_num,
-        versao=esq
-    ).first()
+    esq, dir = colunas(conteudo, coluna)
 
-    texto_dir = PaginaTexto.objects.filter(
-        canto__numero=canto,
-        numero=pagina_num,
-        versao=dir
-    ).first()
+    # imagem, lista de páginas e as duas versões do texto em 2 consultas
+    leitura = _leitura(request, canto, conteudo, coluna, pagina)
 
-    html_esq = tei_para_html(texto_esq.tei_xml) if texto_esq else ""
-    html_dir = tei_para_html(texto_dir.tei_xml) if texto_dir else ""
+    texto_esq = leitura.texto(esq)
+    texto_dir = leitura.texto(dir)
 
-    paginas = PaginaImagem.objects.filter(
-        canto__numero=canto
-    ).order_by("numero")
+    # HTML já convertido e guardado no momento em que o TEI foi salvo
+    html_esq = texto_esq.html_renderizado if texto_esq else ""
+    html_dir = texto_dir.html_renderizado if texto_dir else ""
 
     contexto = {
         "canto": canto,
-        "pagina_num": pagina_num,
-        "imagem": imagem,
-        "paginas": paginas,
+        "pagina_num": leitura.pagina_num,
+        "imagem": leitura.imagem,
+        "paginas": leitura.paginas,
         "esq": esq,
         "dir": dir,
         "html_esq": html_esq,
@@ -115,3 +129,70 @@ def leitura(request, canto, conteudo, coluna, pagina=None):
     return render(request, "poema/canto.html", contexto)
 
 
+# -----------------------
+# BUSCA
+# -----------------------
+
+def busca(request):
+    termos = request.GET.get("q", "").strip()
+    campo = request.GET.get("campo", "texto")
+
+    resultados = busca_fts.buscar(termos, campo)
+    pagina = Paginator(resultados, 20).get_page(request.GET.get("pagina"))
+
+    return render(request, "busca.html", {
+        "termos": termos,
+        "campo": campo,
+        "campos": busca_fts.CAMPOS,
+        "pagina": pagina,
+    })
+
+
+# -----------------------
+# APARATO CRÍTICO
+# -----------------------
+
+def _inteiro(valor):
+    return int(valor) if valor and valor.isdigit() else None
+
+
+def aparato(request):
+    filtros = {
+        "a": request.GET.get("a", ""),
+        "b": request.GET.get("b", ""),
+        "lema": request.GET.get("lema", "").strip(),
+        "pos": request.GET.get("pos", "").strip(),
+        "canto": _inteiro(request.GET.get("canto")),
+    }
+    contexto = {"filtros": filtros}
+
+    try:
+        indice = aparato_critico.carregar(settings.APARATO_XML)
+    except OSError:
+        contexto["erro"] = "A colação ainda não foi gerada."
+        return render(request, "aparato.html", contexto, status=503)
+
+    # só uma testemunha, ou a mesma duas vezes, é erro como uma desconhecida
+    divergentes = None
+    if filtros["a"] or filtros["b"]:
+        divergentes = filtros["a"], filtros["b"]
+    try:
+        resultados = indice.consultar(
+            divergentes, filtros["lema"], filtros["pos"], filtros["canto"]
+        )
+    except ValueError as erro:
+        contexto["erro"] = str(erro)
+        resultados = []
+
+    pagina = Paginator(resultados, 50).get_page(request.GET.get("pagina"))
+    consulta = request.GET.copy()
+    consulta.pop("pagina", None)
+
+    contexto.update({
+        "testemunhas": indice.testemunhas,
+        "pagina": pagina,
+        "entradas": [indice.entrada(i) for i in pagina],
+        "densidade": indice.densidade(filtros["canto"])[:10],
+        "consulta": consulta.urlencode(),
+    })
+    return render(request, "aparato.html", contexto)
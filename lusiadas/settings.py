@@ -125,3 +125,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Arquivos de mídia para o Django Admin
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+
+# Cache HTTP das páginas de leitura (ETag/Last-Modified + Cache-Control)
+LEITURA_CACHE_MAX_AGE = 300
+# Altere ao mudar os templates de leitura, para invalidar os ETags antigos
+LEITURA_ETAG_VERSAO = "1"
+
+# Pasta gerada pelo comando exportar_estatico (site para CDN)
+EXPORTACAO_ESTATICA_DIR = BASE_DIR / "site_estatico"
+
+# Colação com o aparato crítico (<app>/<rdg>) consultado na página do aparato
+APARATO_XML = BASE_DIR / "LusiadasTextos" / "lus_collated_full.xml"